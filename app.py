@@ -13,5 +13,6 @@ EthereumContractEventsStack(app,
                                 'CryptoPunks': '0xb47e3cd837dDF8e4c57F05d70Ab865de6e193BBB',
                                 'MeeBits': '0x7Bd29408f11D2bFC23c34f18275bBf23bB716Bc7',
                                 'MutantApeYachtClub': '0x60E4d786628Fea6478F785A6d7e704777c86a7c6'
-                            })
+                            },
+                            contracts_per_task=10)
 app.synth()
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from eth_utils import event_abi_to_log_topic
+from web3 import Web3
+
+# EIP-1967 logic contract slot, bytes32(uint256(keccak256('eip1967.proxy.implementation')) - 1)
+IMPLEMENTATION_SLOT = 0x360894a13ba1a3210667c828492db98dca3e2076cc3735a920a3ca505d382bbc
+# EIP-1967 beacon contract slot, bytes32(uint256(keccak256('eip1967.proxy.beacon')) - 1)
+BEACON_SLOT = 0xa3f0ad74e5423aebfd80d3ef4346578335a9a72aeaee59ff6cb3582b35133d50
+# EIP-1822 logic contract slot, keccak256('PROXIABLE')
+PROXIABLE_SLOT = 0xc5f16f0fcc639fa48a6947836d9850f504798523bf8c9a3a87d5876cf622bcf7
+# The selector of the beacon's implementation() function
+IMPLEMENTATION_SELECTOR = '0x5c60da1b'
+
+UPGRADED_EVENT_ABI = {
+    'type': 'event', 'name': 'Upgraded', 'anonymous': False,
+    'inputs': [{'indexed': True, 'name': 'implementation', 'type': 'address'}]}
+BEACON_UPGRADED_EVENT_ABI = {
+    'type': 'event', 'name': 'BeaconUpgraded', 'anonymous': False,
+    'inputs': [{'indexed': True, 'name': 'beacon', 'type': 'address'}]}
+UPGRADE_TOPICS = {event_abi_to_log_topic(UPGRADED_EVENT_ABI), event_abi_to_log_topic(BEACON_UPGRADED_EVENT_ABI)}
+
+
+def _abi_signature(entry):
+    """The identity of an ABI entry, regardless of argument names"""
+    return (entry['type'], entry.get('name'), tuple(i['type'] for i in entry.get('inputs', [])))
+
+
+def merge_abis(proxy_abi, implementation_abi):
+    """Merge an implementation ABI into its proxy's ABI
+
+    Parameters
+    ----------
+    proxy_abi : list
+        The ABI of the proxy contract
+    implementation_abi : list
+        The ABI of the contract the proxy delegates to
+
+    Returns
+    -------
+    list
+        The proxy ABI followed by the implementation entries it does not
+        already define
+    """
+    signatures = {_abi_signature(entry) for entry in proxy_abi}
+    return proxy_abi + [entry for entry in implementation_abi if _abi_signature(entry) not in signatures]
+
+
+def _slot_address(value):
+    """The address stored in a storage slot, or None if the slot is empty"""
+    value = bytes(value)[-20:]
+    if not any(value):
+        return None
+    return Web3.toChecksumAddress(value)
+
+
+def abi_hash(abi):
+    """The SHA-256 hash of an ABI's canonical JSON encoding"""
+    return hashlib.sha256(json.dumps(abi, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+class AbiRegistry():
+
+    def __init__(self, abi_dir=None, cache_path=None):
+        """Initialise an AbiRegistry, which serves contract ABIs from local
+        files so that startup does not depend on Etherscan
+
+        Parameters
+        ----------
+        abi_dir : str, optional
+            A directory of bundled ABIs named <address>.json, holding either
+            the ABI or an object with an 'abi' key such as a build artifact
+        cache_path : str, optional
+            A JSON file of ABIs keyed by address, each with the hash of its
+            content. ABIs fetched from Etherscan are written back to it.
+        """
+        self.abi_dir = abi_dir
+        self.cache_path = cache_path
+        self.files = {}
+        if abi_dir and os.path.isdir(abi_dir):
+            self.files = {name[:-len('.json')].lower(): os.path.join(abi_dir, name)
+                          for name in os.listdir(abi_dir) if name.endswith('.json')}
+        self.cache = {}
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path) as f:
+                self.cache = json.load(f)
+
+    def get(self, address):
+        """Look up a contract ABI in the bundled directory, then the cache
+
+        Parameters
+        ----------
+        address : str
+            The contract address
+
+        Returns
+        -------
+        list
+            The ABI, or None if not held locally. Cached ABIs whose content
+            does not match their hash are ignored.
+        """
+        path = self.files.get(address.lower())
+        if path is not None:
+            with open(path) as f:
+                abi = json.load(f)
+            return abi['abi'] if isinstance(abi, dict) else abi
+        entry = self.cache.get(address.lower())
+        if entry is not None and abi_hash(entry['abi']) == entry['hash']:
+            return entry['abi']
+        return None
+
+    def put(self, address, abi):
+        """Write a fetched ABI back to the cache file, replacing it
+        atomically so a crash cannot leave it truncated
+
+        Parameters
+        ----------
+        address : str
+            The contract address
+        abi : list
+            The contract ABI
+        """
+        self.cache[address.lower()] = {'abi': abi, 'hash': abi_hash(abi)}
+        if not self.cache_path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as f:
+            json.dump(self.cache, f)
+        os.replace(f.name, self.cache_path)
+
+
+class AbiResolver():
+
+    def __init__(self, w3, session, registry=None):
+        """Initialise an AbiResolver, which looks up contract ABIs locally or
+        from Etherscan and resolves EIP-1967 and EIP-1822 proxies to the ABI of
+        their implementation
+
+        Parameters
+        ----------
+        w3 : Web3
+            The connection used to read proxy storage slots
+        session : requests.Session
+            The HTTP session used for Etherscan lookups
+        registry : AbiRegistry, optional
+            Local ABIs consulted before Etherscan, and updated with the ABIs
+            fetched from it
+        """
+        self.w3 = w3
+        self.session = session
+        self.registry = registry
+        self.abis = {}
+
+    def fetch_abi(self, address):
+        """Look up the ABI of a contract in the registry, or on Etherscan on
+        a miss, at most once per address
+
+        Parameters
+        ----------
+        address : str
+            The checksummed contract address
+
+        Returns
+        -------
+        list
+            The contract ABI
+        """
+        if address in self.abis:
+            return self.abis[address]
+        abi = self.registry.get(address) if self.registry is not None else None
+        if abi is None:
+            abi_url = 'https://api.etherscan.io/api?module=contract&action=getabi&address={}'.format(address)
+            abi_result = self.session.get(abi_url).json()
+            abi = json.loads(abi_result['result'])
+            logging.info(json.dumps({"abi_fetched": address}))
+            if self.registry is not None:
+                self.registry.put(address, abi)
+        self.abis[address] = abi
+        return abi
+
+    def implementation_address(self, address):
+        """Read the implementation a proxy delegates to from its storage
+
+        Parameters
+        ----------
+        address : str
+            The checksummed contract address
+
+        Returns
+        -------
+        str
+            The checksummed implementation address, or None if the contract
+            is not an EIP-1967 or EIP-1822 proxy
+        """
+        implementation = _slot_address(self.w3.eth.getStorageAt(address, IMPLEMENTATION_SLOT))
+        if implementation is not None:
+            return implementation
+        beacon = _slot_address(self.w3.eth.getStorageAt(address, BEACON_SLOT))
+        if beacon is not None:
+            return _slot_address(self.w3.eth.call({'to': beacon, 'data': IMPLEMENTATION_SELECTOR}))
+        return _slot_address(self.w3.eth.getStorageAt(address, PROXIABLE_SLOT))
+
+    def resolve(self, address, implementation=None):
+        """Resolve the ABI of a contract, merged with its implementation's
+        if it is a proxy. Implementation ABIs are fetched once and shared by
+        all proxies of the same implementation.
+
+        Parameters
+        ----------
+        address : str
+            The checksummed contract address
+        implementation : str, optional
+            The implementation address, if already read from the proxy
+
+        Returns
+        -------
+        tuple
+            The ABI, and the implementation address or None
+        """
+        abi = self.fetch_abi(address)
+        if implementation is None:
+            implementation = self.implementation_address(address)
+        if implementation is None:
+            return abi, None
+        logging.info(json.dumps({"proxy": address, "implementation": implementation}))
+        return merge_abis(abi, self.fetch_abi(implementation)), implementation
@@ -1,138 +1,1091 @@
 # import the following dependencies
+import argparse
+import collections
 import json
-import boto3
+from botocore.config import Config
 import os
 import requests
+import time
 from web3 import Web3
+from eth_utils import event_abi_to_log_topic
+from web3._utils.events import construct_event_topic_set
 import asyncio
+import functools
 import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from subscriptions import LogSubscriber
+from backfill import Backfiller
+from checkpoints import create_checkpoint_store
+from reorg import ConfirmationBuffer
+from rpc import BatchingHTTPProvider, format_block_header
+from sessions import create_session, session_stats
+from providers import ProviderPool
+from scheduler import HeadScheduler
+from bloom import LogsBloomFilter
+from abis import AbiRegistry, AbiResolver, UPGRADE_TOPICS
+from decoders import DecoderTable
+from records import EventRecord
+from serialization import dumps, to_detail
+from publisher import BatchPublisher, DeadLetterFile, FanOutPublisher
+from sinks import create_sink
+from spool import Spool
 
 
 class EthereumContractNotifier():
 
     def __init__(self,
-                 node_url,
-                 contract_address,
-                 poll_interval=10):
+                 node_urls,
+                 contract_addresses,
+                 poll_interval=10,
+                 poll_mode='logs',
+                 ws_url=None,
+                 checkpoint_store=None,
+                 confirmations=0,
+                 fast_retract=False,
+                 rpc_batch_size=100,
+                 max_concurrency=8,
+                 call_timeout=30,
+                 http_pool_size=16,
+                 http_timeout=10,
+                 stats_interval=60,
+                 bloom_filter=True,
+                 bloom_max_blocks=100,
+                 event_selections=None,
+                 abi_registry=None,
+                 publish_linger=0.05,
+                 publish_workers=4,
+                 publish_queue_size=10000,
+                 publish_max_attempts=8,
+                 dead_letter_path=None,
+                 spool=None,
+                 spool_drain_timeout=60,
+                 sink_urls=('eventbridge://ethereum_contract_events',)):
         """Initialise an EthereumContractNotifier
 
         Parameters
         ----------
-        node_url : str
-            The URL of the Web3 node
-        contract_address : str
-            The address of the contract to monitor
+        node_urls : list<str>
+            The URLs of the Web3 nodes. With several nodes, each request is
+            routed to the best performing node, with failover and hedged
+            log queries.
+        contract_addresses : list<str>
+            The addresses of the contracts to monitor. All contracts share
+            the node connection, head tracking and eth_getLogs queries.
         poll_interval : int, optional
-            The number of seconds to wait between polling for event changes
+            The longest number of seconds to wait between checks of the
+            chain head for new blocks
+        poll_mode : str, optional
+            'logs' to issue a single eth_getLogs per block range for all
+            contract events (default), 'filters' to poll one node-side
+            filter per ABI event, or 'websocket' to have the node push logs
+            over an eth_subscribe connection
+        ws_url : str, optional
+            The WebSocket URL of the Web3 node, required for 'websocket' mode
+        checkpoint_store : checkpoints.CheckpointStore, optional
+            The store recording the last published block and log index per
+            contract, used to resume without gaps after a restart
+        confirmations : int, optional
+            The number of blocks an event must be buried under before it is
+            published. Events from blocks orphaned by a reorg in the
+            meantime are dropped. 0 publishes events immediately (default).
+        fast_retract : bool, optional
+            With confirmations, publish events immediately and publish a
+            retraction for any event orphaned by a reorg before it is
+            confirmed
+        rpc_batch_size : int, optional
+            The maximum number of JSON-RPC requests sent to the node in one
+            batch. 1 disables batching.
+        max_concurrency : int, optional
+            The maximum number of node calls in flight at once
+        call_timeout : int, optional
+            The number of seconds before a read-only node call made from the
+            polling loop is abandoned. Calls that dispatch events are always
+            waited for.
+        http_pool_size : int, optional
+            The maximum number of keep-alive connections kept open to each
+            host (node, Etherscan and EventBridge)
+        http_timeout : int, optional
+            The default number of seconds to wait for an HTTP connection or
+            response
+        stats_interval : int, optional
+            The number of seconds between connection pool statistics log
+            messages
+        bloom_filter : bool, optional
+            Fetch the headers of new blocks and only query logs for blocks
+            whose logsBloom may hold a watched event
+        bloom_max_blocks : int, optional
+            The largest number of new blocks checked against their blooms;
+            longer ranges are queried for logs directly
+        event_selections : dict, optional
+            Contract addresses to the events to watch on that contract, as a
+            dict of event names to indexed argument filters, e.g.
+            {'Transfer': {'to': ['0x...', '0x...']}}. An argument filter
+            value may be a single value or a list of alternatives. Contracts
+            not listed watch every ABI-defined event.
+        abi_registry : abis.AbiRegistry, optional
+            Local contract ABIs, so that startup only looks up ABIs missing
+            from it on Etherscan
+        publish_linger : float, optional
+            The longest number of seconds an event waits for others to fill
+            its PutEvents batch
+        publish_workers : int, optional
+            The number of workers putting batches onto the event bus
+        publish_queue_size : int, optional
+            The most events queued for publishing. Polling pauses while the
+            queue is half full, and ingestion blocks while it is full.
+        publish_max_attempts : int, optional
+            The most PutEvents attempts for an event failing with throttling
+            or a transient error before it is dead-lettered
+        dead_letter_path : str, optional
+            A JSON lines file recording the events that could not be
+            published, so they can be re-driven
+        spool : spool.Spool, optional
+            A write-ahead log events are written to before publishing. Events
+            are checkpointed once spooled and published from the spool, so
+            polling continues at full speed through an event bus outage and
+            the backlog drains when it recovers. Throttling and transient
+            errors are then retried indefinitely rather than dead-lettered.
+        spool_drain_timeout : float, optional
+            The longest number of seconds close waits for the spool to drain
+            before leaving the remaining events for the next run
+        sink_urls : list<str>, optional
+            The URLs of the sinks every event is published to, as accepted by
+            sinks.create_sink. Each sink batches and retries independently
+            with its own publish workers and queue.
         """
-        self.contract_address = contract_address
-        self.node_url = node_url
+        if poll_mode not in ('logs', 'filters', 'websocket'):
+            raise ValueError("poll_mode must be 'logs', 'filters' or 'websocket', not {!r}".format(poll_mode))
+        if poll_mode == 'websocket' and not ws_url:
+            raise ValueError("ws_url is required for poll_mode 'websocket'")
+        self.contract_addresses = [Web3.toChecksumAddress(address) for address in contract_addresses]
+        self.node_urls = node_urls
         self.poll_interval = poll_interval
+        self.poll_mode = poll_mode
+        self.ws_url = ws_url
+        self.rpc_batch_size = rpc_batch_size
+        self.max_concurrency = max_concurrency
+        self.call_timeout = call_timeout
+        self.http_pool_size = http_pool_size
+        self.http_timeout = http_timeout
+        self.stats_interval = stats_interval
+        self.publish_linger = publish_linger
+        self.publish_workers = publish_workers
+        self.publish_queue_size = publish_queue_size
+        self.publish_max_attempts = publish_max_attempts
+        self.dead_letters = DeadLetterFile(dead_letter_path) if dead_letter_path else None
+        self.spool = spool
+        self.spool_drain_timeout = spool_drain_timeout
+        self.sink_urls = list(sink_urls)
+        self.bloom_filter = bloom_filter
+        self.bloom_max_blocks = bloom_max_blocks
+        self.abi_registry = abi_registry
+        self.event_selections = {Web3.toChecksumAddress(address): selection
+                                 for address, selection in (event_selections or {}).items()}
+        self._call_executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._call_semaphore = None
+        self._published = collections.deque()
+        self.checkpoint_store = checkpoint_store
+        self.confirmation_buffer = None
+        if confirmations > 0 or fast_retract:
+            self.confirmation_buffer = ConfirmationBuffer(self, confirmations, fast_retract)
         
         self._setup_connection()
-        self._setup_contract()
-        self._setup_filters()
-        self._setup_event_bus()
+        self._setup_contracts()
+        self._setup_topics()
+        if self.poll_mode == 'filters':
+            self._setup_filters()
+        else:
+            self.event_filters = {}
+        self.last_block = self.w3.eth.blockNumber
+        self._setup_checkpoints()
+        self._setup_sinks()
         logging.basicConfig(format='%(message)s', level=logging.INFO)
-        msg_data = {"contract_address": self.contract_address,
-                    "node_url": self.node_url,
+        msg_data = {"contract_addresses": self.contract_addresses,
+                    "node_urls": self.node_urls,
                     "is_connected": self.w3.isConnected(),
-                    "event_names": list(self.event_filters.keys())}
+                    "poll_mode": self.poll_mode,
+                    "resume_block": self.resume_block,
+                    "event_names": {address: list(event_topics.values())
+                                    for address, event_topics in self.event_topics.items()}}
         logging.info(json.dumps(msg_data))
 
     def _setup_connection(self):
         """
-        Initialise the Web3 provider
+        Initialise the pooled HTTP session shared by all node and Etherscan
+        calls, and the Web3 provider. Up to http_pool_size requests are sent
+        to each node concurrently; requests made while all are in flight
+        are sent together as JSON-RPC batches.
         """
-        self.w3 = Web3(Web3.HTTPProvider(self.node_url))
+        self.session = create_session(pool_size=self.http_pool_size, timeout=self.http_timeout)
+        providers = [BatchingHTTPProvider(node_url, max_batch_size=self.rpc_batch_size, session=self.session,
+                                          max_in_flight=self.http_pool_size)
+                     for node_url in self.node_urls]
+        if len(providers) == 1:
+            self.w3 = Web3(providers[0])
+        else:
+            self.w3 = Web3(ProviderPool(providers))
 
-    def _setup_contract(self):
+    def get_block_headers(self, block_numbers):
         """
-        Initialise the Web3 contract and ABI data from EtherScan
+        Fetch the headers of the given blocks in JSON-RPC batches
         """
-        abi_url = 'https://api.etherscan.io/api?module=contract&action=getabi&address={}'.format(self.contract_address)
-        abi_result = requests.get(abi_url).json()
-        self.contract_abi = json.loads(abi_result['result'])
-        self.contract = self.w3.eth.contract(address=self.contract_address, abi=self.contract_abi)
+        responses = self.w3.provider.make_batch_request(
+            [('eth_getBlockByNumber', [hex(block_number), False]) for block_number in block_numbers])
+        headers = []
+        for block_number, response in zip(block_numbers, responses):
+            if 'error' in response:
+                raise ValueError(response['error'])
+            if response.get('result') is None:
+                raise ValueError({'message': 'block not found', 'block_number': block_number})
+            headers.append(format_block_header(response['result']))
+        return headers
+
+    def _setup_contracts(self):
+        """
+        Initialise the Web3 contracts and ABI data from the ABI registry, or
+        EtherScan when missing from it, keyed by contract address. Proxy
+        contracts get the ABI of their implementation merged in.
+        """
+        self.abi_resolver = AbiResolver(self.w3, self.session, self.abi_registry)
+        self.contract_abis = {}
+        self.contracts = {}
+        self.implementations = {}
+        self.detected_upgrades = []
+        self.pending_upgrades = []
+        for contract_address in self.contract_addresses:
+            self._setup_contract(contract_address)
+
+    def _setup_contract(self, contract_address, implementation=None):
+        """
+        Resolve the ABI of a contract, through its implementation if it is
+        a proxy, and initialise its Web3 contract
+        """
+        contract_abi, implementation = self.abi_resolver.resolve(contract_address, implementation)
+        self.contract_abis[contract_address] = contract_abi
+        if implementation is not None:
+            self.implementations[contract_address] = implementation
+        self.contracts[contract_address] = self.w3.eth.contract(address=contract_address, abi=contract_abi)
+
+    def apply_upgrades(self):
+        """
+        Upgrade the proxies whose upgrade events have been dispatched. This
+        reads the node and possibly Etherscan, so it runs off the event
+        loop.
+        """
+        while self.detected_upgrades:
+            self.upgrade_contract(*self.detected_upgrades.pop(0))
+
+    def upgrade_contract(self, contract_address, block_number):
+        """
+        Re-read the implementation slot of a proxy after an upgrade event.
+        If the implementation changed, its ABI is merged in and events it
+        adds are watched, with their logs since the upgrade block fetched
+        when the current block range completes.
+        """
+        implementation = self.abi_resolver.implementation_address(contract_address)
+        if implementation is None or implementation == self.implementations.get(contract_address):
+            return
+        event_topics = self.event_topics[contract_address]
+        self._setup_contract(contract_address, implementation)
+        self._setup_topics()
+        new_topics = {topic: event_name for topic, event_name in self.event_topics[contract_address].items()
+                      if topic not in event_topics}
+        logging.info(json.dumps({"contract_upgraded": contract_address,
+                                 "implementation": implementation,
+                                 "block_number": block_number,
+                                 "new_events": sorted(new_topics.values())}))
+        if self.poll_mode == 'filters':
+            head = self.w3.eth.blockNumber
+            for event_name in new_topics.values():
+                self._create_filter(contract_address, event_name)
+                self.filter_blocks[(contract_address, event_name)] = head
+        elif new_topics:
+            self.pending_upgrades.append((contract_address, [Web3.toHex(topic) for topic in new_topics],
+                                          block_number))
     
+    def _setup_topics(self):
+        """
+        Map the topic0 hash of every watched event to its event name for
+        each contract, so that raw logs from a single eth_getLogs query can be
+        dispatched to the matching event decoder locally. Decoders are
+        compiled once here rather than resolving the event ABI for each log.
+        Anonymous events have no topic0 and cannot be matched this way.
+
+        Indexed argument filters are compiled into topic filters, and
+        filters on arguments that are not indexed are rejected. Events
+        sharing the same argument topic filters are queried together, so
+        without argument filters a single query covers every contract.
+        """
+        self.event_topics = {}
+        self.decoders = DecoderTable(self.w3.codec)
+        self.topic_filters = {}
+        query_groups = {}
+        for contract_address, contract_abi in self.contract_abis.items():
+            selection = self.event_selections.get(contract_address)
+            event_abis = [event_abi for event_abi in contract_abi
+                          if event_abi['type'] == 'event' and not event_abi.get('anonymous', False)
+                          and (selection is None or event_abi['name'] in selection)]
+            if selection is not None:
+                unknown = set(selection) - {event_abi['name'] for event_abi in event_abis}
+                if unknown:
+                    raise ValueError("Events {} not found in the ABI of {}".format(sorted(unknown), contract_address))
+            self.event_topics[contract_address] = {}
+            for event_abi in event_abis:
+                topic = event_abi_to_log_topic(event_abi)
+                self.event_topics[contract_address][topic] = event_abi['name']
+                self.decoders.add(contract_address, event_abi)
+                argument_filters = (selection or {}).get(event_abi['name']) or {}
+                unknown = set(argument_filters) - {argument['name'] for argument in event_abi['inputs']
+                                                   if argument['indexed']}
+                if unknown:
+                    raise ValueError("Arguments {} are not indexed arguments of {} in the ABI of {}".format(
+                        sorted(unknown), event_abi['name'], contract_address))
+                topic_set = construct_event_topic_set(event_abi, self.w3.codec, argument_filters)[1:]
+                topic_filter = tuple(None if values is None else tuple(sorted(values if isinstance(values, list)
+                                                                              else [values]))
+                                     for values in topic_set)
+                while topic_filter and topic_filter[-1] is None:
+                    topic_filter = topic_filter[:-1]
+                if topic_filter:
+                    self.topic_filters[(contract_address, topic)] = [
+                        None if values is None else {bytes(Web3.toBytes(hexstr=value)) for value in values}
+                        for values in topic_filter]
+                addresses, topics = query_groups.setdefault(topic_filter, (set(), set()))
+                addresses.add(contract_address)
+                topics.add(Web3.toHex(topic))
+        if self.implementations:
+            # Proxies are always watched for upgrades
+            addresses, topics = query_groups.setdefault((), (set(), set()))
+            addresses.update(self.implementations)
+            topics.update(Web3.toHex(topic) for topic in UPGRADE_TOPICS)
+        self.topics = sorted({topic for _, topics in query_groups.values() for topic in topics})
+        self.log_queries = [{'address': sorted(addresses),
+                             'topics': [sorted(topics)] + [None if values is None else list(values)
+                                                           for values in topic_filter]}
+                            for topic_filter, (addresses, topics) in query_groups.items()]
+        self.logs_bloom = LogsBloomFilter(self.contract_addresses, self.topics)
+
+    def _matches_topic_filters(self, contract_address, log):
+        """
+        Test a log against the indexed argument filters of its event. Logs
+        from queries shared with other events may not match them.
+        """
+        topic_filter = self.topic_filters.get((contract_address, bytes(log['topics'][0])))
+        if topic_filter is None:
+            return True
+        for position, values in enumerate(topic_filter, 1):
+            if values is not None and (position >= len(log['topics']) or bytes(log['topics'][position]) not in values):
+                return False
+        return True
+
     def _setup_filters(self):
         """
         Initialise the Web3 filters. A filter specific to an event name will be
-        create for all ABI-defined events on the contract.
+        create for all watched events on each contract. The block each
+        filter is known to have covered is tracked, so expired filters can
+        be recovered without losing events.
         """
         self.event_filters = {}
-        event_names = [v['name']  for v in self.contract_abi if v['type'] == 'event']
-        for event_name in event_names:
-            self.event_filters[event_name] = self.contract.events[event_name].createFilter(fromBlock='latest')
+        for contract_address, contract_abi in self.contract_abis.items():
+            selection = self.event_selections.get(contract_address)
+            event_names = [v['name']  for v in contract_abi if v['type'] == 'event']
+            for event_name in event_names:
+                if selection is not None and event_name not in selection:
+                    continue
+                self._create_filter(contract_address, event_name)
+        head = self.w3.eth.blockNumber
+        self.filter_blocks = {event_filter_name: head for event_filter_name in self.event_filters}
+        self.filter_recoveries = 0
+        self._recovered_events = {}
 
-    def _setup_event_bus(self):
+    def _create_filter(self, contract_address, event_name):
         """
-        Create an Amazon EventBridge event bus if not existing already
+        Create the filter for new entries of an event on a contract
         """
-        self.client = boto3.client('events')
-        self.event_bus_name = 'ethereum_contract_events'
-        try:
-            self.client.create_event_bus(Name=self.event_bus_name)
-        except self.client.exceptions.ResourceAlreadyExistsException:
-            pass
-
-    def handle_event(self, event):
-        """
-        Parse an event on a contract, translate into safe JSON and put onto
-        the event bus
-        """
-        detail = json.loads(Web3.toJSON(event), parse_int=str)
-        response = self.client.put_events(
-            Entries=[{
-                'DetailType': 'Ethereum contract event notifications',
-                'Detail': json.dumps(detail),
-                'EventBusName': self.event_bus_name,
-                'Source': 'ethereum'}
-            ]
-        )
-        # No error handling
+        self.event_filters[(contract_address, event_name)] = \
+            self.contracts[contract_address].events[event_name].createFilter(
+                fromBlock='latest', argument_filters=self._argument_filters(contract_address, event_name))
+
+    def _argument_filters(self, contract_address, event_name):
+        """
+        The configured indexed argument filters of an event, if any
+        """
+        return (self.event_selections.get(contract_address) or {}).get(event_name) or None
+
+    def recover_filter(self, event_filter_name):
+        """
+        Recreate a filter the node has dropped, and re-query its events
+        from the blocks after its last successful poll up to the head with
+        eth_getLogs.
+
+        Returns
+        -------
+        tuple
+            The events missed while the filter was dead, and the head they
+            were queried up to
+        """
+        contract_address, event_name = event_filter_name
+        contract_event = self.contracts[contract_address].events[event_name]
+        argument_filters = self._argument_filters(contract_address, event_name)
+        self.event_filters[event_filter_name] = contract_event.createFilter(fromBlock='latest',
+                                                                            argument_filters=argument_filters)
+        head = self.w3.eth.blockNumber
+        from_block = self.filter_blocks[event_filter_name] + 1
+        events = []
+        if head >= from_block:
+            events = list(contract_event.getLogs(argument_filters=argument_filters, fromBlock=from_block, toBlock=head))
+        # The new filter may also report events from the head block
+        self._recovered_events[event_filter_name] = {(bytes(event['blockHash']), event['logIndex'])
+                                                     for event in events}
+        self.filter_recoveries += 1
+        logging.info(json.dumps({"filter_recovered": list(event_filter_name),
+                                 "gap_from_block": from_block,
+                                 "gap_to_block": head,
+                                 "gap_events": len(events),
+                                 "filter_recoveries": self.filter_recoveries}))
+        return events, head
+
+    def _setup_checkpoints(self):
+        """
+        Load the checkpoint of each contract and find the earliest block to
+        resume from. Logs at or before a contract's checkpoint are skipped
+        while resuming.
+        """
+        self.resume_positions = {}
+        self.resume_block = None
+        if self.checkpoint_store is None:
+            return
+        for contract_address in self.contract_addresses:
+            checkpoint = self.checkpoint_store.load(contract_address)
+            if checkpoint is not None:
+                self.resume_positions[contract_address] = checkpoint
+        resume_blocks = [block_number + 1 if log_index is None else block_number
+                         for block_number, log_index in self.resume_positions.values()]
+        if resume_blocks:
+            self.resume_block = min(resume_blocks)
+
+    def _is_published(self, contract_address, log):
+        """
+        Test whether a log was published before the last restart
+        """
+        position = self.resume_positions.get(contract_address)
+        if position is None:
+            return False
+        block_number, log_index = position
+        if log_index is None:
+            return log['blockNumber'] <= block_number
+        return (log['blockNumber'], log['logIndex']) <= (block_number, log_index)
+
+    def complete_block_range(self, to_block):
+        """
+        Record that all contract events up to and including to_block have
+        been fetched. Proxy upgrades within the range are applied and the
+        events they add are fetched first. The block is checkpointed once the publishes
+        submitted before it complete, without waiting for them here.
+        Checkpoints only cover confirmed blocks.
+        """
+        self.apply_upgrades()
+        while self.pending_upgrades:
+            contract_address, topics, from_block = self.pending_upgrades.pop(0)
+            if from_block <= to_block:
+                self.dispatch_logs(self.w3.eth.getLogs({'address': contract_address,
+                                                        'topics': [topics],
+                                                        'fromBlock': from_block,
+                                                        'toBlock': to_block}))
+        self.last_block = to_block
+        if self.confirmation_buffer is not None:
+            if self.confirmation_buffer.confirmed_block is None:
+                return
+            to_block = min(to_block, self.confirmation_buffer.confirmed_block)
+        if self.checkpoint_store is not None:
+            self._published.append((None, None, to_block))
+        self.collect_published()
+
+    def confirm_blocks(self, head, headers=None):
+        """
+        Validate buffered events against the canonical chain up to head,
+        re-query any blocks replaced by a reorg, and release the events
+        with enough confirmations. Block headers already fetched can be
+        passed to save fetching them again.
+        """
+        if self.confirmation_buffer is None:
+            return
+        fork_block = self.confirmation_buffer.update_canonical(head, headers)
+        if fork_block is not None and fork_block <= head:
+            self.poll_logs(fork_block, head)
+        self.confirmation_buffer.release(head)
+
+    def _setup_sinks(self):
+        """
+        Create the sinks and a publisher for each. AWS clients keep a
+        keep-alive connection pool of http_pool_size.
+        """
+        config = Config(max_pool_connections=self.http_pool_size,
+                        connect_timeout=self.http_timeout,
+                        read_timeout=self.http_timeout,
+                        tcp_keepalive=True)
+        self.sinks = [create_sink(url, config=config) for url in self.sink_urls]
+        max_attempts = self.publish_max_attempts if self.spool is None else None
+        self.publisher = FanOutPublisher({
+            sink.name: BatchPublisher(functools.partial(self._put_batch, sink), workers=self.publish_workers,
+                                      max_queued=self.publish_queue_size, max_entries=sink.max_entries,
+                                      max_bytes=sink.max_bytes, max_entry_bytes=sink.max_entry_bytes,
+                                      size=sink.size, linger=self.publish_linger, max_attempts=max_attempts,
+                                      dead_letter=functools.partial(self.dead_letters, sink=sink.name)
+                                      if self.dead_letters is not None else None)
+            for sink in self.sinks})
+        if self.spool is not None:
+            self._spool_drainer = threading.Thread(target=self._drain_spool, daemon=True)
+            self._spool_drainer.start()
+
+    def handle_event(self, event, retracted=False):
+        """
+        Parse an event on a contract, translate into safe JSON in a single
+        pass and submit it to be put to every sink in their next batch.
+        Retracted events, orphaned by a chain reorg after being published,
+        are marked as removed. Returns a future of the put, or with a spool
+        a future resolved once the entry is spooled.
+        """
+        detail = to_detail(event)
+        detail_type = 'Ethereum contract event notifications'
+        if retracted:
+            detail['removed'] = True
+            detail_type = 'Ethereum contract event retractions'
+        detail = dumps(detail)
         logging.info(detail)
-        logging.info(response)
+        entry = {
+            'DetailType': detail_type,
+            'Detail': detail,
+            'Source': 'ethereum',
+            'PartitionKey': event['address']}
+        if self.spool is None:
+            return self.publisher.submit(entry)
+        future = Future()
+        try:
+            self.spool.append(entry)
+            future.set_result(None)
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _drain_spool(self):
+        """
+        Submit spooled entries for publishing in order until the spool is
+        closed. The bounded publish queue paces reading, so a backlog drains
+        as fast as the event bus accepts it.
+        """
+        while True:
+            records = self.spool.read()
+            if not records:
+                return
+            for segment_id, entry in records:
+                future = self.publisher.submit(entry)
+                future.add_done_callback(functools.partial(self._ack_spooled, segment_id))
+
+    def _ack_spooled(self, segment_id, future):
+        """
+        Acknowledge a spooled entry once it is published or dead-lettered
+        """
+        error = future.exception()
+        if error is not None:
+            logging.error(error)
+        self.spool.ack(segment_id)
+
+    def _put_batch(self, sink, entries):
+        """
+        Put a batch of entries to a sink, returning the result of each
+        entry. Entries failing with an error code are retried by the
+        sink's publisher.
+        """
+        results = sink.put_batch(entries)
+        logging.info(json.dumps({"sink": sink.name, "results": results}))
+        return results
+
+    def redrive_dead_letters(self):
+        """
+        Publish the dead-lettered events again. Those failing again are
+        dead-lettered afresh.
+        """
+        if self.dead_letters is None:
+            return
+        redriven, failed = self.dead_letters.redrive(self.publisher.submit)
+        logging.info(json.dumps({"dead_letters_redriven": redriven, "failed": failed}))
+
+    async def offload(self, func, *args, timeout=True):
+        """
+        Run a blocking node call in the call executor without stalling the
+        event loop, bounded by max_concurrency and, unless timeout is
+        False, abandoned after call_timeout. A call that is abandoned keeps
+        running in its thread, so calls that dispatch events or otherwise
+        update the notifier's state pass timeout=False and are always
+        waited for; their node requests are still bounded by http_timeout.
+        """
+        if self._call_semaphore is None:
+            self._call_semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._call_semaphore:
+            call = asyncio.get_event_loop().run_in_executor(self._call_executor, functools.partial(func, *args))
+            if not timeout:
+                return await call
+            return await asyncio.wait_for(call, timeout=self.call_timeout)
+
+    def collect_published(self):
+        """
+        Log failed publishes and checkpoint the successful ones, and the
+        completed block ranges, in order, up to the first publish still
+        pending. Completed block ranges are queued as (None, None, block).
+        """
+        while self._published:
+            event, future, checkpoint = self._published[0]
+            if future is not None and not future.done():
+                return
+            self._published.popleft()
+            if event is None:
+                for contract_address in self.contract_addresses:
+                    self.checkpoint_store.update(contract_address, checkpoint)
+                continue
+            error = future.exception()
+            if error is not None:
+                logging.error(error)
+            elif checkpoint and self.checkpoint_store is not None:
+                self.checkpoint_store.update(event['address'], event['blockNumber'], event['logIndex'])
 
-    async def gather_event(self, event_filter_name, event_filter):
+    def wait_published(self):
+        """
+        Block until all submitted publishes have completed
+        """
+        for _, future, _ in list(self._published):
+            if future is not None:
+                future.exception()
+        self.collect_published()
+
+    async def wait_publish_capacity(self):
+        """
+        Hold back polling while the publish queue is backlogged, checkpointing
+        publishes as they complete. With a spool, the backlog waits on disk
+        instead.
+        """
+        self.collect_published()
+        while self.spool is None and self.publisher.backlogged():
+            await asyncio.sleep(self.publish_linger)
+            self.collect_published()
+
+    async def gather_event(self, event_filter_name, event_filter, head):
         """
         Collect all new events on a contract that pass the event filter and send 
-        for handling.
+        for handling. A filter the node no longer knows is recreated, and
+        the events it missed are re-queried.
         """
         try:
-            for event in event_filter.get_new_entries():
-                self.handle_event(event)
-        except ValueError as e:
+            try:
+                events = await self.offload(event_filter.get_new_entries, timeout=False)
+                recovered = self._recovered_events.pop(event_filter_name, set())
+                events = [event for event in events
+                          if (bytes(event['blockHash']), event['logIndex']) not in recovered]
+            except ValueError as e:
+                if not is_filter_not_found(e):
+                    raise
+                events, head = await self.offload(self.recover_filter, event_filter_name, timeout=False)
+            for event in events:
+                self.dispatch_event(event)
+            self.filter_blocks[event_filter_name] = max(self.filter_blocks[event_filter_name], head)
+        except (ValueError, asyncio.TimeoutError, requests.exceptions.RequestException) as e:
+            logging.error(e)
+
+    def dispatch_log(self, log):
+        """
+        Decode a raw log with the compiled decoder of the emitting contract
+        matching its topic0 and send it for handling. Logs for events not
+        watched are ignored.
+        """
+        decoder = self._log_decoder(log)
+        if decoder is not None:
+            self.dispatch_event(decoder.decode(log), removed=log.get('removed', False))
+
+    def dispatch_logs(self, logs):
+        """
+        Decode a batch of raw logs, grouped by event so each group is
+        decoded column-wise, and send them for handling in their original
+        order. Logs for events not watched are ignored.
+        """
+        groups = {}
+        for i, log in enumerate(logs):
+            decoder = self._log_decoder(log)
+            if decoder is not None:
+                groups.setdefault(decoder, []).append(i)
+        events = [None] * len(logs)
+        for decoder, indices in groups.items():
+            for i, event in zip(indices, decoder.decode_many([logs[i] for i in indices])):
+                events[i] = event
+        for log, event in zip(logs, events):
+            if event is not None:
+                self.dispatch_event(event, removed=log.get('removed', False))
+
+    def _log_decoder(self, log):
+        """
+        The decoder for a raw log, or None if its event is not watched, does
+        not match the argument filters or was already published. Proxy
+        upgrade events are queued to be applied when the block range
+        completes.
+        """
+        if not log['topics']:
+            return None
+        contract_address = Web3.toChecksumAddress(log['address'])
+        if log['topics'][0] in UPGRADE_TOPICS and contract_address in self.implementations:
+            self.detected_upgrades.append((contract_address, log['blockNumber']))
+        decoder = self.decoders.get(contract_address, log['topics'][0])
+        if decoder is None or not self._matches_topic_filters(contract_address, log) \
+                or self._is_published(contract_address, log):
+            return None
+        return decoder
+
+    def dispatch_event(self, event, removed=False):
+        """
+        Publish a decoded event, or hold it until confirmed. Events the
+        node reports as removed by a reorg are retracted. Events are held
+        as compact records until they are serialized for publishing.
+        """
+        event = EventRecord.from_event(event)
+        if self.confirmation_buffer is not None:
+            self.confirmation_buffer.add(event, removed)
+        elif removed:
+            self.retract_event(event)
+        else:
+            self.publish_event(event)
+
+    def publish_event(self, event):
+        """
+        Submit an event for publishing. It is checkpointed once its publish
+        completes.
+        """
+        self._published.append((event, self.handle_event(event), True))
+
+    def retract_event(self, event):
+        """
+        Submit a retraction for a published event orphaned by a reorg
+        """
+        self._published.append((event, self.handle_event(event, True), False))
+
+    def fetch_logs(self, from_block, to_block):
+        """
+        Fetch all logs for every watched event on all contracts in the
+        given inclusive block range, with a single eth_getLogs call per
+        distinct set of argument topic filters. Queries may overlap, since
+        each covers every address and event of its group, so logs returned
+        by several are only kept once.
+        """
+        if len(self.log_queries) == 1:
+            return self.w3.eth.getLogs(dict(self.log_queries[0], fromBlock=from_block, toBlock=to_block))
+        logs = {}
+        for log_query in self.log_queries:
+            for log in self.w3.eth.getLogs(dict(log_query, fromBlock=from_block, toBlock=to_block)):
+                logs.setdefault((bytes(log['blockHash']), log['logIndex']), log)
+        return sorted(logs.values(), key=lambda log: (log['blockNumber'], log['logIndex']))
+
+    def fetch_new_logs(self, from_block, to_block):
+        """
+        Fetch the contract logs of newly mined blocks. With bloom_filter,
+        the block headers are fetched in one batch and logs are only
+        queried over the blocks whose logsBloom may hold a watched event,
+        if any.
+
+        Returns
+        -------
+        tuple
+            The logs, and the fetched block headers or None
+        """
+        if not self.bloom_filter or to_block - from_block + 1 > self.bloom_max_blocks:
+            return self.fetch_logs(from_block, to_block), None
+        headers = self.get_block_headers(list(range(from_block, to_block + 1)))
+        matching = [header['number'] for header in headers if self.logs_bloom.matches(header['logsBloom'])]
+        if not matching:
+            return [], headers
+        return self.fetch_logs(matching[0], matching[-1]), headers
+
+    def poll_logs(self, from_block, to_block):
+        """
+        Fetch all contract logs in the given inclusive block range and
+        dispatch them to their event decoders.
+        """
+        self.dispatch_logs(self.fetch_logs(from_block, to_block))
+
+    def backfill(self, from_block, to_block=None, use_bloom=False):
+        """
+        Dispatch all historical contract events from from_block up to
+        to_block, or the current head if not given, in adaptively sized
+        eth_getLogs windows. Polling resumes after the last backfilled block.
+        With use_bloom, each window's headers are checked against the logs
+        bloom first.
+        """
+        if to_block is None:
+            to_block = self.w3.eth.blockNumber
+        self.confirm_blocks(self.w3.eth.blockNumber)
+        Backfiller(self, from_block, to_block, use_bloom=use_bloom).run()
+
+    def resume(self):
+        """
+        Backfill from the checkpointed blocks to the current head, so no
+        events emitted while the relay was down are missed
+        """
+        if self.resume_block is not None:
+            self.backfill(self.resume_block)
+        self.resume_positions = {}
+
+    async def gather_logs(self, head):
+        """
+        Collect all contract events in the blocks mined since the last poll
+        up to head. Node calls, including those applying proxy upgrades,
+        run off the event loop, and publishes are queued without waiting
+        for them.
+        """
+        try:
+            if head > self.last_block:
+                logs, headers = await self.offload(self.fetch_new_logs, self.last_block + 1, head)
+                for log in logs:
+                    self.dispatch_log(log)
+                await self.offload(self.confirm_blocks, head, headers, timeout=False)
+                await self.offload(self.complete_block_range, head, timeout=False)
+        except (ValueError, asyncio.TimeoutError, requests.exceptions.RequestException) as e:
+            logging.error(e)
+
+    async def gather_confirmations(self, head):
+        """
+        Release buffered filter events that have been confirmed.
+        """
+        try:
+            await self.offload(self.confirm_blocks, head, timeout=False)
+        except (ValueError, asyncio.TimeoutError, requests.exceptions.RequestException) as e:
             logging.error(e)
 
     async def gather_events(self, poll_interval):
         """
-        Concurrently poll each contract event type each given poll interval. 
-        Only return if the Web3 connection to the provider is lost.
+        Concurrently poll all contract events whenever the chain head
+        advances. The head is checked once for all contracts, timed by a
+        HeadScheduler to follow expected block arrival, and never less often
+        than each given poll interval. Polling pauses while the publish
+        queue is backlogged. Only return if the Web3 connection to the
+        provider is lost.
+        """
+        scheduler = HeadScheduler(max_interval=poll_interval)
+        last_stats = time.monotonic()
+        while True:
+            if time.monotonic() - last_stats >= self.stats_interval:
+                self.log_pool_stats()
+                last_stats = time.monotonic()
+            await self.wait_publish_capacity()
+            try:
+                head = await self.offload(lambda: self.w3.eth.blockNumber)
+            except (ValueError, asyncio.TimeoutError, requests.exceptions.RequestException) as e:
+                logging.error(e)
+                if not await self.is_connected():
+                    return
+                head = None
+            if head is not None and scheduler.observe(head):
+                if self.poll_mode == 'logs':
+                    await self.gather_logs(head)
+                else:
+                    await asyncio.gather(*[self.gather_event(event_filter_name, event_filter, head)
+                                           for event_filter_name, event_filter in self.event_filters.items()])
+                    await self.gather_confirmations(head)
+                    self.collect_published()
+            await asyncio.sleep(scheduler.next_delay())
+
+    def pool_stats(self):
+        """
+        Report connection pool statistics for the shared HTTP session
         """
-        while self.w3.isConnected():
-            coroutines = [self.gather_event(event_filter_name, event_filter)
-                      for event_filter_name, event_filter in self.event_filters.items()]
-            asyncio.gather(*coroutines)
-            await asyncio.sleep(poll_interval)
+        return session_stats(self.session)
+
+    def log_pool_stats(self):
+        """
+        Log connection pool statistics for tuning http_pool_size, publishing
+        and spool statistics, and the rolling statistics of each node when
+        there are several
+        """
+        logging.info(json.dumps({"http_pool_stats": self.pool_stats()}))
+        logging.info(json.dumps({"publish_stats": self.publisher.stats()}))
+        if self.spool is not None:
+            logging.info(json.dumps({"spool_stats": self.spool.stats()}))
+        if isinstance(self.w3.provider, ProviderPool):
+            logging.info(json.dumps({"node_stats": self.w3.provider.node_stats()}))
+
+    async def is_connected(self):
+        """
+        Check the connection to the provider without blocking the event loop
+        """
+        try:
+            return await self.offload(self.w3.isConnected)
+        except asyncio.TimeoutError:
+            return False
     
     def run(self):
         """
-        Gather all events and tidy up the system-loop on exit
+        Gather all events and tidy up the system-loop on exit. In 'websocket'
+        mode events are pushed by the node rather than polled.
         """
         loop = asyncio.get_event_loop()
         try:
-            loop.run_until_complete(self.gather_events(poll_interval=self.poll_interval))
+            if self.poll_mode == 'websocket':
+                loop.run_until_complete(LogSubscriber(self, self.ws_url).subscribe())
+            else:
+                loop.run_until_complete(self.gather_events(poll_interval=self.poll_interval))
         finally:
             loop.close()
+            self.close()
+
+    def close(self):
+        """
+        Wait for outstanding publishes and write any buffered checkpoints.
+        Spooled events not drained within spool_drain_timeout are published
+        on the next run.
+        """
+        self.wait_published()
+        self._call_executor.shutdown(wait=False)
+        if self.spool is not None:
+            if not self.spool.wait_drained(self.spool_drain_timeout):
+                logging.info(json.dumps({"spool_undrained": self.spool.stats()}))
+            self.spool.close()
+            self._spool_drainer.join()
+        self.publisher.close()
+        for sink in self.sinks:
+            sink.close()
+        if self.checkpoint_store is not None:
+            self.checkpoint_store.close()
+
+
+def is_filter_not_found(error):
+    """Test whether a filter poll error means the node has dropped the
+    filter, e.g. after inactivity or a node restart
+
+    Parameters
+    ----------
+    error : ValueError
+        The error raised by the Web3 provider
+
+    Returns
+    -------
+    bool
+        True if the filter must be recreated
+    """
+    details = error.args[0] if error.args else ''
+    if isinstance(details, dict):
+        details = details.get('message', '')
+    return 'filter not found' in str(details).lower()
+
+
+def parse_list(value):
+    """Parse a list of contract addresses, node URLs or sink URLs from
+    configuration
+
+    Parameters
+    ----------
+    value : str
+        A JSON list, or a comma-separated string
+
+    Returns
+    -------
+    list<str>
+        The list items
+    """
+    value = value.strip()
+    if value.startswith('['):
+        return json.loads(value)
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def parse_event_selections(contracts):
+    """Collect the events to watch from contract configuration
+
+    Parameters
+    ----------
+    contracts : list
+        Contract addresses, or dicts with an 'address' and optional
+        'events', either a list of event names or a dict of event names to
+        indexed argument filters, e.g.
+        {"address": "0x...", "events": {"Transfer": {"to": ["0x..."]}}}
+
+    Returns
+    -------
+    dict
+        Contract addresses to dicts of event names to argument filters, for
+        the contracts that select events
+    """
+    event_selections = {}
+    for contract in contracts:
+        if isinstance(contract, str) or contract.get('events') is None:
+            continue
+        events = contract['events']
+        if isinstance(events, list):
+            events = {event_name: {} for event_name in events}
+        event_selections[contract['address']] = events
+    return event_selections
+
 
 if __name__ == "__main__":
     """
     Main entry point. Collect the required environment variables and start
-    the main loop.
+    the main loop. CONTRACT_ADDRESSES and NODE_URLS take precedence over
+    the single CONTRACT_ADDRESS and NODE_URL; CONTRACT_ADDRESSES items may
+    be objects selecting events and indexed argument filters. ABIs are read
+    from ABI_DIR and the ABI_CACHE file before falling back to Etherscan.
+    Events are published to every sink in SINKS, EventBridge by default.
+    With SPOOL_DIR, events are spooled to disk before publishing. With
+    --from-block, historical events are backfilled first, otherwise the
+    relay resumes from its checkpoints; with --to-block, the relay exits
+    once the backfill is complete.
     """
+    parser = argparse.ArgumentParser(description='Relay Ethereum contract events into Amazon EventBridge')
+    parser.add_argument('--from-block', type=int,
+                        help='backfill events from this block before relaying new events')
+    parser.add_argument('--to-block', type=int,
+                        help='backfill events up to this block, inclusive, then exit')
+    parser.add_argument('--redrive-dead-letters', action='store_true',
+                        help='publish the dead-lettered events again before relaying')
+    parser.add_argument('--bloom-backfill', action='store_true',
+                        help='check block header logs blooms before querying logs while backfilling')
+    args = parser.parse_args()
+    if args.to_block is not None and args.from_block is None:
+        parser.error('--to-block requires --from-block')
+    contracts = parse_list(os.environ.get('CONTRACT_ADDRESSES') or os.environ.get('CONTRACT_ADDRESS', ''))
     notifier = EthereumContractNotifier(
-        node_url=os.environ.get('NODE_URL'),
-        contract_address=os.environ.get('CONTRACT_ADDRESS'),
-        poll_interval=os.environ.get('POLL_INTERVAL', 10))
-    notifier.run()
+        node_urls=parse_list(os.environ.get('NODE_URLS') or os.environ.get('NODE_URL', '')),
+        contract_addresses=[contract if isinstance(contract, str) else contract['address']
+                            for contract in contracts],
+        event_selections=parse_event_selections(contracts),
+        abi_registry=AbiRegistry(os.environ.get('ABI_DIR', 'abis'), os.environ.get('ABI_CACHE', 'abi_cache.json')),
+        poll_interval=int(os.environ.get('POLL_INTERVAL', 10)),
+        poll_mode=os.environ.get('POLL_MODE', 'logs'),
+        ws_url=os.environ.get('WS_URL'),
+        checkpoint_store=create_checkpoint_store(
+            os.environ.get('CHECKPOINT_STORE', 'sqlite:///checkpoints.db'),
+            endpoint_url=os.environ.get('DYNAMODB_ENDPOINT_URL')),
+        rpc_batch_size=int(os.environ.get('RPC_BATCH_SIZE', 100)),
+        max_concurrency=int(os.environ.get('MAX_CONCURRENCY', 8)),
+        call_timeout=int(os.environ.get('CALL_TIMEOUT', 30)),
+        http_pool_size=int(os.environ.get('HTTP_POOL_SIZE', 16)),
+        http_timeout=int(os.environ.get('HTTP_TIMEOUT', 10)),
+        bloom_filter=os.environ.get('BLOOM_FILTER', 'true').lower() in ('1', 'true', 'yes'),
+        confirmations=int(os.environ.get('CONFIRMATIONS', 0)),
+        fast_retract=os.environ.get('FAST_RETRACT', '').lower() in ('1', 'true', 'yes'),
+        publish_linger=float(os.environ.get('PUBLISH_LINGER', 0.05)),
+        publish_workers=int(os.environ.get('PUBLISH_WORKERS', 4)),
+        publish_queue_size=int(os.environ.get('PUBLISH_QUEUE_SIZE', 10000)),
+        publish_max_attempts=int(os.environ.get('PUBLISH_MAX_ATTEMPTS', 8)),
+        dead_letter_path=os.environ.get('DEAD_LETTER_PATH', 'dead_letters.jsonl'),
+        spool=Spool(os.environ['SPOOL_DIR'],
+                    segment_bytes=int(os.environ.get('SPOOL_SEGMENT_BYTES', 64 * 1024 * 1024)),
+                    fsync=os.environ.get('SPOOL_FSYNC', 'interval'),
+                    fsync_interval=float(os.environ.get('SPOOL_FSYNC_INTERVAL', 1.0)))
+        if os.environ.get('SPOOL_DIR') else None,
+        spool_drain_timeout=float(os.environ.get('SPOOL_DRAIN_TIMEOUT', 60)),
+        sink_urls=parse_list(os.environ.get('SINKS', 'eventbridge://ethereum_contract_events')))
+    if args.redrive_dead_letters:
+        notifier.redrive_dead_letters()
+    if args.from_block is not None:
+        notifier.backfill(args.from_block, args.to_block, use_bloom=args.bloom_backfill)
+    else:
+        notifier.resume()
+    if args.to_block is None:
+        notifier.run()
+    else:
+        notifier.close()
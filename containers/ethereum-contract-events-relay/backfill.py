@@ -0,0 +1,245 @@
+import json
+import logging
+import random
+import time
+import requests
+
+
+# Messages nodes use when an eth_getLogs block range returns too much data
+# (geth/Infura, Alchemy, QuickNode, Erigon and Nethermind variants)
+RANGE_TOO_LARGE_MESSAGES = (
+    'more than 10000 results',
+    'too many results',
+    'response size',
+    'response is too big',
+    'block range',
+    'log response size exceeded',
+    'query timeout',
+)
+
+# Messages nodes use when a request is throttled, e.g. Infura's -32005
+# errors, which also cover ranges with too many results
+RATE_LIMITED_MESSAGES = (
+    'rate limit',
+    'rate exceeded',
+    'request rate',
+    'too many requests',
+    'request limit reached',
+    'request count exceeded',
+    'compute units',
+)
+
+
+def _error_details(error):
+    """The JSON-RPC error code and lowercased message of a provider error"""
+    details = error.args[0] if error.args else ''
+    if isinstance(details, dict):
+        return details.get('code'), str(details.get('message', '')).lower()
+    return None, str(details).lower()
+
+
+def is_rate_limited(error):
+    """Test whether an eth_getLogs error means the node is throttling
+    requests, so the query should be retried after a backoff over the same
+    block range
+
+    Parameters
+    ----------
+    error : Exception
+        The error raised by the Web3 provider
+
+    Returns
+    -------
+    bool
+        True if the request was rate limited
+    """
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and error.response.status_code == 429
+    code, message = _error_details(error)
+    return code == 429 or any(text in message for text in RATE_LIMITED_MESSAGES)
+
+
+def is_range_too_large(error):
+    """Test whether an eth_getLogs error means the block range should be
+    split
+
+    Parameters
+    ----------
+    error : Exception
+        The error raised by the Web3 provider
+
+    Returns
+    -------
+    bool
+        True if the query is likely to succeed over a smaller block range.
+        Rate limited requests are not.
+    """
+    if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError)):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and error.response.status_code in (413, 504)
+    if is_rate_limited(error):
+        return False
+    code, message = _error_details(error)
+    return code == -32005 or any(text in message for text in RANGE_TOO_LARGE_MESSAGES)
+
+
+def retry_after(error):
+    """The number of seconds a throttled HTTP response asks to wait, or
+    None
+    """
+    response = getattr(error, 'response', None)
+    value = response.headers.get('Retry-After') if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class Backfiller():
+
+    def __init__(self,
+                 notifier,
+                 from_block,
+                 to_block,
+                 window=2000,
+                 min_window=1,
+                 max_window=500000,
+                 target_results=2000,
+                 progress_interval=10,
+                 use_bloom=False,
+                 max_bloom_window=10000,
+                 rate_limit_retries=10,
+                 rate_limit_backoff=1.0,
+                 max_rate_limit_backoff=60,
+                 dispatch=None):
+        """Initialise a Backfiller, which walks historical blocks with
+        eth_getLogs in adaptively sized block windows
+
+        Parameters
+        ----------
+        notifier : EthereumContractNotifier
+            The notifier providing the watched contracts and log dispatch
+        from_block : int
+            The first block to backfill
+        to_block : int
+            The last block to backfill, inclusive
+        window : int, optional
+            The initial number of blocks per eth_getLogs query
+        min_window : int, optional
+            The smallest number of blocks per query before giving up
+        max_window : int, optional
+            The largest number of blocks per query
+        target_results : int, optional
+            The number of logs per query to aim for. The window doubles
+            while queries return fewer than half of this.
+        progress_interval : int, optional
+            The number of seconds between progress log messages
+        use_bloom : bool, optional
+            Fetch each window's block headers and test their logsBloom in one
+            vectorized pass, only querying logs over the span of blocks that
+            may hold a watched event. This pays off when headers are cheaper
+            than log queries, e.g. against a local node.
+        max_bloom_window : int, optional
+            The largest window when use_bloom is set, since every block's
+            header is fetched
+        rate_limit_retries : int, optional
+            The most consecutive retries of a rate limited query before
+            giving up
+        rate_limit_backoff : float, optional
+            The backoff in seconds before the first retry of a rate limited
+            query, doubling for each further retry up to
+            max_rate_limit_backoff, of which a random fraction is waited.
+            A Retry-After header takes precedence.
+        max_rate_limit_backoff : float, optional
+            The longest backoff in seconds
+        dispatch : callable, optional
+            Called with the logs of each window, by default
+            notifier.dispatch_logs
+        """
+        self.notifier = notifier
+        self.from_block = from_block
+        self.to_block = to_block
+        self.window = window
+        self.min_window = min_window
+        self.max_window = max_window
+        self.target_results = target_results
+        self.progress_interval = progress_interval
+        self.use_bloom = use_bloom
+        self.rate_limit_retries = rate_limit_retries
+        self.rate_limit_backoff = rate_limit_backoff
+        self.max_rate_limit_backoff = max_rate_limit_backoff
+        self.dispatch = dispatch if dispatch is not None else notifier.dispatch_logs
+        if use_bloom:
+            self.max_window = min(self.max_window, max_bloom_window)
+            self.window = min(self.window, self.max_window)
+
+    def _log_progress(self, block, log_count, started):
+        """
+        Log backfill progress and throughput
+        """
+        elapsed = max(time.monotonic() - started, 1e-9)
+        logging.info(json.dumps({"backfill_block": block,
+                                 "backfill_to_block": self.to_block,
+                                 "backfill_window": self.window,
+                                 "backfill_logs": log_count,
+                                 "blocks_per_second": round((block - self.from_block + 1) / elapsed, 1)}))
+
+    def _fetch_window(self, from_block, to_block):
+        """
+        Fetch the contract logs of a window, skipping the blocks around it
+        whose logsBloom cannot hold a watched event when use_bloom is set
+        """
+        if not self.use_bloom:
+            return self.notifier.fetch_logs(from_block, to_block)
+        headers = self.notifier.get_block_headers(list(range(from_block, to_block + 1)))
+        matching = self.notifier.logs_bloom.matches_many([header['logsBloom'] for header in headers]).nonzero()[0]
+        if not len(matching):
+            return []
+        return self.notifier.fetch_logs(headers[matching[0]]['number'], headers[matching[-1]]['number'])
+
+    def run(self):
+        """
+        Dispatch every contract log between from_block and to_block in
+        order. The window is halved whenever the node rejects a range as
+        too large, and doubled while results are sparse. Rate limited
+        queries are retried over the same window after a backoff.
+
+        Returns
+        -------
+        int
+            The last block backfilled
+        """
+        started = last_progress = time.monotonic()
+        log_count = 0
+        block = self.from_block
+        rate_limited = 0
+        while block <= self.to_block:
+            end_block = min(block + self.window - 1, self.to_block)
+            try:
+                logs = self._fetch_window(block, end_block)
+            except (ValueError, requests.exceptions.RequestException) as e:
+                if is_rate_limited(e) and rate_limited < self.rate_limit_retries:
+                    backoff = min(self.max_rate_limit_backoff, self.rate_limit_backoff * 2 ** rate_limited)
+                    delay = retry_after(e)
+                    delay = random.uniform(0, backoff) if delay is None else delay
+                    rate_limited += 1
+                    logging.info(json.dumps({"backfill_rate_limited": block, "retry_in_seconds": round(delay, 3)}))
+                    time.sleep(delay)
+                    continue
+                if not is_range_too_large(e) or self.window <= self.min_window:
+                    raise
+                self.window = max(self.window // 2, self.min_window)
+                continue
+            rate_limited = 0
+            self.dispatch(logs)
+            log_count += len(logs)
+            self.notifier.complete_block_range(end_block)
+            block = end_block + 1
+            if len(logs) < self.target_results // 2:
+                self.window = min(self.window * 2, self.max_window)
+            if time.monotonic() - last_progress >= self.progress_interval:
+                self._log_progress(end_block, log_count, started)
+                last_progress = time.monotonic()
+        self._log_progress(self.to_block, log_count, started)
+        return self.to_block
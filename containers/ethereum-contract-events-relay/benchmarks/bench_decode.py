@@ -0,0 +1,148 @@
+"""
+Benchmark log decoding: web3's contract event processLog, as the relay
+used to decode each log, against the precomputed topic0 DecoderTable.
+
+Run from the relay directory on synthetic logs:
+
+    python benchmarks/bench_decode.py --logs 5000
+
+or record the logs of a contract from a node once, and replay them:
+
+    python benchmarks/bench_decode.py --fixture logs.json --record <node url> \
+        --address 0x... --abi abi.json --from-block 17000000 --to-block 17000100
+    python benchmarks/bench_decode.py --fixture logs.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from eth_abi import encode_abi
+from hexbytes import HexBytes
+from web3 import Web3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from decoders import DecoderTable  # noqa: E402
+from subscriptions import format_log  # noqa: E402
+
+ADDRESS = Web3.toChecksumAddress('0x' + 'ab' * 20)
+TRANSFER_ABI = {
+    'type': 'event', 'name': 'Transfer', 'anonymous': False,
+    'inputs': [{'indexed': True, 'name': 'from', 'type': 'address'},
+               {'indexed': True, 'name': 'to', 'type': 'address'},
+               {'indexed': False, 'name': 'value', 'type': 'uint256'}]}
+# An event mixing dynamic and indexed dynamic types
+SWAP_ABI = {
+    'type': 'event', 'name': 'Swap', 'anonymous': False,
+    'inputs': [{'indexed': True, 'name': 'sender', 'type': 'address'},
+               {'indexed': False, 'name': 'amounts', 'type': 'uint256[]'},
+               {'indexed': False, 'name': 'recipient', 'type': 'address'},
+               {'indexed': False, 'name': 'memo', 'type': 'string'},
+               {'indexed': True, 'name': 'tag', 'type': 'string'},
+               {'indexed': False, 'name': 'ok', 'type': 'bool'},
+               {'indexed': False, 'name': 'peers', 'type': 'address[]'}]}
+
+
+def random_address(rng):
+    return '0x' + rng.getrandbits(160).to_bytes(20, 'big').hex()
+
+
+def make_logs(count, table, rng):
+    """
+    Build synthetic raw logs alternating Transfer and Swap events
+    """
+    transfer, swap = (table.decoders[ADDRESS][topic] for topic in table.decoders[ADDRESS])
+    logs = []
+    for i in range(count):
+        if i % 2:
+            topics = [HexBytes(transfer.topic), HexBytes(b'\0' * 12 + rng.getrandbits(160).to_bytes(20, 'big')),
+                      HexBytes(b'\0' * 12 + rng.getrandbits(160).to_bytes(20, 'big'))]
+            data = encode_abi(['uint256'], [rng.getrandbits(200)])
+        else:
+            topics = [HexBytes(swap.topic), HexBytes(b'\0' * 12 + rng.getrandbits(160).to_bytes(20, 'big')),
+                      HexBytes(rng.getrandbits(256).to_bytes(32, 'big'))]
+            data = encode_abi(['uint256[]', 'address', 'string', 'bool', 'address[]'],
+                              [[1, 2, 3], random_address(rng), 'memo', True,
+                               [random_address(rng), random_address(rng)]])
+        logs.append({'address': ADDRESS, 'topics': topics, 'data': Web3.toHex(data), 'logIndex': i,
+                     'transactionIndex': 0, 'transactionHash': HexBytes(rng.getrandbits(256).to_bytes(32, 'big')),
+                     'blockHash': HexBytes(rng.getrandbits(256).to_bytes(32, 'big')), 'blockNumber': 1})
+    return logs
+
+
+def record_fixture(path, node_url, address, abi, from_block, to_block):
+    """
+    Save the raw eth_getLogs response for a contract's logs, with its ABI
+    """
+    response = Web3(Web3.HTTPProvider(node_url)).provider.make_request(
+        'eth_getLogs', [{'address': address, 'fromBlock': hex(from_block), 'toBlock': hex(to_block)}])
+    if 'error' in response:
+        raise ValueError(response['error'])
+    with open(path, 'w') as f:
+        json.dump({'address': address, 'abi': abi, 'logs': response['result']}, f)
+
+
+def load_fixture(path):
+    """
+    The contract address, ABI and logs of a recorded fixture, with the logs
+    formatted as web3.eth.getLogs returns them
+    """
+    with open(path) as f:
+        fixture = json.load(f)
+    return Web3.toChecksumAddress(fixture['address']), fixture['abi'], [format_log(log) for log in fixture['logs']]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--logs', type=int, default=5000, help='the number of synthetic logs decoded')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--fixture', help='decode the logs recorded in this file instead of synthetic ones')
+    parser.add_argument('--record', metavar='NODE_URL', help='record the fixture from this node first')
+    parser.add_argument('--address', help='the contract whose logs are recorded')
+    parser.add_argument('--abi', help='a JSON file with the ABI of the recorded contract')
+    parser.add_argument('--from-block', type=int)
+    parser.add_argument('--to-block', type=int)
+    args = parser.parse_args()
+    if args.record:
+        if not (args.fixture and args.address and args.abi and args.from_block is not None
+                and args.to_block is not None):
+            parser.error('--record requires --fixture, --address, --abi, --from-block and --to-block')
+        with open(args.abi) as f:
+            record_fixture(args.fixture, args.record, args.address, json.load(f), args.from_block, args.to_block)
+
+    w3 = Web3()
+    if args.fixture:
+        address, abi, logs = load_fixture(args.fixture)
+    else:
+        address, abi = ADDRESS, [TRANSFER_ABI, SWAP_ABI]
+    contract = w3.eth.contract(address=address, abi=abi)
+    table = DecoderTable(w3.codec)
+    for event_abi in abi:
+        if event_abi['type'] == 'event' and not event_abi.get('anonymous', False):
+            table.add(address, event_abi)
+    if args.fixture:
+        logs = [log for log in logs if log['topics'] and table.get(address, log['topics'][0]) is not None]
+    else:
+        logs = make_logs(args.logs, table, random.Random(args.seed))
+    if not logs:
+        parser.error('no logs to decode')
+    events = {topic: contract.events[decoder.name]() for topic, decoder in table.decoders[address].items()}
+    for log in logs:
+        assert events[bytes(log['topics'][0])].processLog(log) == table.get(address, log['topics'][0]).decode(log)
+
+    started = time.perf_counter()
+    for log in logs:
+        events[bytes(log['topics'][0])].processLog(log)
+    process_log = time.perf_counter() - started
+    started = time.perf_counter()
+    for log in logs:
+        table.get(address, log['topics'][0]).decode(log)
+    decoder_table = time.perf_counter() - started
+    print('{} logs'.format(len(logs)))
+    print('processLog     {:8.1f} us/log'.format(process_log / len(logs) * 1e6))
+    print('DecoderTable   {:8.1f} us/log'.format(decoder_table / len(logs) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark the memory held per buffered event: web3's decoded
+AttributeDict with nested HexBytes against the slotted EventRecord.
+
+Run from the relay directory:
+
+    python benchmarks/bench_memory.py --events 1000000
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tracemalloc
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from records import EventRecord, address_bytes, checksum_address  # noqa: E402
+
+CONTRACT = '0xaBaBaBABaBaBAbABABAbABAbAbabAbaBAbaBaBAB'
+ARG_NAMES = ('from', 'to', 'value')
+
+
+def make_attribute_dict(i, rng, accounts):
+    """
+    A decoded Transfer event as processLog returns it
+    """
+    return AttributeDict.recursive({
+        'args': {'from': rng.choice(accounts), 'to': rng.choice(accounts), 'value': rng.getrandbits(100)},
+        'event': 'Transfer', 'logIndex': i % 300, 'transactionIndex': i % 100,
+        'transactionHash': HexBytes(rng.getrandbits(256).to_bytes(32, 'big')),
+        'address': checksum_address(CONTRACT),
+        'blockHash': HexBytes(rng.getrandbits(256).to_bytes(32, 'big')),
+        'blockNumber': 15000000 + i // 300})
+
+
+def make_event_record(i, rng, accounts):
+    """
+    The same event as the relay buffers it
+    """
+    return EventRecord('Transfer', ARG_NAMES, (rng.choice(accounts), rng.choice(accounts), rng.getrandbits(100)),
+                       address_bytes(CONTRACT), 15000000 + i // 300, rng.getrandbits(256).to_bytes(32, 'big'),
+                       rng.getrandbits(256).to_bytes(32, 'big'), i % 100, i % 300)
+
+
+def bytes_per_event(make_event, count, rng, accounts):
+    gc.collect()
+    tracemalloc.start()
+    events = [make_event(i, rng, accounts) for i in range(count)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del events
+    return current / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=1000000, help='the number of synthetic events buffered')
+    parser.add_argument('--accounts', type=int, default=5000, help='the number of distinct sender/recipients')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    accounts = [checksum_address(rng.getrandbits(160).to_bytes(20, 'big')) for _ in range(args.accounts)]
+    for name, make_event in (('AttributeDict', make_attribute_dict), ('EventRecord', make_event_record)):
+        size = bytes_per_event(make_event, args.events, rng, accounts)
+        print('{:<14} {:6.0f} bytes/event {:8.1f} MB total'.format(name, size, size * args.events / 1e6))
+
+
+if __name__ == '__main__':
+    main()
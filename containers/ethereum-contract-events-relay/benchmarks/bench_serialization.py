@@ -0,0 +1,86 @@
+"""
+Benchmark the per-event CPU cost of serializing event details: the
+relay's former Web3.toJSON round trip against the single-pass to_detail
+and dumps, with orjson when installed.
+
+Run from the relay directory:
+
+    python benchmarks/bench_serialization.py --events 20000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.datastructures import AttributeDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import serialization  # noqa: E402
+
+
+def make_events(count, rng):
+    """
+    Build synthetic decoded Transfer events as processLog returns them
+    """
+    def address():
+        return Web3.toChecksumAddress(rng.getrandbits(160).to_bytes(20, 'big'))
+
+    def hash32():
+        return HexBytes(rng.getrandbits(256).to_bytes(32, 'big'))
+
+    return [AttributeDict({
+        'args': AttributeDict({'from': address(), 'to': address(), 'value': rng.getrandbits(200),
+                               'ids': (1, 2, 3), 'ok': True}),
+        'event': 'Transfer', 'logIndex': i, 'transactionIndex': 3, 'transactionHash': hash32(),
+        'address': address(), 'blockHash': hash32(), 'blockNumber': 15000000}) for i in range(count)]
+
+
+def serialize_round_trip(event):
+    """
+    The former handle_event: encode, parse back with integers as strings,
+    encode again, and format the dict for the log line
+    """
+    detail = json.loads(Web3.toJSON(event), parse_int=str)
+    str(detail)
+    return json.dumps(detail)
+
+
+def serialize_single_pass(event):
+    return serialization.dumps(serialization.to_detail(event))
+
+
+def time_per_event(serialize, events):
+    started = time.process_time()
+    for event in events:
+        serialize(event)
+    return (time.process_time() - started) / len(events)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=20000, help='the number of synthetic events serialized')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    events = make_events(args.events, random.Random(args.seed))
+    for event in events[:200]:
+        assert json.loads(serialize_single_pass(event)) == json.loads(serialize_round_trip(event))
+
+    print('Web3.toJSON round trip   {:6.1f} us CPU/event'.format(
+        time_per_event(serialize_round_trip, events) * 1e6))
+    orjson = serialization.orjson
+    serialization.orjson = None
+    print('single pass, json        {:6.1f} us CPU/event'.format(
+        time_per_event(serialize_single_pass, events) * 1e6))
+    serialization.orjson = orjson
+    if orjson is not None:
+        print('single pass, orjson      {:6.1f} us CPU/event'.format(
+            time_per_event(serialize_single_pass, events) * 1e6))
+    else:
+        print('single pass, orjson      not installed')
+
+
+if __name__ == '__main__':
+    main()
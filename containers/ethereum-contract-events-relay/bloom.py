@@ -0,0 +1,99 @@
+import numpy as np
+from eth_utils import keccak, to_bytes
+
+
+def bloom_bits(value):
+    """The three (byte index, bit mask) positions an item sets in a 2048-bit
+    logs bloom
+
+    Parameters
+    ----------
+    value : bytes
+        An address or topic
+
+    Returns
+    -------
+    list<tuple>
+        The byte index into the 256-byte big-endian bloom and the mask of
+        the bit within that byte, for each of the item's three bits
+    """
+    value_hash = keccak(value)
+    positions = []
+    for i in (0, 2, 4):
+        bit = ((value_hash[i] << 8) | value_hash[i + 1]) & 2047
+        positions.append((255 - bit // 8, 1 << (bit % 8)))
+    return positions
+
+
+class LogsBloomFilter():
+
+    def __init__(self, addresses, topics):
+        """Initialise a LogsBloomFilter, which tests block header logsBloom
+        values for possible logs from any of the given contracts with any of
+        the given topic0 hashes. Blooms give false positives but never false
+        negatives, so a block that does not match holds no relevant logs.
+
+        Parameters
+        ----------
+        addresses : list<str>
+            The contract addresses
+        topics : list
+            The topic0 hashes, as bytes or hex strings
+        """
+        self.address_bits = [bloom_bits(to_bytes(hexstr=address)) for address in addresses]
+        self.topic_bits = [bloom_bits(topic if isinstance(topic, bytes) else to_bytes(hexstr=topic))
+                           for topic in topics]
+        self._address_index, self._address_mask = self._as_arrays(self.address_bits)
+        self._topic_index, self._topic_mask = self._as_arrays(self.topic_bits)
+
+    @staticmethod
+    def _as_arrays(items_bits):
+        index = np.array([[byte_index for byte_index, _ in bits] for bits in items_bits], dtype=np.intp)
+        mask = np.array([[mask for _, mask in bits] for bits in items_bits], dtype=np.uint8)
+        return index.reshape(-1, 3), mask.reshape(-1, 3)
+
+    @staticmethod
+    def _contains(bloom, bits):
+        return all(bloom[byte_index] & mask for byte_index, mask in bits)
+
+    def matches(self, bloom):
+        """Test a single logs bloom
+
+        Parameters
+        ----------
+        bloom : bytes
+            The 256-byte logsBloom of a block header
+
+        Returns
+        -------
+        bool
+            True if the block may hold a relevant log
+        """
+        return any(self._contains(bloom, bits) for bits in self.address_bits) and \
+            any(self._contains(bloom, bits) for bits in self.topic_bits)
+
+    def _matches_items(self, blooms, index, mask):
+        if not len(index):
+            return np.zeros(len(blooms), dtype=bool)
+        # (blocks, items, 3) bytes at each item's bit positions
+        selected = blooms[:, index]
+        return ((selected & mask) != 0).all(axis=2).any(axis=1)
+
+    def matches_many(self, blooms):
+        """Test many logs blooms in one vectorized pass
+
+        Parameters
+        ----------
+        blooms : list<bytes>
+            The 256-byte logsBloom of each block header
+
+        Returns
+        -------
+        numpy.ndarray
+            A boolean array, True where the block may hold a relevant log
+        """
+        if not blooms:
+            return np.zeros(0, dtype=bool)
+        blooms = np.frombuffer(b''.join(bytes(bloom) for bloom in blooms), dtype=np.uint8).reshape(-1, 256)
+        return self._matches_items(blooms, self._address_index, self._address_mask) & \
+            self._matches_items(blooms, self._topic_index, self._topic_mask)
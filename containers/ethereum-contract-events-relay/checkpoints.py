@@ -0,0 +1,184 @@
+import logging
+import sqlite3
+import threading
+import boto3
+
+
+class CheckpointStore():
+
+    def __init__(self, flush_interval=5):
+        """Initialise a CheckpointStore, which records the last fully
+        published block and log index per contract. Updates are buffered in
+        memory and written by a background thread, so checkpointing adds no
+        latency to publishing.
+
+        Parameters
+        ----------
+        flush_interval : int, optional
+            The number of seconds between writes of buffered checkpoints
+        """
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._thread.start()
+
+    def load(self, contract_address):
+        """Read the checkpoint of a contract
+
+        Parameters
+        ----------
+        contract_address : str
+            The address of the contract
+
+        Returns
+        -------
+        tuple
+            The (block_number, log_index) of the last published event, where
+            a log_index of None means the whole block was published, or None
+            if the contract has no checkpoint
+        """
+        raise NotImplementedError
+
+    def write(self, checkpoints):
+        """Persist a batch of checkpoints
+
+        Parameters
+        ----------
+        checkpoints : dict
+            Contract addresses to (block_number, log_index) tuples
+        """
+        raise NotImplementedError
+
+    def update(self, contract_address, block_number, log_index=None):
+        """
+        Buffer a new checkpoint for a contract. A log_index of None marks
+        the whole block as published.
+        """
+        with self._lock:
+            self._pending[contract_address] = (block_number, log_index)
+
+    def flush(self):
+        """
+        Write all buffered checkpoints
+        """
+        with self._lock:
+            checkpoints, self._pending = self._pending, {}
+        if checkpoints:
+            try:
+                self.write(checkpoints)
+            except Exception as e:
+                logging.error(e)
+                with self._lock:
+                    self._pending = {**checkpoints, **self._pending}
+
+    def _flush_periodically(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """
+        Stop the background thread and write any remaining checkpoints
+        """
+        self._stopped.set()
+        self._thread.join()
+        self.flush()
+
+
+class SQLiteCheckpointStore(CheckpointStore):
+
+    def __init__(self, path, flush_interval=5):
+        """Initialise a checkpoint store in a local SQLite database file
+
+        Parameters
+        ----------
+        path : str
+            The location of the database file
+        flush_interval : int, optional
+            The number of seconds between writes of buffered checkpoints
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS checkpoints ('
+                                 'contract_address TEXT PRIMARY KEY, '
+                                 'block_number INTEGER NOT NULL, '
+                                 'log_index INTEGER)')
+        self._connection.commit()
+        self._connection_lock = threading.Lock()
+        super().__init__(flush_interval)
+
+    def load(self, contract_address):
+        with self._connection_lock:
+            row = self._connection.execute(
+                'SELECT block_number, log_index FROM checkpoints WHERE contract_address = ?',
+                (contract_address,)).fetchone()
+        return tuple(row) if row else None
+
+    def write(self, checkpoints):
+        with self._connection_lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO checkpoints (contract_address, block_number, log_index) VALUES (?, ?, ?)',
+                [(address, block_number, log_index)
+                 for address, (block_number, log_index) in checkpoints.items()])
+
+
+class DynamoDBCheckpointStore(CheckpointStore):
+
+    def __init__(self, table_name, endpoint_url=None, flush_interval=5):
+        """Initialise a checkpoint store in an Amazon DynamoDB (or
+        DynamoDB-compatible) table with a 'contract_address' string hash key
+
+        Parameters
+        ----------
+        table_name : str
+            The name of the table
+        endpoint_url : str, optional
+            The URL of a DynamoDB-compatible endpoint
+        flush_interval : int, optional
+            The number of seconds between writes of buffered checkpoints
+        """
+        self.table = boto3.resource('dynamodb', endpoint_url=endpoint_url).Table(table_name)
+        super().__init__(flush_interval)
+
+    def load(self, contract_address):
+        item = self.table.get_item(Key={'contract_address': contract_address}, ConsistentRead=True).get('Item')
+        if item is None:
+            return None
+        log_index = item.get('log_index')
+        return int(item['block_number']), None if log_index is None else int(log_index)
+
+    def write(self, checkpoints):
+        with self.table.batch_writer(overwrite_by_pkeys=['contract_address']) as batch:
+            for address, (block_number, log_index) in checkpoints.items():
+                item = {'contract_address': address, 'block_number': block_number}
+                if log_index is not None:
+                    item['log_index'] = log_index
+                batch.put_item(Item=item)
+
+
+def create_checkpoint_store(url, endpoint_url=None):
+    """Create a checkpoint store from a configuration URL
+
+    Parameters
+    ----------
+    url : str
+        'sqlite:///<path>' for a local SQLite file (relative path, or
+        'sqlite:////<path>' for an absolute one), 'dynamodb://<table>' for a
+        DynamoDB table, or 'none' to disable checkpointing
+    endpoint_url : str, optional
+        The URL of a DynamoDB-compatible endpoint
+
+    Returns
+    -------
+    CheckpointStore
+        The checkpoint store, or None if disabled
+    """
+    if not url or url == 'none':
+        return None
+    scheme, _, location = url.partition('://')
+    if scheme == 'sqlite':
+        return SQLiteCheckpointStore(location[1:])
+    if scheme == 'dynamodb':
+        return DynamoDBCheckpointStore(location, endpoint_url=endpoint_url)
+    raise ValueError("Unknown checkpoint store {!r}".format(url))
@@ -0,0 +1,250 @@
+import json
+import re
+import numpy as np
+from eth_abi.decoding import TupleDecoder
+from eth_utils import event_abi_to_log_topic, to_bytes
+from web3._utils.abi import get_abi_input_names, map_abi_data
+from web3._utils.events import get_event_abi_types_for_decoding
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+from web3.exceptions import LogTopicError
+from records import EventRecord, checksum_address
+
+
+def _topic_decoder(abi_type, codec):
+    """A function decoding one 32-byte topic of the given ABI type. Common
+    types are decoded directly from the bytes; others, and topics whose
+    padding is invalid, use the ABI codec, which rejects bad padding.
+    """
+    decoder = codec._registry.get_decoder(abi_type)
+
+    def decode(topic):
+        return decoder(codec.stream_class(topic))
+    if abi_type == 'address':
+        return lambda topic: checksum_address(bytes(topic[12:])) if topic[:12] == bytes(12) else decode(topic)
+    if re.fullmatch(r'uint\d*', abi_type):
+        padding = 32 - int(abi_type[4:] or 256) // 8
+        return lambda topic: int.from_bytes(topic, 'big') if topic[:padding] == bytes(padding) else decode(topic)
+    if abi_type == 'bytes32':
+        return bytes
+    return decode
+
+
+def is_word_type(abi_type):
+    """Whether values of an ABI type are a single 32-byte word that can be
+    decoded column-wise by EventDecoder.decode_many
+    """
+    return abi_type in ('address', 'bool', 'bytes32') or re.fullmatch(r'uint\d*', abi_type) is not None
+
+
+def _decode_column(abi_type, column):
+    """Decode a column of 32-byte words of one ABI type
+
+    Parameters
+    ----------
+    abi_type : str
+        A type for which is_word_type holds
+    column : numpy.ndarray
+        An (n, 32) array of uint8 words
+
+    Returns
+    -------
+    tuple
+        The list of decoded values and a boolean array of the words whose
+        padding is invalid, which must be decoded by the ABI codec instead
+    """
+    if abi_type == 'address':
+        invalid = column[:, :12].any(axis=1)
+        raw = column[:, 12:].tobytes()
+        return [checksum_address(raw[i:i + 20]) for i in range(0, len(raw), 20)], invalid
+    if abi_type == 'bool':
+        invalid = column[:, :31].any(axis=1) | (column[:, 31] > 1)
+        return (column[:, 31] == 1).tolist(), invalid
+    if abi_type == 'bytes32':
+        raw = column.tobytes()
+        return [raw[i:i + 32] for i in range(0, len(raw), 32)], np.zeros(len(column), dtype=bool)
+    bits = int(abi_type[4:] or 256)
+    invalid = column[:, :32 - bits // 8].any(axis=1)
+    # Words fitting in 64 bits are converted in one pass, wider ones singly
+    wide = column[:, :24].any(axis=1)
+    values = np.ascontiguousarray(column[:, 24:]).view('>u8').ravel().tolist()
+    for i in np.flatnonzero(wide):
+        values[i] = int.from_bytes(column[i].tobytes(), 'big')
+    return values, invalid
+
+
+class EventDecoder():
+
+    def __init__(self, event_abi, codec):
+        """
+        Compile the decoding of raw logs for an ABI event: the topic and
+        data layouts, and the codecs for each type, are resolved once so
+        decoding a log only runs the codecs.
+
+        Parameters
+        ----------
+        event_abi : dict
+            The ABI definition of a non-anonymous event
+        codec : eth_abi.codec.ABICodec
+            The ABI codec of the Web3 instance
+        """
+        self.name = event_abi['name']
+        self.topic = event_abi_to_log_topic(event_abi)
+        topic_inputs = [i for i in event_abi['inputs'] if i['indexed']]
+        data_inputs = [i for i in event_abi['inputs'] if not i['indexed']]
+        self.topic_types = list(get_event_abi_types_for_decoding(topic_inputs))
+        self.data_types = list(get_event_abi_types_for_decoding(data_inputs))
+        self.topic_names = get_abi_input_names({'inputs': topic_inputs})
+        self.data_names = get_abi_input_names({'inputs': data_inputs})
+        self.arg_names = tuple(self.topic_names + self.data_names)
+        duplicate_names = set(self.topic_names).intersection(self.data_names)
+        if duplicate_names:
+            raise ValueError("Event {} has duplicated argument names {}".format(self.name, sorted(duplicate_names)))
+        self.topic_decoders = [_topic_decoder(abi_type, codec) for abi_type in self.topic_types]
+        self.codec = codec
+        self.data_decoder = TupleDecoder(
+            decoders=tuple(codec._registry.get_decoder(abi_type) for abi_type in self.data_types))
+        # Flat addresses are checksummed directly; addresses nested in
+        # arrays or tuples go through web3's normalizers
+        self.data_addresses = [i for i, abi_type in enumerate(self.data_types) if abi_type == 'address']
+        self.normalize_data = any('address' in abi_type and abi_type != 'address' for abi_type in self.data_types)
+        self.columnar = all(is_word_type(abi_type) for abi_type in self.topic_types + self.data_types)
+
+    def decode_args(self, log):
+        """Decode the event arguments of a raw log
+
+        Parameters
+        ----------
+        log : dict
+            A log as returned by eth_getLogs
+
+        Returns
+        -------
+        tuple
+            The event argument values, in the order of arg_names
+        """
+        topics = log['topics']
+        if len(topics) != len(self.topic_decoders) + 1:
+            raise LogTopicError("Expected {} log topics. Got {}".format(len(self.topic_decoders), len(topics) - 1))
+        args = tuple(decode(topic) for decode, topic in zip(self.topic_decoders, topics[1:]))
+        if not self.data_names:
+            return args
+        data = log['data']
+        if isinstance(data, str):
+            data = to_bytes(hexstr=data)
+        values = self.data_decoder(self.codec.stream_class(data))
+        if self.normalize_data:
+            values = map_abi_data(BASE_RETURN_NORMALIZERS, self.data_types, values)
+        elif self.data_addresses:
+            values = list(values)
+            for i in self.data_addresses:
+                values[i] = checksum_address(values[i])
+        return args + tuple(values)
+
+    def decode(self, log):
+        """Decode a raw log into a record reading as the event data web3's
+        processLog returns
+
+        Parameters
+        ----------
+        log : dict
+            A log as returned by eth_getLogs
+
+        Returns
+        -------
+        EventRecord
+            The event with its decoded args
+        """
+        return EventRecord.from_log(log, self.name, self.arg_names, self.decode_args(log))
+
+    def decode_many(self, logs, min_batch=16):
+        """Decode raw logs of this event in one vectorized pass
+
+        When every argument is a single 32-byte word, the argument topics and
+        data of all logs are laid out in one contiguous buffer and each
+        argument column is decoded at once. Events with dynamic types, small
+        batches and malformed logs use the scalar decoder.
+
+        Parameters
+        ----------
+        logs : list<dict>
+            Logs with this event's topic0, as returned by eth_getLogs
+        min_batch : int, optional
+            The fewest logs worth decoding column-wise
+
+        Returns
+        -------
+        list<EventRecord>
+            The decoded events, in the order of the logs
+        """
+        if not self.columnar or len(logs) < min_batch:
+            return [self.decode(log) for log in logs]
+        events = [None] * len(logs)
+        data_size = 32 * len(self.data_types)
+        rows = []
+        indices = []
+        for i, log in enumerate(logs):
+            data = log['data']
+            if isinstance(data, str):
+                data = to_bytes(hexstr=data)
+            if len(log['topics']) != len(self.topic_types) + 1 or len(data) != data_size:
+                events[i] = self.decode(log)
+                continue
+            rows.append(b''.join(log['topics'][1:]) + data)
+            indices.append(i)
+        if not rows:
+            return events
+        words = np.frombuffer(b''.join(rows), dtype=np.uint8).reshape(
+            len(rows), len(self.topic_types) + len(self.data_types), 32)
+        columns = []
+        invalid = np.zeros(len(rows), dtype=bool)
+        for position, abi_type in enumerate(self.topic_types + self.data_types):
+            values, column_invalid = _decode_column(abi_type, words[:, position])
+            columns.append(values)
+            invalid |= column_invalid
+        for row, (i, values) in enumerate(zip(indices, zip(*columns))):
+            events[i] = self.decode(logs[i]) if invalid[row] \
+                else EventRecord.from_log(logs[i], self.name, self.arg_names, values)
+        return events
+
+
+class DecoderTable():
+
+    def __init__(self, codec):
+        """
+        Compiled event decoders per contract, keyed by topic0. Contracts
+        sharing an event definition share its decoder.
+
+        Parameters
+        ----------
+        codec : eth_abi.codec.ABICodec
+            The ABI codec of the Web3 instance
+        """
+        self.codec = codec
+        self.decoders = {}
+        self._compiled = {}
+
+    def add(self, contract_address, event_abi):
+        """Compile a decoder for an event of a contract
+
+        Parameters
+        ----------
+        contract_address : str
+            The checksummed contract address
+        event_abi : dict
+            The ABI definition of a non-anonymous event
+
+        Returns
+        -------
+        EventDecoder
+            The event's decoder
+        """
+        layout = json.dumps([event_abi['name'], event_abi['inputs']], sort_keys=True)
+        if layout not in self._compiled:
+            self._compiled[layout] = EventDecoder(event_abi, self.codec)
+        decoder = self._compiled[layout]
+        self.decoders.setdefault(contract_address, {})[decoder.topic] = decoder
+        return decoder
+
+    def get(self, contract_address, topic):
+        """The decoder for a contract's event with the given topic0, or None"""
+        return self.decoders.get(contract_address, {}).get(topic)
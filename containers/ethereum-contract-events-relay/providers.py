@@ -0,0 +1,319 @@
+import collections
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from web3.providers.base import JSONBaseProvider
+
+# JSON-RPC error codes and messages of a node failing to serve a request,
+# e.g. a lagging node missing a block or state, which another node may serve
+NODE_FAILURE_CODES = frozenset([-32603])
+NODE_FAILURE_MESSAGES = (
+    'header not found',
+    'block not found',
+    'unknown block',
+    'missing trie node',
+    'internal error',
+)
+
+
+# Node-side filters only exist on the node that created them, so calls
+# taking a filter id are pinned to that node
+FILTER_CREATE_METHODS = frozenset(['eth_newFilter', 'eth_newBlockFilter', 'eth_newPendingTransactionFilter'])
+FILTER_METHODS = frozenset(['eth_getFilterChanges', 'eth_getFilterLogs', 'eth_uninstallFilter'])
+
+
+def node_failure(response):
+    """The error of a JSON-RPC response, or of any response in a batch,
+    that marks the node rather than the request as at fault
+
+    Parameters
+    ----------
+    response : dict or list
+        A JSON-RPC response, or a batch of them
+
+    Returns
+    -------
+    dict
+        The error, or None if the node served the request
+    """
+    for item in response if isinstance(response, list) else [response]:
+        error = item.get('error') if isinstance(item, dict) else None
+        if not isinstance(error, dict):
+            continue
+        message = str(error.get('message', '')).lower()
+        if error.get('code') in NODE_FAILURE_CODES or any(text in message for text in NODE_FAILURE_MESSAGES):
+            return error
+    return None
+
+
+class NodeFailure(Exception):
+
+    def __init__(self, response, error):
+        """A JSON-RPC error response marking a node as failing
+
+        Parameters
+        ----------
+        response : dict or list
+            The response, returned as is if no node serves the request
+        error : dict
+            The JSON-RPC error
+        """
+        super().__init__(error)
+        self.response = response
+
+
+def _result(future):
+    """The result of a future, or the response of a node failure"""
+    try:
+        return future.result()
+    except NodeFailure as e:
+        return e.response
+
+
+class NodeStats():
+    __slots__ = ('url', 'latency', 'method_latencies', 'outcomes', 'head')
+
+    def __init__(self, url, window=100):
+        """Initialise the rolling statistics of a node
+
+        Parameters
+        ----------
+        url : str
+            The URL of the node
+        window : int, optional
+            The number of recent requests the statistics cover
+        """
+        self.url = url
+        self.latency = None
+        self.method_latencies = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self.outcomes = collections.deque(maxlen=window)
+        self.head = None
+
+    def record(self, method, latency, error=False):
+        """
+        Record the outcome of a request. The latency is an exponentially
+        weighted moving average over successful requests.
+        """
+        self.outcomes.append(1 if error else 0)
+        if error:
+            return
+        self.method_latencies[method].append(latency)
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+
+    def p95(self, method):
+        """
+        The 95th percentile latency of recent requests for a method, or
+        None if there are too few to tell
+        """
+        latencies = self.method_latencies.get(method)
+        if not latencies or len(latencies) < 20:
+            return None
+        return sorted(latencies)[int(len(latencies) * 0.95) - 1]
+
+    @property
+    def error_rate(self):
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def as_dict(self):
+        return {'url': self.url,
+                'latency': None if self.latency is None else round(self.latency, 4),
+                'error_rate': round(self.error_rate, 3),
+                'head': self.head}
+
+
+class ProviderPool(JSONBaseProvider):
+
+    def __init__(self,
+                 providers,
+                 hedge_methods=('eth_getLogs',),
+                 default_hedge_delay=1.0,
+                 min_hedge_delay=0.05,
+                 max_lag=1):
+        """Initialise a ProviderPool, a Web3 provider that routes each
+        request to the best of several nodes by rolling latency, error rate
+        and head height, and fails over to the next node on errors. Calls
+        on a node-side filter go to the node that created it.
+
+        Parameters
+        ----------
+        providers : list<rpc.BatchingHTTPProvider>
+            The providers of each node
+        hedge_methods : tuple<str>, optional
+            Methods for which a second node is also asked when the first is
+            slower than its own p95 latency, taking whichever answers first
+        default_hedge_delay : float, optional
+            The number of seconds to wait before hedging until a node has
+            enough latency samples
+        min_hedge_delay : float, optional
+            The smallest number of seconds to wait before hedging
+        max_lag : int, optional
+            The number of blocks a node may be behind the highest head seen
+            and still be routed requests
+        """
+        super().__init__()
+        self.providers = list(providers)
+        self.stats = [NodeStats(provider.endpoint_uri) for provider in self.providers]
+        self.hedge_methods = set(hedge_methods)
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.max_lag = max_lag
+        self._executor = ThreadPoolExecutor(max_workers=4 * len(self.providers))
+        self._filter_nodes = {}
+
+    def __str__(self):
+        return "Provider pool {}".format([stats.url for stats in self.stats])
+
+    def ranked(self):
+        """
+        Node indices ordered best first. Nodes lagging the highest head seen
+        by more than max_lag blocks come last; the rest are ordered by
+        latency penalised by error rate, with untried nodes first and nodes
+        that have never succeeded last. The eth_blockNumber fan-out keeps
+        probing every node, so recovered nodes climb back up.
+        """
+        heads = [stats.head for stats in self.stats if stats.head is not None]
+        max_head = max(heads) if heads else None
+
+        def score(index):
+            stats = self.stats[index]
+            lagging = max_head is not None and stats.head is not None and stats.head < max_head - self.max_lag
+            if stats.latency is None:
+                latency = 0.0 if not stats.outcomes else float('inf')
+            else:
+                latency = stats.latency
+            return lagging, latency * (1 + 10 * stats.error_rate)
+        return sorted(range(len(self.providers)), key=score)
+
+    def _timed(self, index, method, call):
+        """
+        Make a call to a node, recording its latency and outcome. Error
+        responses marking the node as failing raise NodeFailure.
+        """
+        started = time.monotonic()
+        try:
+            response = call(self.providers[index])
+        except Exception:
+            self.stats[index].record(method, time.monotonic() - started, error=True)
+            raise
+        error = node_failure(response)
+        if error is not None:
+            self.stats[index].record(method, time.monotonic() - started, error=True)
+            raise NodeFailure(response, error)
+        self.stats[index].record(method, time.monotonic() - started)
+        return response
+
+    def _failover(self, ranked, method, call):
+        """
+        Call each node in turn until one succeeds. If every node fails with
+        an error response, the last response is returned for web3 to raise.
+        """
+        error = None
+        for index in ranked:
+            try:
+                return self._timed(index, method, call)
+            except Exception as e:
+                logging.warning(json.dumps({"node_error": self.stats[index].url, "method": method,
+                                            "error": str(e)}))
+                error = e
+        if isinstance(error, NodeFailure):
+            return error.response
+        raise error
+
+    def _hedged(self, ranked, method, call):
+        """
+        Ask the best node, and the second best too if the first is slower
+        than its p95 latency, returning the first successful response
+        """
+        p95 = self.stats[ranked[0]].p95(method)
+        delay = self.default_hedge_delay if p95 is None else max(p95, self.min_hedge_delay)
+        futures = [self._executor.submit(self._timed, ranked[0], method, call)]
+        done, _ = wait(futures, timeout=delay)
+        if not done or futures[0].exception() is not None:
+            futures.append(self._executor.submit(self._timed, ranked[1], method, call))
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+        return self._failover(ranked[2:], method, call) if len(ranked) > 2 else _result(futures[-1])
+
+    def _block_number(self, params):
+        """
+        Ask every node for its head. The result is the lowest head among
+        nodes within max_lag of the highest, so every node requests are
+        routed to already has the block.
+        """
+        futures = [self._executor.submit(self._timed, index, 'eth_blockNumber',
+                                         lambda provider: provider.make_request('eth_blockNumber', params))
+                   for index in range(len(self.providers))]
+        responses = []
+        for index, future in enumerate(futures):
+            try:
+                response = future.result()
+            except Exception as e:
+                logging.warning(json.dumps({"node_error": self.stats[index].url, "method": 'eth_blockNumber',
+                                            "error": str(e)}))
+                continue
+            if 'result' in response:
+                self.stats[index].head = int(response['result'], 16)
+                responses.append(response)
+        if not responses:
+            return _result(futures[0])
+        max_head = max(int(response['result'], 16) for response in responses)
+        return min((response for response in responses if int(response['result'], 16) >= max_head - self.max_lag),
+                   key=lambda response: int(response['result'], 16))
+
+    def _create_filter(self, ranked, method, params):
+        """
+        Create a filter on the best node that succeeds, recording the node
+        so that later calls on the filter are routed to it
+        """
+        def call(provider):
+            response = provider.make_request(method, params)
+            if isinstance(response.get('result'), str):
+                self._filter_nodes[response['result']] = self.providers.index(provider)
+            return response
+        return self._failover(ranked, method, call)
+
+    def _filter_call(self, index, method, params):
+        """
+        Make a call on a filter to the node that created it, without
+        failover since no other node knows the filter. A filter the node
+        has dropped or uninstalled is forgotten.
+        """
+        response = self._failover([index], method, lambda provider: provider.make_request(method, params))
+        error = response.get('error') or ''
+        message = str(error.get('message', '') if isinstance(error, dict) else error).lower()
+        if method == 'eth_uninstallFilter' or 'filter not found' in message:
+            self._filter_nodes.pop(params[0], None)
+        return response
+
+    def make_request(self, method, params):
+        if method == 'eth_blockNumber' and len(self.providers) > 1:
+            return self._block_number(params)
+        if method in FILTER_METHODS and params and params[0] in self._filter_nodes:
+            return self._filter_call(self._filter_nodes[params[0]], method, params)
+        ranked = self.ranked()
+        if method in FILTER_CREATE_METHODS:
+            return self._create_filter(ranked, method, params)
+
+        def call(provider):
+            return provider.make_request(method, params)
+        if method in self.hedge_methods and len(ranked) > 1:
+            return self._hedged(ranked, method, call)
+        return self._failover(ranked, method, call)
+
+    def make_batch_request(self, requests):
+        """
+        Send a list of requests as JSON-RPC batches to the best node,
+        failing over to the others
+        """
+        return self._failover(self.ranked(), 'batch', lambda provider: provider.make_batch_request(requests))
+
+    def node_stats(self):
+        """
+        Report the rolling statistics of every node
+        """
+        return [stats.as_dict() for stats in self.stats]
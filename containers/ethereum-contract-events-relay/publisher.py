@@ -0,0 +1,557 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future
+from botocore.exceptions import ConnectionError as BotoConnectionError, HTTPClientError
+
+# PutEvents limits
+MAX_ENTRIES = 10
+MAX_BYTES = 256 * 1024
+
+# Error codes of throttling and transient service failures, worth retrying.
+# Any other error code marks an entry that will never be accepted.
+RETRYABLE_ERROR_CODES = frozenset([
+    'ThrottlingException', 'Throttling', 'TooManyRequestsException', 'RequestLimitExceeded',
+    'ProvisionedThroughputExceededException', 'LimitExceededException', 'KMSThrottlingException',
+    'InternalFailure', 'InternalException', 'InternalError', 'InternalServerError',
+    'ServiceUnavailable', 'ServiceUnavailableException', 'RequestTimeout', 'RequestTimeoutException'])
+
+
+class PublishError(Exception):
+
+    def __init__(self, code, message=None):
+        """An entry rejected by the event bus
+
+        Parameters
+        ----------
+        code : str
+            The error code of the entry
+        message : str, optional
+            The error message of the entry
+        """
+        super().__init__('{}: {}'.format(code, message))
+        self.code = code
+        self.message = message
+
+
+def error_code(error):
+    """The error code of a failed put
+
+    Parameters
+    ----------
+    error : Exception
+        A PublishError, a botocore ClientError or any other exception
+
+    Returns
+    -------
+    str
+        The entry or service error code, or the exception class name
+    """
+    if isinstance(error, PublishError):
+        return error.code
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict) and 'Error' in response:
+        return response['Error'].get('Code')
+    return type(error).__name__
+
+
+def is_retryable(error):
+    """Whether a failed put may succeed if retried: throttling, transient
+    service failures, and connection errors and timeouts reaching the
+    endpoint are retryable, while rejected entries are poison
+    """
+    if isinstance(error, (HTTPClientError, BotoConnectionError, ConnectionError, TimeoutError)):
+        return True
+    return error_code(error) in RETRYABLE_ERROR_CODES
+
+
+class DeadLetterFile():
+
+    def __init__(self, path):
+        """Initialise a DeadLetterFile, which appends entries that could not
+        be published to a JSON lines file so they can be re-driven later
+
+        Parameters
+        ----------
+        path : str
+            The path of the dead letter file
+        """
+        self.path = path
+        self.redrive_path = path + '.redrive'
+        self._lock = threading.Lock()
+
+    def __call__(self, entry, error, attempts, sink=None):
+        """Record a dead-lettered entry durably
+
+        Parameters
+        ----------
+        entry : dict
+            The entry that was not published
+        error : Exception
+            The last error putting it
+        attempts : int
+            The number of puts attempted
+        sink : str, optional
+            The name of the sink it was not published to
+        """
+        line = json.dumps({'entry': entry,
+                           'sink': sink,
+                           'error_code': error_code(error),
+                           'error': str(error),
+                           'attempts': attempts,
+                           'time': time.time()})
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def redrive(self, submit):
+        """Resubmit every dead-lettered entry. The file is moved aside while
+        its entries are resubmitted, so those failing again are dead-lettered
+        afresh, and a re-drive interrupted by a crash resumes next time.
+
+        Parameters
+        ----------
+        submit : callable
+            Submits an entry to the named sink, or every sink if None,
+            returning a future of its put
+
+        Returns
+        -------
+        tuple
+            The number of entries re-driven, and of those that failed again
+        """
+        with self._lock:
+            if os.path.exists(self.path):
+                with open(self.path) as f, open(self.redrive_path, 'a') as redrive:
+                    redrive.write(f.read())
+                os.remove(self.path)
+        if not os.path.exists(self.redrive_path):
+            return 0, 0
+        with open(self.redrive_path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        futures = [submit(record['entry'], record.get('sink')) for record in records]
+        failed = sum(future.exception() is not None for future in futures)
+        os.remove(self.redrive_path)
+        return len(records), failed
+
+
+def entry_size(entry):
+    """The size of a PutEvents entry as EventBridge counts it against the
+    256KB request limit
+
+    Parameters
+    ----------
+    entry : dict
+        A PutEvents request entry
+
+    Returns
+    -------
+    int
+        The size in bytes
+    """
+    size = 14 if entry.get('Time') is not None else 0
+    for key in ('Source', 'DetailType', 'Detail'):
+        if entry.get(key):
+            size += len(entry[key].encode('utf-8'))
+    for resource in entry.get('Resources', []):
+        size += len(resource.encode('utf-8'))
+    return size
+
+
+class BatchPublisher():
+
+    def __init__(self,
+                 put_batch,
+                 workers=4,
+                 max_queued=10000,
+                 max_entries=MAX_ENTRIES,
+                 max_bytes=MAX_BYTES,
+                 max_entry_bytes=None,
+                 linger=0.05,
+                 size=entry_size,
+                 max_attempts=8,
+                 base_backoff=0.1,
+                 max_backoff=20,
+                 dead_letter=None):
+        """Initialise a BatchPublisher, which queues entries in a bounded
+        queue and has a pool of workers put them in batches, decoupling
+        ingestion from delivery
+
+        Each worker takes a batch from the queue, put as soon as it holds
+        max_entries, when the next entry would take it over max_bytes, or
+        linger seconds after its first entry was taken, so publishing adds
+        at most linger seconds of latency. When the queue is full, submit
+        blocks until the workers catch up.
+
+        Entries failing with a retryable error are requeued on their own
+        after a jittered exponential backoff, while the rest of their batch
+        completes. Poison entries, and those still failing after
+        max_attempts, are dead-lettered.
+
+        Parameters
+        ----------
+        put_batch : callable
+            Puts a list of entries, returning a result per entry. Results
+            with an 'ErrorCode' mark entries that were rejected.
+        workers : int, optional
+            The number of workers, and so of batches in flight at once
+        max_queued : int, optional
+            The most entries waiting to be put before submit blocks
+        max_entries : int, optional
+            The most entries put in one call
+        max_bytes : int, optional
+            The largest total entry size put in one call
+        max_entry_bytes : int, optional
+            The largest size of a single entry, max_bytes by default
+        linger : float, optional
+            The longest number of seconds an entry waits for its batch to fill
+        size : callable, optional
+            Computes the size of an entry
+        max_attempts : int, optional
+            The most puts attempted for an entry, or None to retry retryable
+            errors indefinitely
+        base_backoff : float, optional
+            The backoff in seconds before the first retry, doubling for each
+            further retry up to max_backoff, of which a random fraction is
+            waited
+        max_backoff : float, optional
+            The longest backoff in seconds
+        dead_letter : callable, optional
+            Called with each dead-lettered entry, its last error and the
+            number of attempts, e.g. a DeadLetterFile
+        """
+        self.put_batch = put_batch
+        self.max_queued = max_queued
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes or max_bytes
+        self.linger = linger
+        self.size = size
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.dead_letter = dead_letter
+        self.retries = 0
+        self.dead_lettered = 0
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        self._closed = False
+        # Retries waiting out their backoff, as (due time, sequence, items)
+        self._retry_heap = []
+        self._retry_sequence = itertools.count()
+        self._retry_condition = threading.Condition()
+        self._retry_thread = threading.Thread(target=self._run_retries, daemon=True)
+        self._retry_thread.start()
+        self._reset_stats()
+        self.put_calls = 0
+        self.entries_put = 0
+        self._workers = [threading.Thread(target=self._run, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def _reset_stats(self):
+        """
+        Start a new interval of queue statistics
+        """
+        self._max_depth = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+        self._max_wait = 0.0
+        self._blocked_seconds = 0.0
+        self._put_seconds = 0.0
+        self._interval_puts = 0
+
+    def submit(self, entry):
+        """Queue an entry for the next batch, blocking while the queue is full
+
+        Parameters
+        ----------
+        entry : dict
+            The entry to put
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Resolves to the entry's result once its batch is put, or fails
+            with PublishError if the entry was rejected
+        """
+        future = Future()
+        size = self.size(entry)
+        if size > self.max_entry_bytes:
+            future.set_exception(ValueError("Entry of {} bytes exceeds the {} byte limit".format(
+                size, self.max_entry_bytes)))
+            return future
+        started = time.monotonic()
+        try:
+            self._queue.put_nowait((entry, size, future, started, 0))
+        except queue.Full:
+            self._queue.put((entry, size, future, started, 0))
+            with self._lock:
+                self._blocked_seconds += time.monotonic() - started
+        with self._lock:
+            self._max_depth = max(self._max_depth, self._queue.qsize())
+        return future
+
+    def backlogged(self):
+        """
+        Whether the queue is at least half full, so ingestion should pause
+        """
+        return self._queue.qsize() >= self.max_queued // 2
+
+    def _next_batch(self, carry):
+        """
+        Wait for the next batch to fill, or its linger time to pass
+
+        Parameters
+        ----------
+        carry : tuple
+            An item taken from the queue that did not fit the worker's
+            previous batch, or None
+
+        Returns
+        -------
+        tuple
+            The batch of (entry, size, future, queued time, attempts) items,
+            the item carried over to the next batch, and whether the
+            publisher was closed
+        """
+        item = carry if carry is not None else self._queue.get()
+        batch = []
+        batch_size = 0
+        deadline = time.monotonic() + self.linger
+        while item is not None:
+            if batch_size + item[1] > self.max_bytes:
+                return batch, item, False
+            batch.append(item)
+            batch_size += item[1]
+            if len(batch) >= self.max_entries:
+                return batch, None, False
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                return batch, None, False
+        return batch, None, True
+
+    def _run(self):
+        """
+        Form and put batches until closed
+        """
+        carry = None
+        while True:
+            batch, carry, closed = self._next_batch(carry)
+            if batch:
+                self._put(batch)
+            if closed:
+                return
+
+    def _put(self, batch):
+        """
+        Put a batch and resolve the future of each entry with its result.
+        Failed entries are retried or dead-lettered.
+        """
+        started = time.monotonic()
+        with self._lock:
+            for _, _, _, queued, _ in batch:
+                self._waits += 1
+                self._wait_seconds += started - queued
+                self._max_wait = max(self._max_wait, started - queued)
+        try:
+            results = self.put_batch([item[0] for item in batch])
+        except Exception as e:
+            self._handle_failures([(item, e) for item in batch])
+            return
+        finally:
+            with self._lock:
+                self._put_seconds += time.monotonic() - started
+                self._interval_puts += 1
+        with self._lock:
+            self.put_calls += 1
+            self.entries_put += len(batch)
+        failures = []
+        for item, result in zip(batch, results):
+            if result.get('ErrorCode'):
+                failures.append((item, PublishError(result['ErrorCode'], result.get('ErrorMessage'))))
+            else:
+                item[2].set_result(result)
+        if failures:
+            self._handle_failures(failures)
+
+    def _handle_failures(self, failures):
+        """
+        Schedule the retryable failed entries to be requeued after a
+        jittered backoff, and dead-letter the others
+        """
+        retries = []
+        for (entry, size, future, queued, attempts), error in failures:
+            attempts += 1
+            if is_retryable(error) and (self.max_attempts is None or attempts < self.max_attempts):
+                retries.append((entry, size, future, queued, attempts))
+                continue
+            with self._lock:
+                self.dead_lettered += 1
+            logging.error(json.dumps({"dead_letter": error_code(error), "attempts": attempts}))
+            if self.dead_letter is not None:
+                try:
+                    self.dead_letter(entry, error, attempts)
+                except Exception as e:
+                    logging.error(e)
+            future.set_exception(error)
+        if not retries:
+            return
+        with self._lock:
+            self.retries += len(retries)
+        attempts = max(item[4] for item in retries)
+        backoff = min(self.max_backoff, self.base_backoff * 2 ** min(attempts - 1, 32))
+        with self._retry_condition:
+            heapq.heappush(self._retry_heap,
+                           (time.monotonic() + random.uniform(0, backoff), next(self._retry_sequence), retries))
+            self._retry_condition.notify()
+
+    def _run_retries(self):
+        """
+        Requeue retried entries once their backoff has passed, until closed.
+        A single thread waits out every backoff, however many entries are
+        retrying during an outage.
+        """
+        while True:
+            with self._retry_condition:
+                while not self._closed and (not self._retry_heap or self._retry_heap[0][0] > time.monotonic()):
+                    timeout = self._retry_heap[0][0] - time.monotonic() if self._retry_heap else None
+                    self._retry_condition.wait(timeout)
+                if self._closed:
+                    return
+                _, _, items = heapq.heappop(self._retry_heap)
+            self._requeue(items)
+
+    def _requeue(self, items):
+        """
+        Queue retried entries again
+        """
+        for entry, size, future, _, attempts in items:
+            self._queue.put((entry, size, future, time.monotonic(), attempts))
+
+    def stats(self):
+        """
+        Report the put calls, entries put, retries and dead-lettered entries
+        so far, and for the interval since the last report the queue depth,
+        how long entries waited in the queue, how long submits were blocked
+        by a full queue and the mean put latency
+        """
+        with self._lock:
+            stats = {'put_calls': self.put_calls,
+                     'entries_put': self.entries_put,
+                     'retries': self.retries,
+                     'dead_lettered': self.dead_lettered,
+                     'queue_depth': self._queue.qsize(),
+                     'max_queue_depth': self._max_depth,
+                     'mean_wait_seconds': self._wait_seconds / self._waits if self._waits else 0.0,
+                     'max_wait_seconds': self._max_wait,
+                     'blocked_seconds': self._blocked_seconds,
+                     'mean_put_seconds': self._put_seconds / self._interval_puts if self._interval_puts else 0.0}
+            self._reset_stats()
+        return stats
+
+    def close(self):
+        """
+        Put the entries still queued and stop the workers. Entries waiting
+        to be retried are abandoned.
+        """
+        with self._retry_condition:
+            self._closed = True
+            self._retry_condition.notify()
+        self._retry_thread.join()
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+
+def _all_of(futures):
+    """A future resolved once every one of several futures is done, with
+    their results, or failing with the first of their errors
+    """
+    combined = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            combined.set_exception(errors[0])
+        else:
+            combined.set_result([future.result() for future in futures])
+
+    for future in futures:
+        future.add_done_callback(done)
+    return combined
+
+
+class FanOutPublisher():
+
+    def __init__(self, publishers):
+        """Initialise a FanOutPublisher, which submits each entry to the
+        publisher of every sink. Each sink batches, retries and
+        dead-letters independently, with its own workers, so sinks are put
+        concurrently; a sink whose queue is full holds back submits to all.
+
+        Parameters
+        ----------
+        publishers : dict
+            Sink names to their BatchPublisher
+        """
+        self.publishers = publishers
+
+    def submit(self, entry, sink=None):
+        """Queue an entry for every sink
+
+        Parameters
+        ----------
+        entry : dict
+            The entry to put
+        sink : str, optional
+            The name of a single sink to put the entry to. Entries for a
+            sink no longer configured go to every sink.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Resolves to the results of every sink once the entry is put to
+            all of them, or fails with the first error
+        """
+        publishers = list(self.publishers.values())
+        if sink in self.publishers:
+            publishers = [self.publishers[sink]]
+        if len(publishers) == 1:
+            return publishers[0].submit(entry)
+        return _all_of([publisher.submit(entry) for publisher in publishers])
+
+    def backlogged(self):
+        """
+        Whether the queue of any sink is at least half full
+        """
+        return any(publisher.backlogged() for publisher in self.publishers.values())
+
+    def stats(self):
+        """
+        Report the publishing statistics of each sink
+        """
+        return {name: publisher.stats() for name, publisher in self.publishers.items()}
+
+    def close(self):
+        """
+        Put the entries still queued for every sink and stop their workers
+        """
+        for publisher in self.publishers.values():
+            publisher.close()
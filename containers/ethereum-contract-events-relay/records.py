@@ -0,0 +1,143 @@
+import functools
+from collections.abc import Mapping
+from eth_utils import to_bytes, to_checksum_address
+
+
+@functools.lru_cache(maxsize=65536)
+def address_bytes(address):
+    """The raw 20 bytes of a hex address, cached so that records of the same
+    contract share one bytes object
+    """
+    return to_bytes(hexstr=address)
+
+
+@functools.lru_cache(maxsize=65536)
+def checksum_address(value):
+    """Checksum a 20-byte address, caching the result since the same
+    addresses recur across many logs
+
+    Parameters
+    ----------
+    value : bytes or str
+        The raw or hex encoded address
+
+    Returns
+    -------
+    str
+        The checksummed address
+    """
+    return to_checksum_address(value)
+
+
+class EventRecord(Mapping):
+
+    __slots__ = ('event', 'arg_names', 'arg_values', 'address', 'block_number', 'block_hash',
+                 'transaction_hash', 'transaction_index', 'log_index')
+
+    # The keys of web3's decoded event data, in its order
+    KEYS = ('args', 'event', 'logIndex', 'transactionIndex', 'transactionHash', 'address', 'blockHash',
+            'blockNumber')
+
+    def __init__(self, event, arg_names, arg_values, address, block_number, block_hash, transaction_hash,
+                 transaction_index, log_index):
+        """
+        A decoded event held compactly while it is buffered between the
+        decode and publish stages: hashes and the contract address are raw
+        bytes, indices ints, and argument names are shared by all records
+        of an event. It reads as the mapping web3's processLog returns, so
+        it serializes to the same JSON.
+
+        Parameters
+        ----------
+        event : str
+            The event name
+        arg_names : tuple<str>
+            The argument names, shared by the event's decoder
+        arg_values : tuple
+            The decoded argument values
+        address : bytes
+            The raw contract address
+        block_number : int
+        block_hash : bytes
+        transaction_hash : bytes
+        transaction_index : int
+        log_index : int
+        """
+        self.event = event
+        self.arg_names = arg_names
+        self.arg_values = arg_values
+        self.address = address
+        self.block_number = block_number
+        self.block_hash = block_hash
+        self.transaction_hash = transaction_hash
+        self.transaction_index = transaction_index
+        self.log_index = log_index
+
+    @classmethod
+    def from_log(cls, log, event, arg_names, arg_values):
+        """Build a record from a raw log and its decoded arguments
+
+        Parameters
+        ----------
+        log : dict
+            A log as returned by eth_getLogs
+        event : str
+            The event name
+        arg_names : tuple<str>
+            The argument names
+        arg_values : tuple
+            The decoded argument values
+
+        Returns
+        -------
+        EventRecord
+        """
+        return cls(event, arg_names, arg_values, address_bytes(log['address']), log['blockNumber'],
+                   bytes(log['blockHash']), bytes(log['transactionHash']), log['transactionIndex'],
+                   log['logIndex'])
+
+    @classmethod
+    def from_event(cls, event):
+        """Build a record from decoded event data, such as web3 filters
+        return
+
+        Parameters
+        ----------
+        event : Mapping
+            The decoded event
+
+        Returns
+        -------
+        EventRecord
+        """
+        if isinstance(event, cls):
+            return event
+        return cls.from_log(event, event['event'], tuple(event['args']), tuple(event['args'].values()))
+
+    def __getitem__(self, key):
+        if key == 'args':
+            return dict(zip(self.arg_names, self.arg_values))
+        if key == 'event':
+            return self.event
+        if key == 'logIndex':
+            return self.log_index
+        if key == 'transactionIndex':
+            return self.transaction_index
+        if key == 'transactionHash':
+            return self.transaction_hash
+        if key == 'address':
+            return checksum_address(self.address)
+        if key == 'blockHash':
+            return self.block_hash
+        if key == 'blockNumber':
+            return self.block_number
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def __repr__(self):
+        return 'EventRecord({!r})'.format(dict(self))
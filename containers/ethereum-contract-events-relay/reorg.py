@@ -0,0 +1,143 @@
+import collections
+import json
+import logging
+
+
+class ConfirmationBuffer():
+
+    def __init__(self,
+                 notifier,
+                 confirmations=12,
+                 fast_retract=False,
+                 ring_size=256):
+        """Initialise a ConfirmationBuffer, which holds contract events until
+        their block is buried under a number of confirmations on the
+        canonical chain
+
+        Parameters
+        ----------
+        notifier : EthereumContractNotifier
+            The notifier used to fetch block headers and to publish and
+            retract events
+        confirmations : int, optional
+            The number of blocks on top of an event's block before it is
+            released
+        fast_retract : bool, optional
+            Publish events immediately, and publish a retraction for any
+            event whose block is later orphaned by a reorg
+        ring_size : int, optional
+            The number of recent canonical block hashes remembered
+        """
+        self.notifier = notifier
+        self.confirmations = confirmations
+        self.fast_retract = fast_retract
+        self.ring_size = ring_size
+        self.block_hashes = collections.OrderedDict()
+        self.pending = collections.OrderedDict()
+        self.confirmed_block = None
+        self.reorg_count = 0
+
+    @staticmethod
+    def _key(event):
+        return bytes(event['blockHash']), event['logIndex']
+
+    def add(self, event, removed=False):
+        """
+        Buffer an event until it is confirmed, or drop it if the node
+        reports it removed. Events already below the confirmed block are
+        released immediately.
+        """
+        key = self._key(event)
+        if removed:
+            pending = self.pending.pop(key, None)
+            if pending is not None and pending[1]:
+                self.notifier.retract_event(pending[0])
+            return
+        if key in self.pending:
+            return
+        if self.confirmed_block is not None and event['blockNumber'] <= self.confirmed_block \
+                and self._is_canonical(event):
+            self.notifier.publish_event(event)
+            return
+        if self.fast_retract:
+            self.notifier.publish_event(event)
+        self.pending[key] = (event, self.fast_retract)
+
+    def _is_canonical(self, event):
+        """
+        Test an event's block hash against the ring. Blocks older than the
+        ring are assumed canonical.
+        """
+        block_hash = self.block_hashes.get(event['blockNumber'])
+        return block_hash is None or block_hash == bytes(event['blockHash'])
+
+    def _remember(self, block_number, block_hash):
+        self.block_hashes[block_number] = bytes(block_hash)
+        self.block_hashes.move_to_end(block_number)
+        while len(self.block_hashes) > self.ring_size:
+            self.block_hashes.popitem(last=False)
+
+    def update_canonical(self, head, headers=None):
+        """Fetch the headers of blocks new since the last update in one
+        batch and record their hashes, walking back through parent hashes
+        to find where the chain forked from the remembered one
+
+        Parameters
+        ----------
+        head : int
+            The current head block number
+        headers : list<dict>, optional
+            Block headers already fetched, which are not fetched again
+
+        Returns
+        -------
+        int
+            The first block whose events must be re-queried, because it
+            was replaced by a reorg or holds buffered events from an
+            orphaned block, or None
+        """
+        top = next(reversed(self.block_hashes)) if self.block_hashes else head - 1
+        fork_block = None
+        block_numbers = list(range(max(min(top + 1, head), head - self.ring_size + 1), head + 1))
+        known = {header['number']: header for header in headers or []}
+        missing = [block_number for block_number in block_numbers if block_number not in known]
+        if missing:
+            known.update((header['number'], header) for header in self.notifier.get_block_headers(missing))
+        for block_number, block in [(block_number, known[block_number]) for block_number in block_numbers]:
+            if self.block_hashes.get(block_number, bytes(block['hash'])) != bytes(block['hash']):
+                fork_block = block_number if fork_block is None else min(fork_block, block_number)
+            parent_number = block_number - 1
+            parent_hash = bytes(block['parentHash'])
+            while parent_number in self.block_hashes and self.block_hashes[parent_number] != parent_hash:
+                fork_block = parent_number if fork_block is None else min(fork_block, parent_number)
+                parent = self.notifier.get_block_headers([parent_number])[0]
+                self._remember(parent_number, parent['hash'])
+                parent_number, parent_hash = parent_number - 1, bytes(parent['parentHash'])
+            self._remember(block_number, block['hash'])
+        for block_number in [n for n in self.block_hashes if n > head]:
+            del self.block_hashes[block_number]
+            fork_block = head + 1 if fork_block is None else min(fork_block, head + 1)
+        for event, _ in self.pending.values():
+            if not self._is_canonical(event):
+                fork_block = event['blockNumber'] if fork_block is None else min(fork_block, event['blockNumber'])
+        if fork_block is not None:
+            self.reorg_count += 1
+            logging.info(json.dumps({"reorg_from_block": fork_block, "head": head,
+                                     "reorg_count": self.reorg_count}))
+        return fork_block
+
+    def release(self, head):
+        """
+        Drop or retract buffered events from orphaned blocks and publish
+        those with enough confirmations
+        """
+        self.confirmed_block = head - self.confirmations
+        for key, (event, published) in list(self.pending.items()):
+            if not self._is_canonical(event):
+                del self.pending[key]
+                if published:
+                    self.notifier.retract_event(event)
+            elif event['blockNumber'] <= self.confirmed_block:
+                del self.pending[key]
+                if not published:
+                    self.notifier.publish_event(event)
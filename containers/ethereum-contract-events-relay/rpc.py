@@ -0,0 +1,156 @@
+import json
+import threading
+from hexbytes import HexBytes
+from web3 import Web3
+from web3._utils.request import make_post_request
+
+
+class _PendingRequest():
+    __slots__ = ('method', 'params', 'response', 'error', 'sent', 'done')
+
+    def __init__(self, method, params):
+        self.method = method
+        self.params = params
+        self.response = None
+        self.error = None
+        self.sent = False
+        self.done = False
+
+
+def format_block_header(raw_block):
+    """Convert a raw JSON-RPC block object into a block header
+
+    Parameters
+    ----------
+    raw_block : dict
+        A block object as returned by eth_getBlockByNumber
+
+    Returns
+    -------
+    dict
+        The block number, and the block hash, parent hash and logs bloom
+        as bytes
+    """
+    return {
+        'number': int(raw_block['number'], 16),
+        'hash': HexBytes(raw_block['hash']),
+        'parentHash': HexBytes(raw_block['parentHash']),
+        'logsBloom': HexBytes(raw_block['logsBloom'])}
+
+
+class BatchingHTTPProvider(Web3.HTTPProvider):
+
+    def __init__(self, endpoint_uri, max_batch_size=100, session=None, max_in_flight=4, **kwargs):
+        """Initialise a BatchingHTTPProvider, an HTTP provider that coalesces
+        requests issued concurrently into JSON-RPC batch arrays. Callers send
+        their request straight away while fewer than max_in_flight requests
+        are outstanding; requests made while all are in flight are queued
+        and sent together in the next batch, so batching adds no latency to
+        a lone caller and a slow request does not hold up the others.
+
+        Parameters
+        ----------
+        endpoint_uri : str
+            The URL of the Web3 node
+        max_batch_size : int, optional
+            The maximum number of requests sent in one batch
+        session : requests.Session, optional
+            The session shared by all threads making requests. By default
+            web3 keeps a separate session per thread.
+        max_in_flight : int, optional
+            The most HTTP requests outstanding at once, at most the
+            session's connection pool size
+        """
+        super().__init__(endpoint_uri, **kwargs)
+        self.session = session
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_in_flight = max(max_in_flight, 1)
+        self._queue = []
+        self._condition = threading.Condition()
+        self._in_flight = 0
+
+    def _post(self, request_data):
+        if self.session is None:
+            return self.decode_rpc_response(make_post_request(self.endpoint_uri, request_data,
+                                                              **self.get_request_kwargs()))
+        response = self.session.post(self.endpoint_uri, data=request_data, **self.get_request_kwargs())
+        response.raise_for_status()
+        return self.decode_rpc_response(response.content)
+
+    def _send_batch(self, batch):
+        """
+        Send queued requests as a single request, or a JSON-RPC batch
+        array, and hand each caller its own response
+        """
+        try:
+            if len(batch) == 1:
+                batch[0].response = self._post(self.encode_rpc_request(batch[0].method, batch[0].params))
+                return
+            encoded = [self.encode_rpc_request(pending.method, pending.params) for pending in batch]
+            ids = [json.loads(request_data)['id'] for request_data in encoded]
+            responses = self._post(b'[' + b','.join(encoded) + b']')
+            if not isinstance(responses, list):
+                raise ValueError(responses.get('error', responses))
+            responses_by_id = {response.get('id'): response for response in responses}
+            for pending, request_id in zip(batch, ids):
+                pending.response = responses_by_id.get(request_id)
+                if pending.response is None:
+                    pending.error = ValueError({'message': 'missing batch response', 'id': request_id})
+        except Exception as e:
+            for pending in batch:
+                pending.error = e
+        finally:
+            with self._condition:
+                for pending in batch:
+                    pending.done = True
+                self._condition.notify_all()
+
+    def make_request(self, method, params):
+        pending = _PendingRequest(method, params)
+        with self._condition:
+            self._queue.append(pending)
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: pending.done or (not pending.sent and self._in_flight < self.max_in_flight))
+                if pending.done:
+                    break
+                self._in_flight += 1
+                batch = self._queue[:self.max_batch_size]
+                del self._queue[:self.max_batch_size]
+                for queued in batch:
+                    queued.sent = True
+            try:
+                self._send_batch(batch)
+            finally:
+                with self._condition:
+                    self._in_flight -= 1
+                    self._condition.notify_all()
+        if pending.error is not None:
+            raise pending.error
+        return pending.response
+
+    def make_batch_request(self, requests):
+        """Send a list of requests as JSON-RPC batches of at most
+        max_batch_size, bypassing web3's result formatters
+
+        Parameters
+        ----------
+        requests : list<tuple>
+            (method, params) pairs
+
+        Returns
+        -------
+        list<dict>
+            The raw JSON-RPC response of each request, in order
+        """
+        responses = []
+        for start in range(0, len(requests), self.max_batch_size):
+            batch = [_PendingRequest(method, params)
+                     for method, params in requests[start:start + self.max_batch_size]]
+            self._send_batch(batch)
+            for pending in batch:
+                if pending.error is not None:
+                    raise pending.error
+                responses.append(pending.response)
+        return responses
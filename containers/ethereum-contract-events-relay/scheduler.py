@@ -0,0 +1,70 @@
+import time
+
+
+class HeadScheduler():
+
+    def __init__(self,
+                 max_interval=10,
+                 min_interval=1,
+                 block_time=12):
+        """Initialise a HeadScheduler, which decides when to next check the
+        chain head so that log queries follow new blocks closely without
+        polling an unchanged head
+
+        Parameters
+        ----------
+        max_interval : int, optional
+            The longest number of seconds between head checks
+        min_interval : int, optional
+            The shortest number of seconds between head checks once a block
+            is overdue
+        block_time : int, optional
+            The initial estimate of the number of seconds between blocks
+        """
+        self.max_interval = max_interval
+        self.min_interval = min_interval
+        self.block_time = block_time
+        self.head = None
+        self.head_seen_at = None
+        self.misses = 0
+
+    def observe(self, head, now=None):
+        """Record the current chain head
+
+        Parameters
+        ----------
+        head : int
+            The head block number
+        now : float, optional
+            The monotonic time of the observation
+
+        Returns
+        -------
+        bool
+            True if the head advanced since the last observation
+        """
+        now = time.monotonic() if now is None else now
+        if self.head is not None and head <= self.head:
+            self.misses += 1
+            return False
+        if self.head is not None:
+            block_time = (now - self.head_seen_at) / (head - self.head)
+            self.block_time = 0.8 * self.block_time + 0.2 * block_time
+        self.head = head
+        self.head_seen_at = now
+        self.misses = 0
+        return True
+
+    def next_delay(self, now=None):
+        """The number of seconds to wait before checking the head again.
+        Checks are aligned to the expected arrival of the next block; once
+        it is overdue they back off exponentially from min_interval, never
+        waiting longer than max_interval.
+        """
+        if self.head_seen_at is None:
+            return self.min_interval
+        now = time.monotonic() if now is None else now
+        expected_at = self.head_seen_at + self.block_time
+        if now < expected_at:
+            return min(expected_at - now, self.max_interval)
+        return min(self.min_interval * 2 ** max(self.misses - 1, 0), self.max_interval)
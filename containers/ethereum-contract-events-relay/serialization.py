@@ -0,0 +1,56 @@
+import json
+from collections.abc import Mapping
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def to_detail(value):
+    """Convert a decoded event into plain JSON types in a single pass
+
+    The result has the shape of ``json.loads(Web3.toJSON(value),
+    parse_int=str)``: mappings become dicts, sequences lists, bytes and
+    HexBytes 0x-prefixed hex strings and integers decimal strings.
+
+    Parameters
+    ----------
+    value : object
+        An event as returned by processLog, or any value within it
+
+    Returns
+    -------
+    object
+        The value made of dicts, lists, strings, floats, bools and None
+    """
+    if isinstance(value, bool) or value is None or isinstance(value, (str, float)):
+        return value
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return '0x' + bytes(value).hex()
+    if isinstance(value, Mapping):
+        return {key: to_detail(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_detail(item) for item in value]
+    raise TypeError("Cannot serialize {} to JSON".format(type(value).__name__))
+
+
+def dumps(detail):
+    """Serialize a detail from to_detail to a JSON string, with orjson when
+    it is installed
+
+    Parameters
+    ----------
+    detail : dict
+        Plain JSON types
+
+    Returns
+    -------
+    str
+        The JSON document
+    """
+    if orjson is not None:
+        return orjson.dumps(detail).decode()
+    return json.dumps(detail)
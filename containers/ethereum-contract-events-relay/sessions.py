@@ -0,0 +1,75 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+
+    def __init__(self, pool_size=16, timeout=10, **kwargs):
+        """Initialise a PooledHTTPAdapter, an HTTP adapter that keeps up to
+        pool_size keep-alive connections per host and applies a default
+        timeout to every request
+
+        Parameters
+        ----------
+        pool_size : int, optional
+            The maximum number of connections kept open per host
+        timeout : int, optional
+            The number of seconds to wait for a connection or a response when
+            a request does not set its own timeout
+        """
+        self.timeout = timeout
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size, **kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        return super().send(request, timeout=self.timeout if timeout is None else timeout, **kwargs)
+
+
+def create_session(pool_size=16, timeout=10):
+    """Create an HTTP session with a shared keep-alive connection pool, to be
+    used by every outbound call the relay makes. HTTP/2 is not available
+    with requests, so pooled HTTP/1.1 keep-alive connections are used.
+
+    Parameters
+    ----------
+    pool_size : int, optional
+        The maximum number of connections kept open per host
+    timeout : int, optional
+        The default number of seconds to wait for a connection or a response
+
+    Returns
+    -------
+    requests.Session
+        The session
+    """
+    session = requests.Session()
+    adapter = PooledHTTPAdapter(pool_size=pool_size, timeout=timeout)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def session_stats(session):
+    """Report connection pool statistics for tuning pool_size
+
+    Parameters
+    ----------
+    session : requests.Session
+        A session from create_session
+
+    Returns
+    -------
+    dict
+        For each host, the number of requests made, the number of
+        connections opened (a high ratio of connections to requests means
+        churn) and the number of idle connections in the pool
+    """
+    stats = {}
+    for adapter in set(session.adapters.values()):
+        for pool_key in adapter.poolmanager.pools.keys():
+            pool = adapter.poolmanager.pools[pool_key]
+            stats['{}://{}:{}'.format(pool_key.key_scheme, pool_key.key_host, pool_key.key_port)] = {
+                'requests': pool.num_requests,
+                'connections_opened': pool.num_connections,
+                'idle_connections': sum(1 for connection in list(pool.pool.queue) if connection is not None)
+                if pool.pool is not None else 0}
+    return stats
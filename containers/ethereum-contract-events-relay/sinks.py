@@ -0,0 +1,260 @@
+import hashlib
+import json
+import sys
+import threading
+import boto3
+from publisher import MAX_BYTES, MAX_ENTRIES, entry_size
+
+
+def envelope(entry):
+    """The JSON document delivered to sinks other than EventBridge, shaped
+    like the EventBridge event envelope. The detail is embedded as already
+    serialized.
+
+    Parameters
+    ----------
+    entry : dict
+        A publish entry with a 'Source', 'DetailType' and JSON 'Detail'
+
+    Returns
+    -------
+    str
+        The JSON document
+    """
+    return '{{"source":{},"detail-type":{},"detail":{}}}'.format(
+        json.dumps(entry['Source']), json.dumps(entry['DetailType']), entry['Detail'])
+
+
+def partition_key(entry):
+    """The key ordering an entry within a sink, the contract address"""
+    return entry.get('PartitionKey') or entry['Source']
+
+
+class Sink():
+
+    # Batch limits of the sink's put call
+    max_entries = MAX_ENTRIES
+    max_bytes = MAX_BYTES
+    max_entry_bytes = MAX_BYTES
+
+    def __init__(self, name):
+        """Initialise a Sink, a destination events are published to in
+        batches. Entries are dicts with a 'Source', 'DetailType', JSON
+        'Detail' and the contract address as 'PartitionKey'.
+
+        Parameters
+        ----------
+        name : str
+            The name of the sink in statistics and dead letters
+        """
+        self.name = name
+
+    def size(self, entry):
+        """The size of an entry as counted against the sink's limits
+
+        Parameters
+        ----------
+        entry : dict
+            A publish entry
+
+        Returns
+        -------
+        int
+            The size in bytes
+        """
+        raise NotImplementedError
+
+    def put_batch(self, entries):
+        """Put a batch of entries
+
+        Parameters
+        ----------
+        entries : list<dict>
+            The publish entries, within the sink's batch limits
+
+        Returns
+        -------
+        list<dict>
+            A result per entry, with an 'ErrorCode' and 'ErrorMessage' for
+            entries that were rejected
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Release the sink's resources
+        """
+        pass
+
+
+class EventBridgeSink(Sink):
+
+    def __init__(self, event_bus_name, config=None):
+        """Initialise a sink putting events onto an Amazon EventBridge event
+        bus, created if not existing already
+
+        Parameters
+        ----------
+        event_bus_name : str
+            The name of the event bus
+        config : botocore.config.Config, optional
+            The client configuration
+        """
+        super().__init__('eventbridge://' + event_bus_name)
+        self.event_bus_name = event_bus_name
+        self.client = boto3.client('events', config=config)
+        try:
+            self.client.create_event_bus(Name=event_bus_name)
+        except self.client.exceptions.ResourceAlreadyExistsException:
+            pass
+
+    def size(self, entry):
+        return entry_size(entry)
+
+    def put_batch(self, entries):
+        response = self.client.put_events(Entries=[{
+            'DetailType': entry['DetailType'],
+            'Detail': entry['Detail'],
+            'EventBusName': self.event_bus_name,
+            'Source': entry['Source']} for entry in entries])
+        return response['Entries']
+
+
+class KinesisSink(Sink):
+
+    # PutRecords limits
+    max_entries = 500
+    max_bytes = 5 * 1024 * 1024
+    max_entry_bytes = 1024 * 1024
+
+    def __init__(self, stream_name, config=None):
+        """Initialise a sink putting events onto an Amazon Kinesis data
+        stream, partitioned by contract address
+
+        Parameters
+        ----------
+        stream_name : str
+            The name of the stream
+        config : botocore.config.Config, optional
+            The client configuration
+        """
+        super().__init__('kinesis://' + stream_name)
+        self.stream_name = stream_name
+        self.client = boto3.client('kinesis', config=config)
+
+    def size(self, entry):
+        return len(envelope(entry).encode('utf-8')) + len(partition_key(entry).encode('utf-8'))
+
+    def put_batch(self, entries):
+        response = self.client.put_records(StreamName=self.stream_name, Records=[{
+            'Data': envelope(entry).encode('utf-8'),
+            'PartitionKey': partition_key(entry)} for entry in entries])
+        return response['Records']
+
+
+class SQSSink(Sink):
+
+    # SendMessageBatch limits
+    max_entries = 10
+    max_bytes = 256 * 1024
+    max_entry_bytes = 256 * 1024
+
+    def __init__(self, queue_name, config=None):
+        """Initialise a sink sending events to an Amazon SQS queue. On a FIFO
+        queue, events are grouped by contract address and deduplicated by
+        content.
+
+        Parameters
+        ----------
+        queue_name : str
+            The name of the queue
+        config : botocore.config.Config, optional
+            The client configuration
+        """
+        super().__init__('sqs://' + queue_name)
+        self.client = boto3.client('sqs', config=config)
+        self.queue_url = self.client.get_queue_url(QueueName=queue_name)['QueueUrl']
+        self.fifo = queue_name.endswith('.fifo')
+
+    def size(self, entry):
+        return len(envelope(entry).encode('utf-8'))
+
+    def put_batch(self, entries):
+        messages = []
+        for i, entry in enumerate(entries):
+            message = {'Id': str(i), 'MessageBody': envelope(entry)}
+            if self.fifo:
+                message['MessageGroupId'] = partition_key(entry)
+                message['MessageDeduplicationId'] = hashlib.sha256(message['MessageBody'].encode()).hexdigest()
+            messages.append(message)
+        response = self.client.send_message_batch(QueueUrl=self.queue_url, Entries=messages)
+        results = [{} for _ in entries]
+        for success in response.get('Successful', []):
+            results[int(success['Id'])] = {'MessageId': success['MessageId']}
+        for failure in response.get('Failed', []):
+            results[int(failure['Id'])] = {'ErrorCode': failure['Code'], 'ErrorMessage': failure.get('Message')}
+        return results
+
+
+class FileSink(Sink):
+
+    max_entries = 1000
+    max_bytes = 16 * 1024 * 1024
+    max_entry_bytes = 16 * 1024 * 1024
+
+    def __init__(self, path=None):
+        """Initialise a sink appending events to a local JSON lines file
+
+        Parameters
+        ----------
+        path : str, optional
+            The path of the file, or None for standard output
+        """
+        super().__init__('file://' + path if path else 'stdout')
+        self.path = path
+        self._file = open(path, 'a') if path else sys.stdout
+        self._lock = threading.Lock()
+
+    def size(self, entry):
+        return len(envelope(entry).encode('utf-8')) + 1
+
+    def put_batch(self, entries):
+        lines = ''.join(envelope(entry) + '\n' for entry in entries)
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()
+        return [{} for _ in entries]
+
+    def close(self):
+        if self.path:
+            self._file.close()
+
+
+def create_sink(url, config=None):
+    """Create a sink from a configuration URL
+
+    Parameters
+    ----------
+    url : str
+        'eventbridge://<event bus>', 'kinesis://<stream>', 'sqs://<queue>',
+        'file:///<path>' for an absolute path ('file://<path>' for a
+        relative one), or 'stdout'
+    config : botocore.config.Config, optional
+        The AWS client configuration
+
+    Returns
+    -------
+    Sink
+    """
+    if url == 'stdout':
+        return FileSink()
+    scheme, _, location = url.partition('://')
+    if scheme == 'eventbridge':
+        return EventBridgeSink(location, config=config)
+    if scheme == 'kinesis':
+        return KinesisSink(location, config=config)
+    if scheme == 'sqs':
+        return SQSSink(location, config=config)
+    if scheme == 'file':
+        return FileSink(location)
+    raise ValueError("Unknown sink {!r}".format(url))
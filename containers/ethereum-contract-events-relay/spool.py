@@ -0,0 +1,292 @@
+import collections
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+# Each record is its payload length and CRC32, followed by the JSON payload
+HEADER = struct.Struct('>II')
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+
+def _scan(buffer, offset, end, max_records=None):
+    """Parse the complete, intact records in a buffer
+
+    Parameters
+    ----------
+    buffer : mmap.mmap
+        The segment contents
+    offset : int
+        The offset of the first record
+    end : int
+        The end of the written data
+    max_records : int, optional
+        The most records to parse
+
+    Returns
+    -------
+    tuple
+        The record payloads, and the offset after the last one
+    """
+    payloads = []
+    while offset + HEADER.size <= end and (max_records is None or len(payloads) < max_records):
+        length, crc = HEADER.unpack_from(buffer, offset)
+        start = offset + HEADER.size
+        if start + length > end:
+            break
+        payload = buffer[start:start + length]
+        if zlib.crc32(payload) != crc:
+            break
+        payloads.append(payload)
+        offset = start + length
+    return payloads, offset
+
+
+class Spool():
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, fsync='interval', fsync_interval=1.0):
+        """Initialise a Spool, an append-only write-ahead log of entries on
+        local disk, split into segment files that are deleted once every
+        entry in them has been acknowledged
+
+        Entries left in the spool by a previous run are read again first,
+        so each entry is published at least once. A record torn by a crash
+        is truncated away.
+
+        Parameters
+        ----------
+        directory : str
+            The directory holding the segment files
+        segment_bytes : int, optional
+            The size at which a segment is closed and a new one started
+        fsync : str, optional
+            'always' to fsync after every entry, 'interval' to fsync entries
+            within fsync_interval seconds of their append, from a background
+            thread when no further entry is appended, or 'never' to leave
+            flushing to the operating system. Segments are always fsynced
+            when closed.
+        fsync_interval : float, optional
+            The number of seconds between fsyncs with the 'interval' policy
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError("fsync must be one of {}, not {!r}".format(FSYNC_POLICIES, fsync))
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self._condition = threading.Condition()
+        self._closed = False
+        os.makedirs(directory, exist_ok=True)
+        # Segment ids to [records written, records acknowledged]
+        self._segments = collections.OrderedDict()
+        segment_ids = sorted(int(name[:-len('.seg')]) for name in os.listdir(directory) if name.endswith('.seg'))
+        for segment_id in segment_ids:
+            self._segments[segment_id] = [self._recover(segment_id), 0]
+        self._read_segment = segment_ids[0] if segment_ids else None
+        self._read_offset = 0
+        self._unsynced = False
+        self._open_segment(segment_ids[-1] + 1 if segment_ids else 0)
+        self._syncer = None
+        if fsync == 'interval':
+            self._syncer = threading.Thread(target=self._sync_periodically, daemon=True)
+            self._syncer.start()
+
+    def _path(self, segment_id):
+        return os.path.join(self.directory, '{:020d}.seg'.format(segment_id))
+
+    def _recover(self, segment_id):
+        """
+        Count the intact records of a segment left by a previous run,
+        truncating any torn record at its end
+        """
+        path = self._path(segment_id)
+        size = os.path.getsize(path)
+        if size == 0:
+            return 0
+        with open(path, 'r+b') as f:
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as buffer:
+                payloads, offset = _scan(buffer, 0, size)
+            if offset < size:
+                f.truncate(offset)
+        return len(payloads)
+
+    def _open_segment(self, segment_id):
+        """
+        Start a new active segment for appending
+        """
+        self._active_id = segment_id
+        self._active = open(self._path(segment_id), 'ab')
+        self._active_size = 0
+        self._last_sync = time.monotonic()
+        self._segments[segment_id] = [0, 0]
+        if self._read_segment is None:
+            self._read_segment = segment_id
+
+    def append(self, entry):
+        """Write an entry to the active segment, syncing it to disk according
+        to the fsync policy
+
+        Parameters
+        ----------
+        entry : dict
+            A JSON-serializable entry
+        """
+        payload = json.dumps(entry).encode('utf-8')
+        with self._condition:
+            self._active.write(HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            self._active.flush()
+            self._active_size += HEADER.size + len(payload)
+            self._segments[self._active_id][0] += 1
+            self._unsynced = True
+            if self.fsync == 'always' or (self.fsync == 'interval'
+                                          and time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync()
+            if self._active_size >= self.segment_bytes:
+                self._sync()
+                self._active.close()
+                self._open_segment(self._active_id + 1)
+            self._condition.notify_all()
+
+    def _sync(self):
+        """
+        Fsync the active segment. Called with the condition held.
+        """
+        os.fsync(self._active.fileno())
+        self._last_sync = time.monotonic()
+        self._unsynced = False
+
+    def _sync_periodically(self):
+        """
+        Fsync entries left unsynced by the 'interval' policy once
+        fsync_interval has passed, so the last entries before the spool goes
+        idle are synced too
+        """
+        with self._condition:
+            while not self._closed:
+                remaining = self._last_sync + self.fsync_interval - time.monotonic()
+                if self._unsynced and remaining <= 0:
+                    self._sync()
+                    continue
+                self._condition.wait(remaining if self._unsynced else self.fsync_interval)
+
+    def read(self, max_records=1000, timeout=None):
+        """Read the next entries in the order they were appended, waiting for
+        some to be appended if there are none. Segments are memory-mapped
+        for reading.
+
+        Parameters
+        ----------
+        max_records : int, optional
+            The most entries returned
+        timeout : float, optional
+            The longest number of seconds to wait for an entry
+
+        Returns
+        -------
+        list<tuple>
+            The segment id and entry of each record read, empty if none was
+            appended in time or the spool was closed
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._condition:
+                while not self._closed and self._read_segment == self._active_id \
+                        and self._read_offset >= self._active_size:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return []
+                    self._condition.wait(remaining)
+                if self._closed:
+                    return []
+                segment_id, offset = self._read_segment, self._read_offset
+                end = self._active_size if segment_id == self._active_id else os.path.getsize(self._path(segment_id))
+            payloads = []
+            if end > offset:
+                with open(self._path(segment_id), 'rb') as f:
+                    with mmap.mmap(f.fileno(), end, access=mmap.ACCESS_READ) as buffer:
+                        payloads, offset = _scan(buffer, offset, end, max_records)
+            with self._condition:
+                self._read_offset = offset
+                # Move on from a closed segment once it is fully read. A
+                # segment read while active may have grown before it closed.
+                if segment_id != self._active_id and offset >= os.path.getsize(self._path(segment_id)):
+                    segment_ids = list(self._segments)
+                    self._read_segment = segment_ids[segment_ids.index(segment_id) + 1]
+                    self._read_offset = 0
+                    self._truncate(segment_id)
+            if payloads:
+                return [(segment_id, json.loads(payload)) for payload in payloads]
+
+    def ack(self, segment_id):
+        """Acknowledge that an entry read from a segment has been published.
+        A segment is deleted once all its entries are acknowledged.
+
+        Parameters
+        ----------
+        segment_id : int
+            The segment the entry was read from
+        """
+        with self._condition:
+            self._segments[segment_id][1] += 1
+            self._truncate(segment_id)
+            self._condition.notify_all()
+
+    def _truncate(self, segment_id):
+        """
+        Delete a segment once all its entries are acknowledged, and it is
+        neither being appended to nor read, or the spool is closed
+        """
+        written, acked = self._segments[segment_id]
+        if acked < written or (not self._closed and segment_id in (self._active_id, self._read_segment)):
+            return
+        os.remove(self._path(segment_id))
+        del self._segments[segment_id]
+
+    def _unacknowledged(self):
+        return sum(written - acked for written, acked in self._segments.values())
+
+    def wait_drained(self, timeout=None):
+        """Wait for every entry appended to be acknowledged
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The longest number of seconds to wait
+
+        Returns
+        -------
+        bool
+            Whether the spool drained in time
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._unacknowledged() == 0, timeout)
+
+    def stats(self):
+        """
+        Report the number of segments and of entries not yet acknowledged
+        """
+        with self._condition:
+            return {'segments': len(self._segments),
+                    'unacknowledged': self._unacknowledged()}
+
+    def close(self):
+        """
+        Sync the active segment, stop the sync thread and wake any waiting
+        reader. Segments whose entries are all acknowledged are deleted, so
+        a clean restart replays nothing already published.
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._active.flush()
+            self._sync()
+            self._active.close()
+            for segment_id in list(self._segments):
+                self._truncate(segment_id)
+            self._condition.notify_all()
+        if self._syncer is not None:
+            self._syncer.join()
@@ -0,0 +1,193 @@
+import asyncio
+import collections
+import json
+import logging
+import websockets
+from hexbytes import HexBytes
+from web3 import Web3
+from backfill import Backfiller
+
+
+def format_log(raw_log):
+    """Convert a raw JSON-RPC log object into the form returned by
+    web3.eth.getLogs, so it can be decoded by the contract event ABI
+
+    Parameters
+    ----------
+    raw_log : dict
+        A log object as emitted by an eth_subscribe logs notification
+
+    Returns
+    -------
+    dict
+        The log with integer block/log/transaction indices, byte topics and
+        hashes, and a checksummed address
+    """
+    return {
+        'address': Web3.toChecksumAddress(raw_log['address']),
+        'topics': [HexBytes(topic) for topic in raw_log['topics']],
+        'data': raw_log['data'],
+        'blockNumber': int(raw_log['blockNumber'], 16),
+        'blockHash': HexBytes(raw_log['blockHash']),
+        'transactionHash': HexBytes(raw_log['transactionHash']),
+        'transactionIndex': int(raw_log['transactionIndex'], 16),
+        'logIndex': int(raw_log['logIndex'], 16),
+        'removed': raw_log.get('removed', False)}
+
+
+class LogSubscriber():
+
+    def __init__(self,
+                 notifier,
+                 ws_url,
+                 reconnect_delay=1,
+                 max_reconnect_delay=60,
+                 dedupe_size=10000):
+        """Initialise a LogSubscriber, which pushes contract events from an
+        eth_subscribe WebSocket connection into an EthereumContractNotifier
+
+        Parameters
+        ----------
+        notifier : EthereumContractNotifier
+            The notifier providing the watched contracts, log decoding and
+            the HTTP connection used to fill gaps after reconnecting
+        ws_url : str
+            The WebSocket URL of the Web3 node
+        reconnect_delay : int, optional
+            The initial number of seconds to wait before reconnecting
+        max_reconnect_delay : int, optional
+            The maximum number of seconds to wait before reconnecting
+        dedupe_size : int, optional
+            The number of recently delivered logs remembered so that logs
+            re-queried during gap filling are not delivered twice
+        """
+        self.notifier = notifier
+        self.ws_url = ws_url
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self._seen_logs = collections.deque(maxlen=dedupe_size)
+        self._seen_log_keys = set()
+        self._request_id = 0
+        self._connected_before = False
+        self._subscribed = False
+
+    def _next_request(self, method, params):
+        """
+        Build a JSON-RPC request with a unique id
+        """
+        self._request_id += 1
+        return json.dumps({'jsonrpc': '2.0', 'id': self._request_id, 'method': method, 'params': params})
+
+    def _first_delivery(self, log):
+        """
+        Remember a log as delivered, returning False if it already was.
+        Removed logs are told apart from the log they remove.
+        """
+        log_key = (bytes(log['blockHash']), log['logIndex'], log.get('removed', False))
+        if log_key in self._seen_log_keys:
+            return False
+        if len(self._seen_logs) == self._seen_logs.maxlen:
+            self._seen_log_keys.discard(self._seen_logs[0])
+        self._seen_logs.append(log_key)
+        self._seen_log_keys.add(log_key)
+        self.notifier.last_block = max(self.notifier.last_block, log['blockNumber'])
+        return True
+
+    def deliver_log(self, log):
+        """
+        Dispatch a formatted log to the notifier unless it has already been
+        delivered. Removed logs are always delivered.
+        """
+        if self._first_delivery(log):
+            self.notifier.dispatch_log(log)
+
+    def deliver_logs(self, logs):
+        """
+        Dispatch a batch of logs to the notifier, skipping those already
+        delivered
+        """
+        self.notifier.dispatch_logs([log for log in logs if self._first_delivery(log)])
+
+    def fill_gap(self):
+        """
+        Re-query all logs from the last block seen before the connection
+        dropped (or after the last block published before subscribing) up
+        to the current head, so nothing emitted while disconnected is lost.
+        Long gaps are queried in adaptively sized windows, as backfills are.
+        """
+        head = self.notifier.w3.eth.blockNumber
+        from_block = self.notifier.last_block if self._connected_before else self.notifier.last_block + 1
+        # Logs of events added by proxy upgrades are re-queried from the upgrade
+        from_block = min([from_block] + [block for _, _, block in self.notifier.pending_upgrades])
+        self.notifier.pending_upgrades = []
+        if head < from_block:
+            return
+        logging.info(json.dumps({"gap_fill_from_block": from_block,
+                                 "gap_fill_to_block": head}))
+        Backfiller(self.notifier, from_block, head, dispatch=self.deliver_logs).run()
+
+    async def handle_message(self, message):
+        """
+        Handle a single WebSocket message. Subscription notifications carry
+        either a log or a new block header. New heads confirm buffered
+        events off the event loop, since that fetches block headers and,
+        after a reorg, logs.
+        """
+        if 'error' in message:
+            raise ValueError(message['error'])
+        if message.get('method') != 'eth_subscription':
+            if 'id' in message:
+                logging.info(json.dumps({"subscription": message['result']}))
+            return
+        result = message['params']['result']
+        if 'topics' in result:
+            self.deliver_log(format_log(result))
+        elif 'number' in result:
+            head = int(result['number'], 16)
+            self.notifier.last_block = max(self.notifier.last_block, head)
+            if self.notifier.confirmation_buffer is not None:
+                await self.notifier.offload(self.notifier.confirm_blocks, head, timeout=False)
+
+    async def _session(self):
+        """
+        Connect, subscribe to logs for the watched events, one subscription
+        per distinct set of argument topic filters, and to new block
+        headers, fill any gap since the previous connection and then handle
+        notifications until the connection closes, or the watched events
+        change after a proxy upgrade. Upgrades are applied off the event
+        loop.
+        """
+        async with websockets.connect(self.ws_url) as websocket:
+            log_queries = self.notifier.log_queries
+            for log_query in log_queries:
+                await websocket.send(self._next_request('eth_subscribe', ['logs', log_query]))
+            await websocket.send(self._next_request('eth_subscribe', ['newHeads']))
+            self._subscribed = True
+            await self.notifier.offload(self.fill_gap, timeout=False)
+            self._connected_before = True
+            async for message in websocket:
+                await self.handle_message(json.loads(message))
+                if self.notifier.detected_upgrades:
+                    await self.notifier.offload(self.notifier.apply_upgrades, timeout=False)
+                self.notifier.collect_published()
+                if self.notifier.log_queries is not log_queries:
+                    logging.info(json.dumps({"resubscribe": "watched events changed"}))
+                    return
+
+    async def subscribe(self):
+        """
+        Push events to the notifier as the node emits them, resubscribing
+        with exponential backoff whenever the connection is lost.
+        """
+        delay = self.reconnect_delay
+        while True:
+            self._subscribed = False
+            try:
+                await self._session()
+            except (websockets.exceptions.WebSocketException, OSError, ValueError, asyncio.TimeoutError) as e:
+                logging.error(e)
+            if self._subscribed:
+                delay = self.reconnect_delay
+            logging.info(json.dumps({"reconnect_in": delay}))
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
@@ -0,0 +1,21 @@
+import json
+import os
+import sys
+
+# The relay's modules are imported as top-level modules, as app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+
+def entry(i, partition_key=False):
+    """
+    A publish entry numbered i. With partition_key, it is partitioned by one
+    of three contract addresses, as the notifier's entries are.
+    """
+    entry = {'DetailType': 'Ethereum contract event notifications', 'Detail': json.dumps({'n': str(i)}),
+             'Source': 'ethereum'}
+    if partition_key:
+        entry['PartitionKey'] = '0x%040x' % (i % 3)
+    return entry
@@ -0,0 +1,251 @@
+import asyncio
+import collections
+import threading
+import time
+import types
+from concurrent.futures import Future, ThreadPoolExecutor
+import pytest
+import requests
+from eth_utils import event_abi_to_log_topic
+from hexbytes import HexBytes
+from web3 import Web3
+from abis import UPGRADE_TOPICS
+from app import EthereumContractNotifier
+
+
+def make_notifier(**attributes):
+    """
+    A notifier without a node connection, sinks or contracts, with only the
+    state the tested methods use
+    """
+    notifier = EthereumContractNotifier.__new__(EthereumContractNotifier)
+    notifier.max_concurrency = 2
+    notifier.call_timeout = 5
+    notifier._call_executor = ThreadPoolExecutor(max_workers=2)
+    notifier._call_semaphore = None
+    notifier._published = collections.deque()
+    notifier.checkpoint_store = None
+    notifier.confirmation_buffer = None
+    notifier.detected_upgrades = []
+    notifier.pending_upgrades = []
+    notifier.resume_positions = {}
+    notifier.last_block = 0
+    notifier.__dict__.update(attributes)
+    return notifier
+
+
+def test_node_connection_errors_do_not_stop_polling():
+    def fetch_new_logs(from_block, to_block):
+        raise requests.exceptions.ConnectionError('connection reset')
+
+    def confirm_blocks(head):
+        raise requests.exceptions.HTTPError('502 Server Error: Bad Gateway')
+
+    notifier = make_notifier(last_block=10, fetch_new_logs=fetch_new_logs, confirm_blocks=confirm_blocks)
+    asyncio.get_event_loop().run_until_complete(notifier.gather_logs(11))
+    asyncio.get_event_loop().run_until_complete(notifier.gather_confirmations(11))
+    assert notifier.last_block == 10
+
+
+def test_state_updates_are_not_abandoned_on_timeout():
+    calls = []
+
+    def confirm_blocks(head):
+        time.sleep(0.3)
+        calls.append(head)
+
+    notifier = make_notifier(call_timeout=0.05, confirm_blocks=confirm_blocks)
+    loop = asyncio.get_event_loop()
+    with pytest.raises(asyncio.TimeoutError):
+        loop.run_until_complete(notifier.offload(time.sleep, 0.3))
+    # The confirmation finishes before the next poll could start another
+    loop.run_until_complete(notifier.gather_confirmations(11))
+    assert calls == [11]
+
+
+def event_abi(name, *arguments):
+    return {'type': 'event', 'name': name, 'anonymous': False,
+            'inputs': [{'name': argument, 'type': 'address', 'indexed': True} for argument in arguments]
+            + [{'name': 'value', 'type': 'uint256', 'indexed': False}]}
+
+
+ERC20_ABI = [event_abi('Transfer', 'from', 'to'), event_abi('Approval', 'owner', 'spender')]
+TOKEN_A = Web3.toChecksumAddress('0x' + 'aa' * 20)
+TOKEN_B = Web3.toChecksumAddress('0x' + 'bb' * 20)
+HOLDER = Web3.toChecksumAddress('0x' + '11' * 20)
+OTHER = Web3.toChecksumAddress('0x' + '22' * 20)
+
+
+class FakeEth():
+    """Serves eth_getLogs queries from a list of raw logs"""
+
+    def __init__(self, logs=(), block_number=0):
+        self.logs = list(logs)
+        self.blockNumber = block_number
+        self.queries = []
+
+    def getLogs(self, query):
+        self.queries.append(query)
+        return [log for log in self.logs
+                if log['address'] in query['address'] and query['fromBlock'] <= log['blockNumber'] <= query['toBlock']
+                and all(values is None or Web3.toHex(log['topics'][i]) in values
+                        for i, values in enumerate(query['topics']))]
+
+
+def make_log(address, event_name, arguments, block_number, log_index):
+    event = next(abi for abi in ERC20_ABI if abi['name'] == event_name)
+    return {'address': address,
+            'topics': [HexBytes(event_abi_to_log_topic(event))]
+            + [HexBytes(HexBytes(argument).rjust(32, b'\0')) for argument in arguments],
+            'data': Web3.toHex((1).to_bytes(32, 'big')),
+            'blockNumber': block_number, 'blockHash': HexBytes(block_number.to_bytes(32, 'big')),
+            'transactionHash': HexBytes((block_number * 1000 + log_index).to_bytes(32, 'big')),
+            'transactionIndex': 0, 'logIndex': log_index, 'removed': False}
+
+
+def make_contract_notifier(event_selections, logs=(), block_number=0):
+    notifier = make_notifier(w3=Web3(), contract_abis={TOKEN_A: ERC20_ABI, TOKEN_B: ERC20_ABI},
+                             contract_addresses=[TOKEN_A, TOKEN_B], event_selections=event_selections,
+                             implementations={})
+    notifier._setup_topics()
+    notifier.w3 = types.SimpleNamespace(eth=FakeEth(logs, block_number), codec=notifier.w3.codec)
+    return notifier
+
+
+def test_overlapping_log_queries_return_each_log_once():
+    approval = make_log(TOKEN_A, 'Approval', [HOLDER, OTHER], 5, 0)
+    transfer = make_log(TOKEN_B, 'Transfer', [OTHER, HOLDER], 5, 1)
+    notifier = make_contract_notifier({TOKEN_A: {'Transfer': {'from': HOLDER}, 'Approval': {}},
+                                       TOKEN_B: {'Approval': {'owner': HOLDER}, 'Transfer': {}}},
+                                      [approval, transfer])
+    # A.Approval(owner=HOLDER) matches both the filtered and unfiltered query
+    assert len(notifier.log_queries) == 2
+    assert sorted(len(notifier.w3.eth.getLogs(dict(query, fromBlock=0, toBlock=10)))
+                  for query in notifier.log_queries) == [1, 2]
+    assert notifier.fetch_logs(0, 10) == [approval, transfer]
+
+
+@pytest.mark.parametrize('argument', ['form', 'value'])
+def test_filters_on_unknown_or_unindexed_arguments_are_rejected(argument):
+    with pytest.raises(ValueError, match=argument):
+        make_contract_notifier({TOKEN_A: {'Transfer': {argument: HOLDER}}})
+
+
+def test_proxy_upgrades_are_applied_off_the_event_loop():
+    upgraded = make_log(TOKEN_A, 'Transfer', [HOLDER, OTHER], 7, 0)
+    upgraded['topics'] = [HexBytes(next(iter(UPGRADE_TOPICS))), HexBytes(HexBytes(OTHER).rjust(32, b'\0'))]
+    notifier = make_contract_notifier({})
+    notifier.implementations = {TOKEN_A: HOLDER}
+    notifier._setup_topics()
+    notifier.last_block = 6
+    notifier.bloom_filter = False
+    notifier.w3.eth.logs = [upgraded]
+    upgrades = []
+
+    def upgrade_contract(contract_address, block_number):
+        upgrades.append((contract_address, block_number, threading.current_thread()))
+    notifier.upgrade_contract = upgrade_contract
+    asyncio.get_event_loop().run_until_complete(notifier.gather_logs(7))
+    [(contract_address, block_number, thread)] = upgrades
+    assert (contract_address, block_number) == (TOKEN_A, 7)
+    assert thread is not threading.main_thread()
+    assert notifier.last_block == 7
+
+
+class RecordingCheckpointStore():
+    """A checkpoint store holding loaded checkpoints and recording updates"""
+
+    def __init__(self, checkpoints=None):
+        self.checkpoints = checkpoints or {}
+        self.updates = []
+
+    def load(self, contract_address):
+        return self.checkpoints.get(contract_address)
+
+    def update(self, contract_address, block_number, log_index=None):
+        self.updates.append((contract_address, block_number, log_index))
+
+
+def test_checkpoints_follow_publish_order():
+    store = RecordingCheckpointStore()
+    notifier = make_notifier(checkpoint_store=store, contract_addresses=[TOKEN_A, TOKEN_B])
+    first, second, failed = Future(), Future(), Future()
+    notifier._published.extend([({'address': TOKEN_A, 'blockNumber': 5, 'logIndex': 0}, first, True),
+                                ({'address': TOKEN_B, 'blockNumber': 5, 'logIndex': 1}, second, True),
+                                ({'address': TOKEN_A, 'blockNumber': 6, 'logIndex': 0}, failed, True),
+                                (None, None, 6)])
+    second.set_result(None)
+    notifier.collect_published()
+    # Nothing is checkpointed past a publish still pending
+    assert store.updates == [] and len(notifier._published) == 4
+    first.set_result(None)
+    failed.set_exception(RuntimeError('throttled'))
+    notifier.collect_published()
+    assert store.updates == [(TOKEN_A, 5, 0), (TOKEN_B, 5, 1), (TOKEN_A, 6, None), (TOKEN_B, 6, None)]
+    assert not notifier._published
+
+
+def test_logs_published_before_a_restart_are_skipped():
+    notifier = make_contract_notifier({})
+    notifier.checkpoint_store = RecordingCheckpointStore({TOKEN_A: (6, 1), TOKEN_B: (4, None)})
+    notifier._setup_checkpoints()
+    assert notifier.resume_block == 5
+    published = []
+    notifier.publish_event = published.append
+    logs = [make_log(TOKEN_B, 'Transfer', [HOLDER, OTHER], 4, 0),
+            make_log(TOKEN_A, 'Transfer', [HOLDER, OTHER], 5, 0),
+            make_log(TOKEN_B, 'Transfer', [HOLDER, OTHER], 5, 1),
+            make_log(TOKEN_A, 'Transfer', [HOLDER, OTHER], 6, 1),
+            make_log(TOKEN_A, 'Transfer', [HOLDER, OTHER], 6, 2)]
+    notifier.dispatch_logs(logs)
+    assert [(event['address'], event['blockNumber'], event['logIndex']) for event in published] == \
+        [(TOKEN_B, 5, 1), (TOKEN_A, 6, 2)]
+
+
+class StubFilter():
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def get_new_entries(self):
+        if isinstance(self.entries, Exception):
+            raise self.entries
+        return self.entries
+
+
+class StubContractEvent():
+    """Creates filters returning the given entries, and serves getLogs"""
+
+    def __init__(self, entries, logs):
+        self.entries = entries
+        self.logs = logs
+        self.queries = []
+
+    def createFilter(self, fromBlock, argument_filters=None):
+        return StubFilter(self.entries)
+
+    def getLogs(self, argument_filters=None, fromBlock=None, toBlock=None):
+        self.queries.append((fromBlock, toBlock))
+        return [log for log in self.logs if fromBlock <= log['blockNumber'] <= toBlock]
+
+
+def test_recovered_filters_do_not_repeat_events():
+    missed = [make_log(TOKEN_A, 'Transfer', [HOLDER, OTHER], block_number, 0) for block_number in (6, 8)]
+    new = make_log(TOKEN_A, 'Transfer', [HOLDER, OTHER], 9, 0)
+    contract_event = StubContractEvent(missed[1:] + [new], missed)
+    name = (TOKEN_A, 'Transfer')
+    notifier = make_notifier(w3=types.SimpleNamespace(eth=FakeEth(block_number=8)), event_selections={},
+                             contracts={TOKEN_A: types.SimpleNamespace(events={'Transfer': contract_event})},
+                             filter_blocks={name: 5}, filter_recoveries=0, _recovered_events={},
+                             event_filters={name: StubFilter(ValueError({'code': -32000,
+                                                                         'message': 'filter not found'}))})
+    dispatched = []
+    notifier.dispatch_event = dispatched.append
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(notifier.gather_event(name, notifier.event_filters[name], 8))
+    assert contract_event.queries == [(6, 8)]
+    assert notifier.filter_blocks[name] == 8 and notifier.filter_recoveries == 1
+    # The new filter's first poll reports the head block again
+    loop.run_until_complete(notifier.gather_event(name, notifier.event_filters[name], 9))
+    assert dispatched == missed + [new]
+    assert notifier.filter_blocks[name] == 9
@@ -0,0 +1,60 @@
+import backfill
+from backfill import Backfiller, is_range_too_large, is_rate_limited
+
+RATE_LIMITED = {'code': -32005, 'message': 'project ID request rate exceeded'}
+TOO_MANY_RESULTS = {'code': -32005, 'message': 'query returned more than 10000 results'}
+
+
+class FakeNotifier():
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.queries = []
+        self.completed = []
+
+    def fetch_logs(self, from_block, to_block):
+        self.queries.append((from_block, to_block))
+        if self.errors:
+            raise ValueError(self.errors.pop(0))
+        return []
+
+    def dispatch_logs(self, logs):
+        pass
+
+    def complete_block_range(self, to_block):
+        self.completed.append(to_block)
+
+
+def test_rate_limits_are_not_range_errors():
+    assert is_rate_limited(ValueError(RATE_LIMITED))
+    assert not is_range_too_large(ValueError(RATE_LIMITED))
+    assert is_range_too_large(ValueError(TOO_MANY_RESULTS))
+    assert not is_rate_limited(ValueError(TOO_MANY_RESULTS))
+
+
+def test_rate_limited_queries_back_off_without_shrinking_the_window(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(backfill.time, 'sleep', sleeps.append)
+    notifier = FakeNotifier([RATE_LIMITED] * 3)
+    assert Backfiller(notifier, 0, 999, window=1000).run() == 999
+    assert notifier.queries == [(0, 999)] * 4
+    assert len(sleeps) == 3
+    assert notifier.completed == [999]
+
+
+def test_persistent_rate_limiting_gives_up(monkeypatch):
+    monkeypatch.setattr(backfill.time, 'sleep', lambda delay: None)
+    notifier = FakeNotifier([RATE_LIMITED] * 5)
+    try:
+        Backfiller(notifier, 0, 999, window=1000, rate_limit_retries=2).run()
+    except ValueError as e:
+        assert e.args[0] == RATE_LIMITED
+    else:
+        raise AssertionError('expected the rate limit error')
+    assert len(notifier.queries) == 3
+
+
+def test_ranges_with_too_many_results_are_split():
+    notifier = FakeNotifier([TOO_MANY_RESULTS])
+    Backfiller(notifier, 0, 999, window=1000).run()
+    assert notifier.queries[:2] == [(0, 999), (0, 499)]
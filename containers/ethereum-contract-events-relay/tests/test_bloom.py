@@ -0,0 +1,52 @@
+import random
+from eth_utils import keccak
+from bloom import LogsBloomFilter
+
+ADDRESSES = ['0x' + 'aa' * 20, '0x' + 'bb' * 20]
+TOPICS = [keccak(text='Transfer(address,address,uint256)'), '0x' + keccak(text='Sync(uint112,uint112)').hex()]
+
+
+def make_bloom(*items):
+    """
+    A logs bloom built as the yellow paper defines it: each item sets the
+    bits given by the low 11 bits of the first three byte pairs of its hash
+    """
+    bloom = 0
+    for item in items:
+        item_hash = keccak(item)
+        for i in (0, 2, 4):
+            bloom |= 1 << (int.from_bytes(item_hash[i:i + 2], 'big') & 2047)
+    return bloom.to_bytes(256, 'big')
+
+
+def test_blocks_with_a_watched_address_and_topic_match():
+    logs_bloom = LogsBloomFilter(ADDRESSES, TOPICS)
+    address = bytes.fromhex('bb' * 20)
+    other_topic = keccak(text='Approval(address,address,uint256)')
+    assert logs_bloom.matches(make_bloom(address, TOPICS[0]))
+    assert logs_bloom.matches(make_bloom(bytes.fromhex('cc' * 20), address, other_topic, TOPICS[0]))
+    # An address and a topic are both required
+    assert not logs_bloom.matches(make_bloom(address, other_topic))
+    assert not logs_bloom.matches(make_bloom(bytes.fromhex('cc' * 20), TOPICS[0]))
+    assert not logs_bloom.matches(bytes(256))
+
+
+def test_matches_many_agrees_with_matches():
+    rng = random.Random(1)
+    logs_bloom = LogsBloomFilter(ADDRESSES, TOPICS)
+    items = [bytes.fromhex(address[2:]) for address in ADDRESSES] + [TOPICS[0]] \
+        + [rng.getrandbits(256).to_bytes(32, 'big') for _ in range(20)]
+    blooms = [make_bloom(*rng.sample(items, rng.randint(0, 6))) for _ in range(300)]
+    # Dense blooms from busy blocks give false positives
+    blooms += [rng.getrandbits(2048).to_bytes(256, 'big') for _ in range(20)]
+    matches = logs_bloom.matches_many(blooms)
+    assert matches.tolist() == [logs_bloom.matches(bloom) for bloom in blooms]
+    assert 0 < matches.sum() < len(blooms)
+    assert len(logs_bloom.matches_many([])) == 0
+
+
+def test_nothing_matches_without_topics():
+    logs_bloom = LogsBloomFilter(ADDRESSES, [])
+    bloom = make_bloom(bytes.fromhex('aa' * 20), TOPICS[0])
+    assert not logs_bloom.matches(bloom)
+    assert logs_bloom.matches_many([bloom]).tolist() == [False]
@@ -0,0 +1,133 @@
+import random
+import pytest
+from hexbytes import HexBytes
+from web3 import Web3
+from web3._utils.events import get_event_data
+from decoders import EventDecoder
+
+ADDRESS = Web3.toChecksumAddress('0x' + 'ab' * 20)
+WORD_EVENT_ABI = {
+    'type': 'event', 'name': 'Settled', 'anonymous': False,
+    'inputs': [{'indexed': True, 'name': 'owner', 'type': 'address'},
+               {'indexed': True, 'name': 'id', 'type': 'uint256'},
+               {'indexed': True, 'name': 'small', 'type': 'uint8'},
+               {'indexed': False, 'name': 'amount', 'type': 'uint256'},
+               {'indexed': False, 'name': 'fee', 'type': 'uint64'},
+               {'indexed': False, 'name': 'ok', 'type': 'bool'},
+               {'indexed': False, 'name': 'recipient', 'type': 'address'},
+               {'indexed': False, 'name': 'hash', 'type': 'bytes32'},
+               {'indexed': False, 'name': 'count', 'type': 'uint32'}]}
+CODEC = Web3().codec
+DECODER = EventDecoder(WORD_EVENT_ABI, CODEC)
+
+
+def word(value):
+    return value.to_bytes(32, 'big')
+
+
+def make_log(rng, i):
+    """
+    A log of WORD_EVENT_ABI with random values, half of the uint256 values
+    wider than 64 bits
+    """
+    bits = 256 if i % 2 else 64
+    topics = [HexBytes(DECODER.topic), HexBytes(word(rng.getrandbits(160))),
+              HexBytes(word(rng.getrandbits(bits))), HexBytes(word(rng.getrandbits(8)))]
+    data = b''.join([word(rng.getrandbits(bits)), word(rng.getrandbits(64)), word(rng.getrandbits(1)),
+                     word(rng.getrandbits(160)), rng.getrandbits(256).to_bytes(32, 'big'),
+                     word(rng.getrandbits(32))])
+    return {'address': ADDRESS, 'topics': topics, 'data': Web3.toHex(data), 'logIndex': i, 'transactionIndex': 0,
+            'transactionHash': HexBytes(word(rng.getrandbits(256))),
+            'blockHash': HexBytes(word(rng.getrandbits(256))), 'blockNumber': 100 + i}
+
+
+def set_word(log, position, value):
+    """
+    Overwrite an argument word of a log, counting the argument topics first
+    """
+    topic_count = len(log['topics']) - 1
+    if position < topic_count:
+        log['topics'][position + 1] = HexBytes(value)
+        return log
+    data = bytearray(HexBytes(log['data']))
+    data[32 * (position - topic_count):32 * (position - topic_count + 1)] = value
+    log['data'] = Web3.toHex(bytes(data))
+    return log
+
+
+def outcome(decode, log):
+    try:
+        return dict(decode(log))
+    except Exception as e:
+        return type(e)
+
+
+@pytest.mark.parametrize('position,value', [(0, b'\x01' + bytes(11) + b'\x22' * 20), (2, word(256))],
+                         ids=['address', 'uint8'])
+def test_topics_with_bad_padding_are_rejected_as_web3_does(position, value):
+    log = set_word(make_log(random.Random(1), 0), position, value)
+    expected = outcome(lambda log: get_event_data(CODEC, WORD_EVENT_ABI, log), log)
+    assert isinstance(expected, type) and outcome(DECODER.decode, log) is expected
+
+
+def test_decode_many_matches_decode_and_web3():
+    rng = random.Random(1)
+    logs = [make_log(rng, i) for i in range(200)]
+    assert DECODER.columnar
+    events = DECODER.decode_many(logs)
+    for log, event in zip(logs, events):
+        assert event == DECODER.decode(log)
+        assert event == get_event_data(CODEC, WORD_EVENT_ABI, log)
+    assert any(event['args']['amount'] >= 2 ** 64 for event in events)
+    assert any(event['args']['amount'] < 2 ** 64 for event in events)
+
+
+# Argument positions and words with invalid padding for their type
+BAD_WORDS = {
+    'owner': (0, b'\x01' + bytes(11) + b'\x22' * 20),
+    'small': (2, word(256)),
+    'amount': (3, b'\x01' + bytes(31)),
+    'fee': (4, word(2 ** 64)),
+    'ok': (5, word(2)),
+    'recipient': (6, b'\xff' * 12 + b'\x22' * 20),
+    'count': (8, word(2 ** 32)),
+}
+
+
+@pytest.mark.parametrize('position,value', BAD_WORDS.values(), ids=BAD_WORDS.keys())
+def test_bad_padding_is_decoded_as_web3_does(position, value):
+    rng = random.Random(position)
+    logs = [make_log(rng, i) for i in range(40)]
+    bad = set_word(logs[20], position, value)
+    expected = outcome(lambda log: get_event_data(CODEC, WORD_EVENT_ABI, log), bad)
+    assert outcome(DECODER.decode, bad) == expected
+    if isinstance(expected, dict):
+        assert dict(DECODER.decode_many(logs)[20]) == expected
+    else:
+        # The whole batch fails, as decoding the log on its own does
+        with pytest.raises(expected):
+            DECODER.decode_many(logs)
+
+
+@pytest.mark.parametrize('data_words', [0, 5, 7])
+def test_malformed_data_lengths_are_decoded_as_web3_does(data_words):
+    rng = random.Random(data_words)
+    logs = [make_log(rng, i) for i in range(40)]
+    logs[7]['data'] = Web3.toHex((HexBytes(logs[7]['data']) + bytes(64))[:32 * data_words])
+    expected = outcome(lambda log: get_event_data(CODEC, WORD_EVENT_ABI, log), logs[7])
+    assert outcome(DECODER.decode, logs[7]) == expected
+    if isinstance(expected, dict):
+        assert dict(DECODER.decode_many(logs)[7]) == expected
+    else:
+        with pytest.raises(expected):
+            DECODER.decode_many(logs)
+
+
+def test_wrong_topic_counts_are_not_decoded():
+    rng = random.Random(3)
+    logs = [make_log(rng, i) for i in range(40)]
+    logs[5]['topics'] = logs[5]['topics'][:-1]
+    with pytest.raises(Exception):
+        get_event_data(CODEC, WORD_EVENT_ABI, logs[5])
+    with pytest.raises(Exception):
+        DECODER.decode_many(logs)
@@ -0,0 +1,95 @@
+from providers import ProviderPool
+
+HEADER_NOT_FOUND = {'code': -32000, 'message': 'header not found'}
+
+
+class FakeProvider():
+
+    def __init__(self, url, error=None):
+        self.endpoint_uri = url
+        self.error = error
+        self.calls = 0
+
+    def _response(self, request_id, method):
+        if self.error is not None:
+            return {'jsonrpc': '2.0', 'id': request_id, 'error': self.error}
+        return {'jsonrpc': '2.0', 'id': request_id, 'result': self.endpoint_uri}
+
+    def make_request(self, method, params):
+        self.calls += 1
+        return self._response(1, method)
+
+    def make_batch_request(self, requests):
+        self.calls += 1
+        return [self._response(i, method) for i, (method, _) in enumerate(requests)]
+
+
+def test_error_responses_fail_over_to_the_next_node():
+    lagging, healthy = FakeProvider('lagging', HEADER_NOT_FOUND), FakeProvider('healthy')
+    pool = ProviderPool([lagging, healthy])
+    assert pool.make_request('eth_getBlockByNumber', ['0x10', False])['result'] == 'healthy'
+    assert pool.node_stats()[0]['error_rate'] == 1.0
+    assert pool.node_stats()[1]['error_rate'] == 0.0
+
+
+def test_batch_item_errors_fail_over_to_the_next_node():
+    internal_error = {'code': -32603, 'message': 'boom'}
+    pool = ProviderPool([FakeProvider('broken', internal_error), FakeProvider('healthy')])
+    responses = pool.make_batch_request([('eth_getBlockByNumber', ['0x1', False])] * 3)
+    assert [response['result'] for response in responses] == ['healthy'] * 3
+
+
+def test_request_errors_are_returned_without_failover():
+    reverted = {'code': 3, 'message': 'execution reverted'}
+    first, second = FakeProvider('a', reverted), FakeProvider('b', reverted)
+    pool = ProviderPool([first, second])
+    assert pool.make_request('eth_call', [{}, 'latest'])['error'] == reverted
+    assert first.calls + second.calls == 1
+
+
+def test_last_error_response_is_returned_when_every_node_fails():
+    pool = ProviderPool([FakeProvider('a', HEADER_NOT_FOUND), FakeProvider('b', HEADER_NOT_FOUND)])
+    assert pool.make_request('eth_getBlockByNumber', ['0x10', False])['error'] == HEADER_NOT_FOUND
+
+
+class FilterNode(FakeProvider):
+
+    def __init__(self, url):
+        super().__init__(url)
+        self.filters = set()
+
+    def make_request(self, method, params):
+        self.calls += 1
+        if method == 'eth_newFilter':
+            self.filters.add(self.endpoint_uri + '-filter')
+            return {'jsonrpc': '2.0', 'id': 1, 'result': self.endpoint_uri + '-filter'}
+        if method in ('eth_getFilterChanges', 'eth_uninstallFilter') and params[0] not in self.filters:
+            return {'jsonrpc': '2.0', 'id': 1, 'error': {'code': -32000, 'message': 'filter not found'}}
+        if method == 'eth_uninstallFilter':
+            self.filters.discard(params[0])
+            return {'jsonrpc': '2.0', 'id': 1, 'result': True}
+        return {'jsonrpc': '2.0', 'id': 1, 'result': []}
+
+
+def test_filter_calls_are_pinned_to_the_node_that_created_the_filter():
+    first, second = FilterNode('a'), FilterNode('b')
+    pool = ProviderPool([first, second])
+    filter_id = pool.make_request('eth_newFilter', [{}])['result']
+    creator = first if filter_id == 'a-filter' else second
+    other = second if creator is first else first
+    # The other node ranks best, but polls still go to the filter's node
+    creator.calls = other.calls = 0
+    pool.stats[pool.providers.index(creator)].record('eth_getFilterChanges', 5.0)
+    for _ in range(5):
+        assert pool.make_request('eth_getFilterChanges', [filter_id])['result'] == []
+    assert creator.calls == 5 and other.calls == 0
+    assert pool.make_request('eth_uninstallFilter', [filter_id])['result'] is True
+    assert filter_id not in pool._filter_nodes
+
+
+def test_dropped_filters_are_forgotten():
+    node = FilterNode('a')
+    pool = ProviderPool([node, FilterNode('b')])
+    pool._filter_nodes['stale'] = 0
+    assert pool.make_request('eth_getFilterChanges', ['stale'])['error']['message'] == 'filter not found'
+    assert 'stale' not in pool._filter_nodes
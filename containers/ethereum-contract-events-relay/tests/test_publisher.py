@@ -0,0 +1,50 @@
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ConnectTimeoutError, EndpointConnectionError, ReadTimeoutError
+from conftest import entry
+from publisher import BatchPublisher, DeadLetterFile, PublishError, is_retryable
+
+
+def test_connection_errors_are_retryable():
+    assert is_retryable(EndpointConnectionError(endpoint_url='http://127.0.0.1:9'))
+    assert is_retryable(ConnectTimeoutError(endpoint_url='http://127.0.0.1:9'))
+    assert is_retryable(ReadTimeoutError(endpoint_url='http://127.0.0.1:9'))
+    assert is_retryable(PublishError('ThrottlingException'))
+    assert not is_retryable(PublishError('ValidationException'))
+
+
+def test_unreachable_endpoint_is_retried_before_dead_lettering(tmp_path):
+    # Nothing listens on port 9, so every put fails to connect
+    client = boto3.client('events', endpoint_url='http://127.0.0.1:9',
+                          config=Config(retries={'max_attempts': 0}, connect_timeout=1))
+    attempts = []
+
+    def put_batch(entries):
+        attempts.append(len(entries))
+        return client.put_events(Entries=entries)['Entries']
+
+    dead_letters = DeadLetterFile(str(tmp_path / 'dead_letters.jsonl'))
+    publisher = BatchPublisher(put_batch, workers=1, linger=0, max_attempts=3, base_backoff=0.01,
+                               dead_letter=dead_letters)
+    future = publisher.submit(entry(0))
+    assert isinstance(future.exception(timeout=30), EndpointConnectionError)
+    publisher.close()
+    assert len(attempts) == 3
+    stats = publisher.stats()
+    assert stats['retries'] == 2 and stats['dead_lettered'] == 1
+
+
+def test_retryable_failures_recover():
+    failures = [2]
+
+    def put_batch(entries):
+        if failures[0]:
+            failures[0] -= 1
+            raise EndpointConnectionError(endpoint_url='http://127.0.0.1:9')
+        return [{'EventId': str(i)} for i in range(len(entries))]
+
+    publisher = BatchPublisher(put_batch, workers=1, linger=0.01, max_attempts=None, base_backoff=0.01)
+    futures = [publisher.submit(entry(i)) for i in range(5)]
+    assert all('EventId' in future.result(timeout=10) for future in futures)
+    publisher.close()
+    assert publisher.stats()['dead_lettered'] == 0
@@ -0,0 +1,135 @@
+from reorg import ConfirmationBuffer
+
+
+def block_hash(block_number, branch=0):
+    return bytes([branch]) + block_number.to_bytes(31, 'big')
+
+
+class ChainNotifier():
+    """
+    A notifier serving block headers from a chain whose blocks from fork
+    onwards are on the given branch, and recording published and
+    retracted events
+    """
+
+    def __init__(self, branch=0, fork=None):
+        self.branch = branch
+        self.fork = fork
+        self.requested = []
+        self.published = []
+        self.retracted = []
+
+    def block_hash(self, block_number):
+        if self.fork is None or block_number < self.fork:
+            return block_hash(block_number)
+        return block_hash(block_number, self.branch)
+
+    def get_block_headers(self, block_numbers):
+        self.requested.append(list(block_numbers))
+        return [{'number': block_number, 'hash': self.block_hash(block_number),
+                 'parentHash': self.block_hash(block_number - 1)} for block_number in block_numbers]
+
+    def publish_event(self, event):
+        self.published.append(event)
+
+    def retract_event(self, event):
+        self.retracted.append(event)
+
+
+def event(block_number, log_index=0, branch=0):
+    return {'blockNumber': block_number, 'blockHash': block_hash(block_number, branch), 'logIndex': log_index}
+
+
+def follow(buffer, from_block, to_block):
+    for head in range(from_block, to_block + 1):
+        assert buffer.update_canonical(head) is None
+        buffer.release(head)
+
+
+def test_events_are_released_once_confirmed():
+    notifier = ChainNotifier()
+    buffer = ConfirmationBuffer(notifier, confirmations=2)
+    follow(buffer, 5, 5)
+    buffer.add(event(5))
+    buffer.add(event(5))
+    follow(buffer, 6, 6)
+    assert notifier.published == []
+    follow(buffer, 7, 7)
+    assert notifier.published == [event(5)]
+    assert not buffer.pending
+    # Events below the confirmed block are released as they arrive
+    buffer.add(event(4, 1))
+    assert notifier.published == [event(5), event(4, 1)]
+
+
+def test_forks_are_found_by_walking_parent_hashes():
+    notifier = ChainNotifier()
+    buffer = ConfirmationBuffer(notifier, confirmations=3)
+    follow(buffer, 5, 7)
+    buffer.add(event(5))
+    buffer.add(event(6))
+    # Blocks 6 and 7 are replaced, and only the new head is fetched at first
+    notifier.branch, notifier.fork = 1, 6
+    notifier.requested = []
+    assert buffer.update_canonical(8) == 6
+    assert notifier.requested == [[8], [7], [6]]
+    assert buffer.block_hashes[6] == block_hash(6, 1) and buffer.block_hashes[5] == block_hash(5)
+    assert buffer.reorg_count == 1
+    buffer.release(8)
+    assert notifier.published == [event(5)]
+    assert notifier.retracted == []
+    assert not buffer.pending
+
+
+def test_orphaned_events_are_retracted_with_fast_retract():
+    notifier = ChainNotifier()
+    buffer = ConfirmationBuffer(notifier, confirmations=3, fast_retract=True)
+    follow(buffer, 5, 7)
+    buffer.add(event(7))
+    assert notifier.published == [event(7)]
+    notifier.branch, notifier.fork = 1, 7
+    assert buffer.update_canonical(8) == 7
+    buffer.release(8)
+    assert notifier.retracted == [event(7)]
+    # The event re-queried from the new block is published in its place
+    buffer.add(event(7, branch=1))
+    assert notifier.published == [event(7), event(7, branch=1)]
+
+
+def test_removed_events_are_dropped_or_retracted():
+    notifier = ChainNotifier()
+    buffer = ConfirmationBuffer(notifier, confirmations=3)
+    follow(buffer, 5, 5)
+    buffer.add(event(5))
+    buffer.add(event(5), removed=True)
+    assert not buffer.pending and notifier.retracted == []
+    buffer = ConfirmationBuffer(notifier, confirmations=3, fast_retract=True)
+    buffer.add(event(5))
+    buffer.add(event(5), removed=True)
+    assert notifier.retracted == [event(5)]
+
+
+def test_head_going_backwards_requeries_the_dropped_blocks():
+    notifier = ChainNotifier()
+    buffer = ConfirmationBuffer(notifier, confirmations=3)
+    follow(buffer, 5, 8)
+    buffer.add(event(8))
+    # The node fell back to a shorter chain that does not have blocks 7 and 8
+    assert buffer.update_canonical(6) == 7
+    assert list(buffer.block_hashes) == [5, 6]
+    buffer.release(6)
+    assert notifier.published == [] and len(buffer.pending) == 1
+
+
+def test_ring_is_trimmed_and_older_blocks_are_assumed_canonical():
+    notifier = ChainNotifier()
+    buffer = ConfirmationBuffer(notifier, confirmations=2, ring_size=4)
+    follow(buffer, 1, 10)
+    assert list(buffer.block_hashes) == [7, 8, 9, 10]
+    # A jump past the ring only fetches the blocks it can remember
+    notifier.requested = []
+    follow(buffer, 20, 20)
+    assert notifier.requested == [[17, 18, 19, 20]]
+    assert list(buffer.block_hashes) == [17, 18, 19, 20]
+    buffer.add(event(3, branch=1))
+    assert notifier.published == [event(3, branch=1)]
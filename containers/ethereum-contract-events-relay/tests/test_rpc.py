@@ -0,0 +1,73 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from rpc import BatchingHTTPProvider
+from sessions import create_session, session_stats
+
+
+class SlowLogsNode(BaseHTTPRequestHandler):
+    """A JSON-RPC node answering eth_getLogs slowly and anything else at once"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        requests = request if isinstance(request, list) else [request]
+        if any(item['method'] == 'eth_getLogs' for item in requests):
+            time.sleep(1)
+        responses = [{'jsonrpc': '2.0', 'id': item['id'], 'result': '0x1'} for item in requests]
+        body = json.dumps(responses if isinstance(request, list) else responses[0]).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def node_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowLogsNode)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_address[1])
+    server.shutdown()
+
+
+def test_slow_request_does_not_hold_up_others(node_url):
+    session = create_session(pool_size=4)
+    provider = BatchingHTTPProvider(node_url, session=session, max_in_flight=4)
+    logs = threading.Thread(target=provider.make_request, args=('eth_getLogs', [{}]))
+    logs.start()
+    time.sleep(0.1)
+    started = time.monotonic()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(provider.make_request('eth_blockNumber', [])))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.monotonic() - started < 0.5
+    assert [result['result'] for result in results] == ['0x1'] * 3
+    logs.join()
+    assert list(session_stats(session).values())[0]['connections_opened'] > 1
+
+
+def test_requests_beyond_max_in_flight_are_batched(node_url):
+    provider = BatchingHTTPProvider(node_url, session=create_session(pool_size=1), max_in_flight=1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(provider.make_request('eth_getLogs', [{}])))
+               for _ in range(5)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # The first request goes alone and the other four share the next batch
+    assert time.monotonic() - started < 2.8
+    assert len(results) == 5
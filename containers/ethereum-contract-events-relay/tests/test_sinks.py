@@ -0,0 +1,146 @@
+import functools
+import json
+import boto3
+import pytest
+from botocore.stub import Stubber
+try:
+    from moto import mock_aws
+except ImportError:
+    # moto < 5 mocks each service separately
+    from moto import mock_events, mock_kinesis, mock_sqs
+    mock_aws = None
+import conftest
+from publisher import BatchPublisher, DeadLetterFile, FanOutPublisher, PublishError
+from sinks import EventBridgeSink, FileSink, KinesisSink, SQSSink, create_sink, envelope
+
+entry = functools.partial(conftest.entry, partition_key=True)
+
+
+@pytest.fixture
+def aws():
+    mocks = [mock_aws()] if mock_aws is not None else [mock_events(), mock_kinesis(), mock_sqs()]
+    for mock in mocks:
+        mock.start()
+    yield
+    for mock in mocks:
+        mock.stop()
+
+
+def test_envelope():
+    assert json.loads(envelope(entry(1))) == {'source': 'ethereum',
+                                              'detail-type': 'Ethereum contract event notifications',
+                                              'detail': {'n': '1'}}
+
+
+def test_eventbridge_sink(aws):
+    sink = create_sink('eventbridge://bus')
+    assert isinstance(sink, EventBridgeSink)
+    assert boto3.client('events').describe_event_bus(Name='bus')['Name'] == 'bus'
+    results = sink.put_batch([entry(i) for i in range(3)])
+    assert len(results) == 3 and all('EventId' in result for result in results)
+
+
+def test_kinesis_sink(aws):
+    client = boto3.client('kinesis')
+    client.create_stream(StreamName='stream', ShardCount=1)
+    sink = create_sink('kinesis://stream')
+    assert isinstance(sink, KinesisSink)
+    results = sink.put_batch([entry(i) for i in range(3)])
+    assert len(results) == 3 and all('SequenceNumber' in result for result in results)
+    shard_id = client.list_shards(StreamName='stream')['Shards'][0]['ShardId']
+    iterator = client.get_shard_iterator(StreamName='stream', ShardId=shard_id,
+                                         ShardIteratorType='TRIM_HORIZON')['ShardIterator']
+    records = client.get_records(ShardIterator=iterator)['Records']
+    assert [json.loads(record['Data'])['detail'] for record in records] == [{'n': str(i)} for i in range(3)]
+    assert [record['PartitionKey'] for record in records] == [entry(i)['PartitionKey'] for i in range(3)]
+
+
+def test_kinesis_partial_failures(aws):
+    boto3.client('kinesis').create_stream(StreamName='stream', ShardCount=1)
+    sink = KinesisSink('stream')
+    with Stubber(sink.client) as stubber:
+        stubber.add_response('put_records', {'FailedRecordCount': 1, 'Records': [
+            {'SequenceNumber': '1', 'ShardId': 'shardId-000000000000'},
+            {'ErrorCode': 'ProvisionedThroughputExceededException', 'ErrorMessage': 'Rate exceeded'}]})
+        results = sink.put_batch([entry(0), entry(1)])
+    assert 'ErrorCode' not in results[0]
+    assert results[1]['ErrorCode'] == 'ProvisionedThroughputExceededException'
+
+
+def test_sqs_sink(aws):
+    client = boto3.client('sqs')
+    queue_url = client.create_queue(QueueName='queue')['QueueUrl']
+    sink = create_sink('sqs://queue')
+    assert isinstance(sink, SQSSink) and not sink.fifo
+    results = sink.put_batch([entry(i) for i in range(3)])
+    assert all('MessageId' in result for result in results)
+    messages = client.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10)['Messages']
+    assert sorted(json.loads(message['Body'])['detail']['n'] for message in messages) == ['0', '1', '2']
+
+
+def test_sqs_fifo_sink(aws):
+    client = boto3.client('sqs')
+    queue_url = client.create_queue(QueueName='queue.fifo', Attributes={'FifoQueue': 'true'})['QueueUrl']
+    sink = SQSSink('queue.fifo')
+    assert sink.fifo
+    results = sink.put_batch([entry(i) for i in range(3)])
+    assert all('MessageId' in result for result in results)
+    messages = client.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10,
+                                      AttributeNames=['MessageGroupId'])['Messages']
+    assert {message['Attributes']['MessageGroupId'] for message in messages} <= {entry(i)['PartitionKey']
+                                                                                 for i in range(3)}
+
+
+def test_sqs_partial_failures(aws):
+    boto3.client('sqs').create_queue(QueueName='queue')
+    sink = SQSSink('queue')
+    with Stubber(sink.client) as stubber:
+        stubber.add_response('send_message_batch', {
+            'Successful': [{'Id': '0', 'MessageId': 'm0', 'MD5OfMessageBody': 'x'},
+                           {'Id': '2', 'MessageId': 'm2', 'MD5OfMessageBody': 'x'}],
+            'Failed': [{'Id': '1', 'SenderFault': False, 'Code': 'InternalError', 'Message': 'try again'}]})
+        results = sink.put_batch([entry(i) for i in range(3)])
+    assert results == [{'MessageId': 'm0'},
+                       {'ErrorCode': 'InternalError', 'ErrorMessage': 'try again'},
+                       {'MessageId': 'm2'}]
+
+
+def test_file_sink(tmp_path):
+    path = str(tmp_path / 'events.jsonl')
+    sink = create_sink('file://' + path)
+    assert isinstance(sink, FileSink)
+    assert sink.put_batch([entry(i) for i in range(3)]) == [{}, {}, {}]
+    sink.close()
+    with open(path) as f:
+        assert [json.loads(line)['detail'] for line in f] == [{'n': str(i)} for i in range(3)]
+
+
+def test_unknown_sink():
+    with pytest.raises(ValueError):
+        create_sink('kafka://topic')
+
+
+def test_fan_out_dead_letters_per_sink(aws, tmp_path):
+    boto3.client('kinesis').create_stream(StreamName='stream', ShardCount=1)
+    sinks = [create_sink('eventbridge://bus'), create_sink('kinesis://stream')]
+    dead_letters = DeadLetterFile(str(tmp_path / 'dead_letters.jsonl'))
+    publishers = {sink.name: BatchPublisher(sink.put_batch, workers=1, linger=0.01, max_entries=sink.max_entries,
+                                            size=sink.size, dead_letter=functools.partial(dead_letters,
+                                                                                         sink=sink.name))
+                  for sink in sinks}
+    fan_out = FanOutPublisher(publishers)
+    assert len(fan_out.submit(entry(0)).result(timeout=10)) == 2
+
+    # Kinesis rejects the next entry, which is dead-lettered for Kinesis alone
+    with Stubber(sinks[1].client) as stubber:
+        stubber.add_response('put_records', {'FailedRecordCount': 1, 'Records': [
+            {'ErrorCode': 'ValidationException', 'ErrorMessage': 'invalid'}]})
+        assert isinstance(fan_out.submit(entry(1)).exception(timeout=10), PublishError)
+    with open(dead_letters.path) as f:
+        [line] = [json.loads(line) for line in f]
+    assert line['sink'] == 'kinesis://stream'
+    redriven = []
+    assert dead_letters.redrive(lambda entry, sink: redriven.append(sink) or fan_out.submit(entry, sink)) == (1, 0)
+    assert redriven == ['kinesis://stream']
+    assert fan_out.stats()['eventbridge://bus']['entries_put'] == 2
+    fan_out.close()
@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+from botocore.exceptions import EndpointConnectionError
+from conftest import entry
+import spool as spool_module
+from publisher import BatchPublisher
+from spool import HEADER, Spool
+
+
+def read_all(spool):
+    records = []
+    while True:
+        batch = spool.read(timeout=0.05)
+        if not batch:
+            return records
+        records.extend(batch)
+
+
+def test_entries_are_read_in_order_across_segments(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=1024, fsync='never')
+    for i in range(200):
+        spool.append(entry(i))
+    records = read_all(spool)
+    assert [record['Detail'] for _, record in records] == [entry(i)['Detail'] for i in range(200)]
+    assert spool.stats()['segments'] > 1
+    spool.close()
+
+
+def test_entries_appended_while_reading_are_not_skipped(tmp_path, monkeypatch):
+    spool = Spool(str(tmp_path), segment_bytes=150, fsync='never')
+    spool.append(entry(0))
+    scan = spool_module._scan
+
+    def scan_then_append(*args, **kwargs):
+        # The writer fills and closes the segment while it is being read
+        result = scan(*args, **kwargs)
+        monkeypatch.setattr(spool_module, '_scan', scan)
+        spool.append(entry(1))
+        return result
+
+    monkeypatch.setattr(spool_module, '_scan', scan_then_append)
+    records = read_all(spool)
+    assert [record['Detail'] for _, record in records] == [entry(0)['Detail'], entry(1)['Detail']]
+    spool.close()
+
+
+def test_acknowledged_segments_are_deleted(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=1024, fsync='never')
+    for i in range(200):
+        spool.append(entry(i))
+    for segment_id, _ in read_all(spool):
+        spool.ack(segment_id)
+    assert spool.wait_drained(1)
+    assert spool.stats() == {'segments': 1, 'unacknowledged': 0}
+    spool.close()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_clean_restart_replays_nothing_acknowledged(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append(entry(0))
+    for segment_id, _ in read_all(spool):
+        spool.ack(segment_id)
+    spool.close()
+    spool = Spool(str(tmp_path))
+    assert spool.stats()['unacknowledged'] == 0
+    assert read_all(spool) == []
+    spool.close()
+
+
+def test_unacknowledged_entries_are_replayed_and_torn_records_truncated(tmp_path):
+    spool = Spool(str(tmp_path), fsync='always')
+    for i in range(3):
+        spool.append(entry(i))
+    records = read_all(spool)
+    spool.ack(records[0][0])
+    spool.close()
+    segment = os.path.join(str(tmp_path), sorted(os.listdir(str(tmp_path)))[-1])
+    with open(segment, 'ab') as f:
+        f.write(HEADER.pack(100, 0) + b'torn')
+    spool = Spool(str(tmp_path))
+    assert spool.stats()['unacknowledged'] == 3
+    assert [record['Detail'] for _, record in read_all(spool)] == [entry(i)['Detail'] for i in range(3)]
+    spool.close()
+
+
+def test_backlog_is_held_while_the_endpoint_is_unreachable(tmp_path):
+    reachable = threading.Event()
+    published = []
+
+    def put_batch(entries):
+        if not reachable.is_set():
+            raise EndpointConnectionError(endpoint_url='http://127.0.0.1:9')
+        published.extend(entries)
+        return [{'EventId': str(i)} for i in range(len(entries))]
+
+    spool = Spool(str(tmp_path), segment_bytes=1024, fsync='never')
+    publisher = BatchPublisher(put_batch, workers=2, max_queued=20, linger=0.01, max_attempts=None,
+                               base_backoff=0.01, max_backoff=0.05)
+
+    def drain():
+        # As the notifier drains its spool
+        while True:
+            records = spool.read()
+            if not records:
+                return
+            for segment_id, record in records:
+                publisher.submit(record).add_done_callback(lambda _, segment_id=segment_id: spool.ack(segment_id))
+
+    drainer = threading.Thread(target=drain, daemon=True)
+    drainer.start()
+    for i in range(200):
+        spool.append(entry(i))
+    time.sleep(0.5)
+    assert spool.stats()['unacknowledged'] == 200
+    assert publisher.stats()['dead_lettered'] == 0
+    reachable.set()
+    assert spool.wait_drained(10)
+    assert len({record['Detail'] for record in published}) == 200
+    spool.close()
+    drainer.join()
+    publisher.close()
+    assert publisher.stats()['dead_lettered'] == 0
+
+
+def test_entries_are_synced_when_the_spool_goes_idle(tmp_path, monkeypatch):
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(spool_module.os, 'fsync', lambda fd: synced.append(time.monotonic()) or fsync(fd))
+    spool = Spool(str(tmp_path), fsync='interval', fsync_interval=0.1)
+    spool.append(entry(0))
+    spool.append(entry(1))
+    appended = time.monotonic()
+    # Neither append was an interval after the last sync
+    assert synced == []
+    time.sleep(0.3)
+    assert len(synced) == 1 and synced[0] - appended < 0.2
+    spool.close()
+    assert len(synced) == 2
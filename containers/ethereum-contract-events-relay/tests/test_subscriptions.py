@@ -0,0 +1,156 @@
+import asyncio
+import json
+import threading
+import types
+import websockets
+from subscriptions import LogSubscriber, format_log
+
+
+class HeadNotifier():
+    """A notifier recording which thread confirms new heads"""
+
+    def __init__(self):
+        self.last_block = 0
+        self.confirmation_buffer = object()
+        self.confirmed = []
+
+    def confirm_blocks(self, head):
+        self.confirmed.append((head, threading.current_thread()))
+
+    async def offload(self, func, *args, timeout=True):
+        return await asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+
+def test_new_heads_are_confirmed_off_the_event_loop():
+    notifier = HeadNotifier()
+    subscriber = LogSubscriber(notifier, 'ws://unused')
+    message = {'method': 'eth_subscription', 'params': {'result': {'number': '0x10'}}}
+    asyncio.get_event_loop().run_until_complete(subscriber.handle_message(message))
+    assert notifier.last_block == 16
+    [(head, thread)] = notifier.confirmed
+    assert head == 16 and thread is not threading.main_thread()
+
+
+ADDRESS = '0x' + '11' * 20
+TOPIC = '0x' + 'ab' * 32
+
+
+def raw_log(block_number, log_index=0):
+    return {'address': ADDRESS, 'topics': [TOPIC], 'data': '0x',
+            'blockNumber': hex(block_number), 'blockHash': '0x' + '%064x' % block_number,
+            'transactionHash': '0x' + '%064x' % (block_number * 1000 + log_index),
+            'transactionIndex': '0x0', 'logIndex': hex(log_index)}
+
+
+class GapNotifier():
+    """A notifier recording dispatched logs and gap-fill queries"""
+
+    def __init__(self):
+        self.log_queries = [{'address': [ADDRESS], 'topics': [[TOPIC]]}]
+        self.last_block = 4
+        self.detected_upgrades = []
+        self.pending_upgrades = []
+        self.confirmation_buffer = None
+        self.w3 = types.SimpleNamespace(eth=types.SimpleNamespace(blockNumber=4))
+        self.dispatched = []
+        self.fetched = []
+        self.completed = []
+
+    async def offload(self, func, *args, timeout=True):
+        return await asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+    def fetch_logs(self, from_block, to_block):
+        self.fetched.append((from_block, to_block))
+        # Block 5 was already pushed before the disconnect, block 7 was missed
+        return [format_log(raw_log(5)), format_log(raw_log(7))]
+
+    def dispatch_log(self, log):
+        self.dispatched.append(log['blockNumber'])
+
+    def dispatch_logs(self, logs):
+        for log in logs:
+            self.dispatch_log(log)
+
+    def complete_block_range(self, to_block):
+        self.last_block = to_block
+        self.completed.append(to_block)
+
+    def collect_published(self):
+        pass
+
+
+def test_subscribe_reconnect_and_fill_gap():
+    notifier = GapNotifier()
+    connections = []
+
+    async def node(websocket, path=None):
+        """A stand-in node that drops the first connection after one log"""
+        subscriptions = []
+        for i in range(len(notifier.log_queries) + 1):
+            request = json.loads(await websocket.recv())
+            subscriptions.append(request['params'])
+            await websocket.send(json.dumps({'jsonrpc': '2.0', 'id': request['id'], 'result': '0x%x' % i}))
+        connections.append(subscriptions)
+        if len(connections) == 1:
+            await websocket.send(notification('0x0', raw_log(5)))
+            await asyncio.sleep(0.1)
+            notifier.w3.eth.blockNumber = 8
+            return
+        await asyncio.sleep(0.1)
+        await websocket.send(notification('0x0', raw_log(9)))
+        await asyncio.wait_for(websocket.wait_closed(), timeout=10)
+
+    def notification(subscription, result):
+        return json.dumps({'jsonrpc': '2.0', 'method': 'eth_subscription',
+                           'params': {'subscription': subscription, 'result': result}})
+
+    async def run():
+        server = await websockets.serve(node, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        subscriber = LogSubscriber(notifier, 'ws://127.0.0.1:{}'.format(port), reconnect_delay=0.01)
+        task = asyncio.ensure_future(subscriber.subscribe())
+        for _ in range(500):
+            if len(notifier.dispatched) >= 3 or task.done():
+                break
+            await asyncio.sleep(0.01)
+        # Close the client before waiting for the server's handlers to end
+        task.cancel()
+        try:
+            await asyncio.wait_for(task, timeout=5)
+        except asyncio.CancelledError:
+            pass
+        server.close()
+        await asyncio.wait_for(server.wait_closed(), timeout=5)
+
+    asyncio.get_event_loop().run_until_complete(run())
+    assert len(connections) == 2
+    for subscriptions in connections:
+        assert subscriptions == [['logs', notifier.log_queries[0]], ['newHeads']]
+    assert notifier.fetched == [(5, 8)]
+    assert notifier.completed == [8]
+    assert notifier.dispatched == [5, 7, 9]
+    assert notifier.last_block == 9
+
+
+class LongGapNotifier(GapNotifier):
+    """A notifier whose node rejects log queries over more than 100 blocks"""
+
+    def fetch_logs(self, from_block, to_block):
+        self.fetched.append((from_block, to_block))
+        if to_block - from_block >= 100:
+            raise ValueError({'code': -32005, 'message': 'query returned more than 10000 results'})
+        return [format_log(raw_log(block)) for block in range(from_block, to_block + 1) if block % 1000 == 0]
+
+
+def test_long_gaps_are_filled_in_windows():
+    notifier = LongGapNotifier()
+    notifier.w3.eth.blockNumber = 5000
+    subscriber = LogSubscriber(notifier, 'ws://unused')
+    subscriber.fill_gap()
+    assert notifier.dispatched == [1000, 2000, 3000, 4000, 5000]
+    # The first window was rejected, then the gap filled in windows the
+    # node accepts
+    from_block, to_block = notifier.fetched[0]
+    assert from_block == 5 and to_block - from_block >= 100
+    assert len(notifier.completed) > 1 and notifier.completed[-1] == 5000
+    assert notifier.last_block == 5000
@@ -1,3 +1,5 @@
+import json
+
 from aws_cdk import (
         core,
         aws_ec2 as ec2,
@@ -7,20 +9,53 @@ from aws_cdk import (
         aws_events as events,
         aws_events_targets as events_targets,
         aws_iam as iam,
+        aws_dynamodb as dynamodb,
 )
 
+# Fargate task sizes as (largest contract group, cpu units, memory MiB). A
+# group's decoders, buffered events and publish queue grow with its contracts.
+TASK_SIZES = [
+    (1, 256, 512),
+    (10, 512, 1024),
+    (50, 1024, 2048),
+    (None, 2048, 4096),
+]
+
+
+def task_size(contracts):
+    """The Fargate cpu units and memory for a task monitoring a group of
+    contracts
+
+    Parameters
+    ----------
+    contracts : int
+        The number of contracts in the group
+
+    Returns
+    -------
+    tuple
+        The cpu units and memory limit in MiB
+    """
+    for max_contracts, cpu, memory_limit_mib in TASK_SIZES:
+        if max_contracts is None or contracts <= max_contracts:
+            return cpu, memory_limit_mib
+
 class EthereumContractEventsStack(core.Stack):
     """
     A class used to represent and initialise the AWS Cloudformation stack using CDK
     """
     
-    def __init__(self, scope: core.Construct, id: str, node_url: str, contract_addresses: dict, **kwargs) -> None:
+    def __init__(self, scope: core.Construct, id: str, node_url: str, contract_addresses: dict,
+                 contracts_per_task: int = 1, task_cpu: int = None, task_memory_mib: int = None,
+                 **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
         vpc = self._create_vpc()
         ecs_cluster = self._create_ecs_cluster(vpc)
         event_bus = self._create_event_bus(name='ethereum_contract_events')
-        ecs_services = self._create_services(ecs_cluster, node_url, contract_addresses)
-        self._create_permissions(ecs_services, event_bus)
+        checkpoint_table = self._create_checkpoint_table()
+        ecs_services = self._create_services(ecs_cluster, node_url, contract_addresses, contracts_per_task,
+                                             checkpoint_table, task_cpu, task_memory_mib)
+        self._create_permissions(ecs_services, event_bus, checkpoint_table)
 
 
     def _create_vpc(self):
@@ -42,18 +77,33 @@ class EthereumContractEventsStack(core.Stack):
         vpc = ec2.Vpc(self, 'FargateFlaskVPC', cidr='10.0.0.0/16')
         return vpc
 
-    def _create_services(self, cluster, node_url, contract_addresses):
+    def _create_services(self, cluster, node_url, contract_addresses, contracts_per_task=1, checkpoint_table=None,
+                         task_cpu=None, task_memory_mib=None):
         """Creates a serverless Fargate service for ECS from a local dockerfile
-        for each ethereum contract address
+        for each group of ethereum contract addresses. Each service task
+        monitors up to contracts_per_task contracts from a single process,
+        and is sized for the number of contracts in its group unless the
+        task size is given.
 
         Parameters
         ----------
         ecs_cluster : aws-cdk.aws_ecs.Cluster
             The ECS cluster to run the service
-        node_url : string
-            The URL of an ethereum node
+        node_url : string or list<string>
+            The URL of an ethereum node, or the URLs of several nodes to
+            route requests between
         contract_addresses : dict
             A dictionary of contract names to contract addresses
+        contracts_per_task : int, optional
+            The maximum number of contracts packed into each service task
+            (default is 1)
+        checkpoint_table : aws-cdk.aws_dynamodb.Table, optional
+            The table the services checkpoint published blocks to
+        task_cpu : int, optional
+            The cpu units of every task, overriding the size for its group
+        task_memory_mib : int, optional
+            The memory limit of every task in MiB, overriding the size for
+            its group
     
         Returns
         -------
@@ -61,18 +111,28 @@ class EthereumContractEventsStack(core.Stack):
             A list of serverless fargate services
         """
         services = []
-        for contract_name, contract_address in contract_addresses.items():
+        contract_items = list(contract_addresses.items())
+        contract_groups = [contract_items[i:i + contracts_per_task]
+                           for i in range(0, len(contract_items), contracts_per_task)]
+        for group_index, contract_group in enumerate(contract_groups):
+            # Single contract services keep their contract-named construct ids
+            if len(contract_group) == 1:
+                contract_name = contract_group[0][0]
+            else:
+                contract_name = "ContractGroup{}".format(group_index)
+            cpu, memory_limit_mib = task_size(len(contract_group))
             fargate_task_definition = ecs.FargateTaskDefinition(
                 self,
                 "{}TaskDefinition".format(contract_name),
-                memory_limit_mib=512,
-                cpu=256
+                memory_limit_mib=task_memory_mib or memory_limit_mib,
+                cpu=task_cpu or cpu
             )
             container = fargate_task_definition.add_container("{}Container".format(contract_name),
             image=ecs.ContainerImage.from_asset('containers/ethereum-contract-events-relay'),
             environment={# clear text, not for sensitive data
-                "NODE_URL": node_url,
-                "CONTRACT_ADDRESS": contract_address
+                "NODE_URLS": json.dumps(node_url if isinstance(node_url, list) else [node_url]),
+                "CONTRACT_ADDRESSES": json.dumps([address for _, address in contract_group]),
+                "CHECKPOINT_STORE": "dynamodb://{}".format(checkpoint_table.table_name) if checkpoint_table else "none"
                 },
             logging=ecs.AwsLogDriver(stream_prefix="{}EthereumContractEvents".format(contract_name), mode=ecs.AwsLogDriverMode.NON_BLOCKING)
             )
@@ -130,9 +190,26 @@ class EthereumContractEventsStack(core.Stack):
         return event_bus
 
 
-    def _create_permissions(self, ecs_services, event_bus):
+    def _create_checkpoint_table(self):
+        """Creates a DynamoDB table for the last published block and log
+        index of each contract, so services resume without gaps after a
+        restart
+
+        Returns
+        -------
+        aws-cdk.aws_dynamodb.Table
+            A DynamoDB table keyed by contract address
+        """
+        table = dynamodb.Table(self, "CheckpointTable",
+                               partition_key=dynamodb.Attribute(name="contract_address",
+                                                                type=dynamodb.AttributeType.STRING),
+                               billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST)
+        return table
+
+    def _create_permissions(self, ecs_services, event_bus, checkpoint_table=None):
         """Enables the fargate service to carry out all actions on 
-        the dedicated eventbridge event bus
+        the dedicated eventbridge event bus, and to read and write its
+        checkpoints
 
         Parameters
         ----------
@@ -140,6 +217,8 @@ class EthereumContractEventsStack(core.Stack):
             A list of serverless fargate services
         event_bus: aws-cdk.aws_events.EventBus
             An AWS EventBriddge event bus
+        checkpoint_table: aws-cdk.aws_dynamodb.Table, optional
+            The checkpoint table
     
         Returns
         -------
@@ -148,4 +227,6 @@ class EthereumContractEventsStack(core.Stack):
             ecs_service.task_definition.add_to_task_role_policy(
                 iam.PolicyStatement(actions=["events:*"],
                 resources=[event_bus.event_bus_arn]))
+            if checkpoint_table is not None:
+                checkpoint_table.grant_read_write_data(ecs_service.task_definition.task_role)
     